@@ -0,0 +1,315 @@
+# weather/alert_rules.py
+import logging
+import operator
+import string
+import threading
+import time
+from itertools import compress
+
+from django.conf import settings
+
+from .models import AlertRule
+
+logger = logging.getLogger(__name__)
+
+# Luật mặc định, tương đương các ngưỡng cố định trước đây. Có thể ghi đè bằng settings.WEATHER_ALERT_RULES
+# hoặc bảng AlertRule (cùng name; country_code để đặt ngưỡng riêng cho từng vùng).
+DEFAULT_ALERT_RULES = [
+    {
+        'name': 'storm',
+        'alert_type': 'storm',
+        'match': 'any',
+        'conditions': [['wind_speed', 'gt', 20], ['condition', 'contains', 'storm'], ['condition', 'contains', 'thunderstorm']],
+        'severity': 'medium',
+        'escalations': [['wind_speed', 'gt', 25, 'high']],
+        'message': "Storm warning in {location}: High winds ({wind_speed} m/s) or stormy conditions detected.",
+        'recommendation': 'Stay indoors, secure outdoor objects.',
+    },
+    {
+        'name': 'extreme_heat',
+        'alert_type': 'extreme_temperature',
+        'conditions': [['temperature', 'gt', 40]],
+        'severity': 'high',
+        'message': "Extreme heat warning in {location}: Temperature reached {temperature}°C.",
+        'recommendation': 'Stay hydrated, avoid outdoor activities.',
+    },
+    {
+        'name': 'extreme_cold',
+        'alert_type': 'extreme_temperature',
+        'conditions': [['temperature', 'lt', -10]],
+        'severity': 'high',
+        'message': "Extreme cold warning in {location}: Temperature dropped to {temperature}°C.",
+        'recommendation': 'Dress warmly, limit outdoor exposure.',
+    },
+    {
+        'name': 'fog',
+        'alert_type': 'fog',
+        'match': 'all',
+        'conditions': [['condition', 'contains', 'fog'], ['humidity', 'gt', 90]],
+        'severity': 'medium',
+        'message': "Dense fog warning in {location}: Low visibility due to high humidity ({humidity}%).",
+        'recommendation': 'Drive slowly, use fog lights.',
+    },
+    {
+        'name': 'flood',
+        'alert_type': 'flood',
+        'conditions': [['max_rain_probability', 'gt', 80]],
+        'severity': 'high',
+        'message': "Flood risk in {location}: High rain probability ({max_rain_probability}%) expected.",
+        'recommendation': 'Avoid low-lying areas, prepare emergency supplies.',
+    },
+    {
+        # Chỉ áp dụng khi không có luật nào khác khớp
+        'name': 'good_weather',
+        'alert_type': 'good_weather',
+        'fallback': True,
+        'severity': 'low',
+        'message': "Great weather in {location}: Temperature at {temperature}°C, {condition}.",
+        'recommendation': 'Perfect day for outdoor activities!',
+    },
+]
+
+METRICS = ['temperature', 'wind_speed', 'humidity', 'condition', 'max_rain_probability']
+
+OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'eq': operator.eq,
+    'contains': operator.contains,
+}
+
+# Dòng mẫu để kiểm tra luật (điều kiện, mức độ nâng, placeholder của message) trước khi dùng
+SAMPLE_ROW = {
+    'temperature': 30.0, 'wind_speed': 5.0, 'humidity': 70.0, 'condition': 'clear sky', 'max_rain_probability': 50.0,
+}
+
+RELOAD_INTERVAL = 60  # Giây; các worker khác thấy thay đổi trong AlertRule sau tối đa chừng này
+
+
+def alert_inputs(current_weather_data, forecast_data=None):
+    """Một dòng đầu vào cho bộ luật từ dữ liệu thời tiết hiện tại + dự báo.
+
+    Chỉ số không có trong dữ liệu là None (không phải 0): luật dùng chỉ số đó bị bỏ qua.
+    """
+    max_rain_probability = None
+    rain = [item['rain_probability'] for item in forecast_data or [] if item.get('rain_probability') is not None]
+    if rain:
+        # Làm tròn để dữ liệu từ API (float) và từ DB (Decimal) cho cùng nội dung cảnh báo
+        max_rain_probability = round(float(max(rain)), 2)
+    condition = current_weather_data.get('weather_condition')
+    return {
+        'temperature': current_weather_data.get('temperature'),
+        'wind_speed': current_weather_data.get('wind_speed'),
+        'humidity': current_weather_data.get('humidity'),
+        'condition': condition.lower() if condition is not None else None,
+        'max_rain_probability': max_rain_probability,
+    }
+
+
+def to_columns(rows):
+    return {metric: [row[metric] for row in rows] for metric in METRICS}
+
+
+def _compile_condition(condition):
+    if len(condition) < 3:
+        raise ValueError(f"Alert condition needs [metric, operator, threshold]: {condition}")
+    metric, op, threshold = condition[:3]
+    if metric not in METRICS:
+        raise ValueError(f"Unknown alert metric: {metric}")
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown alert operator: {op}")
+    # condition là chuỗi, các chỉ số khác là số: so sánh khác kiểu sẽ lỗi lúc đánh giá
+    expected = str if metric == 'condition' else (int, float)
+    if not isinstance(threshold, expected) or isinstance(threshold, bool):
+        raise ValueError(f"Invalid threshold for {metric}: {threshold!r}")
+    if op == 'contains' and metric != 'condition':
+        raise ValueError(f"Operator 'contains' only applies to condition, not {metric}")
+    func = OPERATORS[op]
+
+    def evaluate(columns):
+        return [value is not None and func(value, threshold) for value in columns[metric]]
+    return evaluate
+
+
+def _rule_metrics(rule):
+    # Mọi chỉ số luật cần: trong điều kiện, mức độ nâng và placeholder của message
+    metrics = {condition[0] for condition in rule.get('conditions', []) + rule.get('escalations', [])}
+    metrics.update(field for _, field, _, _ in string.Formatter().parse(rule['message']) if field in METRICS)
+    return sorted(metrics)
+
+
+class CompiledRule:
+    def __init__(self, rule):
+        self.name = rule['name']
+        self.alert_type = rule['alert_type']
+        self.fallback = rule.get('fallback', False)
+        self.severity = rule.get('severity') or 'low'
+        self.message = rule['message']
+        self.recommendation = rule.get('recommendation') or ''
+        self.combine = all if rule.get('match', 'any') == 'all' else any
+        self.conditions = [_compile_condition(condition) for condition in rule.get('conditions', [])]
+        self.metrics = _rule_metrics(rule)
+        # Mức độ nâng lên khi khớp điều kiện phụ, điều kiện đầu tiên khớp được dùng
+        for escalation in rule.get('escalations', []):
+            if len(escalation) < 4:
+                raise ValueError(f"Alert escalation needs [metric, operator, threshold, severity]: {escalation}")
+        self.escalations = [
+            (_compile_condition(escalation), escalation[3]) for escalation in rule.get('escalations', [])
+        ]
+
+    def mask(self, columns, size):
+        # Dòng thiếu một chỉ số mà luật dùng thì luật không áp dụng (kể cả khi match='any')
+        present = [all(columns[metric][i] is not None for metric in self.metrics) for i in range(size)]
+        if not self.conditions:
+            return present
+        masks = [condition(columns) for condition in self.conditions]
+        return [ok and self.combine(values) for ok, values in zip(present, zip(*masks))]
+
+    def severities(self, columns, size):
+        result = [None] * size
+        for condition, severity in self.escalations:
+            for i, matched in enumerate(condition(columns)):
+                if matched and result[i] is None:
+                    result[i] = severity
+        return [severity or self.severity for severity in result]
+
+    def render(self, location_name, row, severity):
+        return {
+            'alert_type': self.alert_type,
+            'message': self.message.format(location=location_name, **row),
+            'severity': severity,
+            'recommendation': self.recommendation,
+        }
+
+
+def validate_rule(rule):
+    """Biên dịch luật và render message với SAMPLE_ROW; ValueError nếu luật không dùng được."""
+    try:
+        compiled = CompiledRule(rule)
+        compiled.render('Hanoi', SAMPLE_ROW, compiled.severity)
+    except ValueError:
+        raise
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Invalid alert rule {rule.get('name')!r}: {e!r}") from e
+    return compiled
+
+
+def compile_rules(rules):
+    """Luật đã biên dịch; luật lỗi (vd. dòng AlertRule sửa thẳng trong DB) được ghi log và bỏ qua."""
+    compiled = []
+    for rule in rules:
+        try:
+            compiled.append(validate_rule(rule))
+        except ValueError as e:
+            logger.error(f"Skipping alert rule {rule.get('name')!r}: {e}")
+    return compiled
+
+
+class RuleSet:
+    """Bộ luật đã biên dịch cho một vùng, đánh giá theo cột cho nhiều vị trí một lượt."""
+
+    def __init__(self, rules):
+        compiled = compile_rules(rules)
+        self.rules = [rule for rule in compiled if not rule.fallback]
+        self.fallbacks = [rule for rule in compiled if rule.fallback]
+
+    def evaluate(self, names, columns):
+        size = len(names)
+        results = [[] for _ in range(size)]
+        taken = [set() for _ in range(size)]
+        for rule in self.rules:
+            matched = rule.mask(columns, size)
+            if not any(matched):
+                continue
+            severities = rule.severities(columns, size)
+            for i in compress(range(size), matched):
+                # Mỗi loại cảnh báo tối đa một lần cho mỗi vị trí, luật đứng trước được ưu tiên
+                if rule.alert_type in taken[i]:
+                    continue
+                taken[i].add(rule.alert_type)
+                row = {metric: columns[metric][i] for metric in METRICS}
+                results[i].append(rule.render(names[i], row, severities[i]))
+        unmatched = [not alerts for alerts in results]
+        for rule in self.fallbacks:
+            for i, applies in enumerate(rule.mask(columns, size)):
+                if applies and unmatched[i]:
+                    row = {metric: columns[metric][i] for metric in METRICS}
+                    results[i].append(rule.render(names[i], row, rule.severity))
+        return results
+
+
+def _rule_key(rule):
+    return rule['name']
+
+
+def load_rule_definitions():
+    """Luật theo vùng: {country_code: [rule, ...]}; '' là luật chung.
+
+    Thứ tự ưu tiên: mặc định < settings.WEATHER_ALERT_RULES < bảng AlertRule (theo name).
+    Dòng AlertRule có enabled=False tắt luật cùng tên.
+    """
+    base = {_rule_key(rule): dict(rule) for rule in DEFAULT_ALERT_RULES}
+    for rule in getattr(settings, 'WEATHER_ALERT_RULES', []):
+        base[_rule_key(rule)] = dict(rule)
+    order = list(base)
+
+    overrides = {}
+    for db_rule in AlertRule.objects.order_by('id'):
+        overrides.setdefault(db_rule.country_code, {})[db_rule.name] = db_rule.as_definition()
+        if db_rule.name not in order:
+            order.append(db_rule.name)
+
+    def merged(region_overrides):
+        rules = dict(base)
+        rules.update(overrides.get('', {}))
+        rules.update(region_overrides)
+        return [rules[name] for name in order if name in rules and rules[name].get('enabled', True)]
+
+    definitions = {'': merged({})}
+    for country_code, region_overrides in overrides.items():
+        if country_code:
+            definitions[country_code] = merged(region_overrides)
+    return definitions
+
+
+class RuleEngine:
+    """Biên dịch bộ luật một lần (nạp lại sau RELOAD_INTERVAL hoặc khi AlertRule thay đổi)."""
+
+    def __init__(self):
+        self._rulesets = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._rulesets = None
+
+    def rulesets(self):
+        with self._lock:
+            if self._rulesets is None or time.monotonic() - self._loaded_at > RELOAD_INTERVAL:
+                self._rulesets = {
+                    region: RuleSet(rules) for region, rules in load_rule_definitions().items()
+                }
+                self._loaded_at = time.monotonic()
+            return self._rulesets
+
+    def evaluate(self, locations, rows):
+        """Danh sách cảnh báo mong muốn cho từng vị trí (cùng thứ tự với locations)."""
+        rulesets = self.rulesets()
+        by_region = {}
+        for index, location in enumerate(locations):
+            region = location.country_code if location.country_code in rulesets else ''
+            by_region.setdefault(region, []).append(index)
+
+        results = [None] * len(locations)
+        for region, indexes in by_region.items():
+            names = [locations[i].name for i in indexes]
+            evaluated = rulesets[region].evaluate(names, to_columns([rows[i] for i in indexes]))
+            for i, alerts in zip(indexes, evaluated):
+                results[i] = alerts
+        return results
+
+
+engine = RuleEngine()
@@ -0,0 +1,124 @@
+# weather/async_utils.py
+import asyncio
+import logging
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from .cache import coordinate_key, get_cache_config, get_upstream_cache, query_key
+from .gazetteer import lookup_place, remember_place
+from .http import get_http_config
+from .usage import record_api_call
+from .utils import (
+    CURRENT_WEATHER_PATH, FORECAST_PATH, GEOCODE_PATH, coordinate_params, geocode_params,
+    parse_current_weather, parse_forecast, parse_geocode,
+)
+
+logger = logging.getLogger(__name__)
+
+# httpx.AsyncClient gắn với event loop tạo ra nó nên mỗi loop có một client riêng
+_clients = weakref.WeakKeyDictionary()
+_in_flight = weakref.WeakKeyDictionary()
+
+
+def build_async_client(config=None):
+    config = config or get_http_config()
+    return httpx.AsyncClient(
+        base_url=config['BASE_URL'],
+        timeout=httpx.Timeout(config['READ_TIMEOUT'], connect=config['CONNECT_TIMEOUT']),
+        limits=httpx.Limits(
+            max_connections=config['POOL_MAXSIZE'],
+            max_keepalive_connections=config['POOL_MAXSIZE'],
+        ),
+        transport=httpx.AsyncHTTPTransport(retries=config['MAX_RETRIES']),
+        headers={'Accept': 'application/json'},
+    )
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = build_async_client()
+        _clients[loop] = client
+    return client
+
+
+async def upstream_aget(path, params=None, request_type=None):
+    started = time.monotonic()
+    response = None
+    try:
+        response = await get_async_client().get(path, params=params)
+        return response
+    except httpx.HTTPError as e:
+        logger.error(f"Async upstream request to {path} failed: {e}")
+        return None
+    finally:
+        if request_type:
+            # Chỉ append vào buffer trong bộ nhớ, không chặn event loop
+            record_api_call(request_type, response, started, params)
+
+
+async def _cached_call(endpoint, key, loader):
+    """Bản async của cached_upstream: đọc cache, gộp các lần miss đồng thời trong cùng loop."""
+    cache = get_upstream_cache()
+    value = await cache.aget(key)
+    if value:
+        return value
+
+    loop = asyncio.get_running_loop()
+    in_flight = _in_flight.setdefault(loop, {})
+    task = in_flight.get(key)
+    if task is None:
+        async def load():
+            try:
+                result = await loader()
+                if result:  # như cached_upstream: không cache lỗi (None) hay kết quả rỗng
+                    await cache.aset(key, result, get_cache_config()['TTLS'][endpoint])
+                return result
+            finally:
+                in_flight.pop(key, None)
+
+        task = loop.create_task(load())
+        in_flight[key] = task
+    # shield: một client ngắt kết nối không được hủy request mà các client khác đang chờ
+    return await asyncio.shield(task)
+
+
+async def afetch_geocode(location_name):
+    async def load():
+        response = await upstream_aget(GEOCODE_PATH, geocode_params(location_name), 'geocode')
+        if response is not None and response.status_code == 200:
+            return parse_geocode(response.json())
+        return None
+    return await _cached_call('geocode', query_key('geocode', location_name), load)
+
+
+async def ageocode_location(location_name):
+    location_data = await sync_to_async(lookup_place)(location_name)
+    if location_data:
+        return location_data
+    location_data = await afetch_geocode(location_name)
+    if location_data:
+        await sync_to_async(remember_place)(location_name, location_data)
+    return location_data
+
+
+async def afetch_current_weather(lat, lon):
+    async def load():
+        response = await upstream_aget(CURRENT_WEATHER_PATH, coordinate_params(lat, lon), 'current')
+        if response is not None and response.status_code == 200:
+            return parse_current_weather(response.json())
+        return None
+    return await _cached_call('current', coordinate_key('current', lat, lon), load)
+
+
+async def afetch_forecast(lat, lon):
+    async def load():
+        response = await upstream_aget(FORECAST_PATH, coordinate_params(lat, lon), 'forecast')
+        if response is not None and response.status_code == 200:
+            return parse_forecast(response.json())
+        return None
+    return await _cached_call('forecast', coordinate_key('forecast', lat, lon), load)
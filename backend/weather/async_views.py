@@ -0,0 +1,253 @@
+# weather/async_views.py
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from .async_utils import afetch_current_weather, afetch_forecast, ageocode_location
+from .authentication import materialize_user, resolve_token
+from .fast_serializers import render_json
+from .geo import find_or_create_location, has_location_input
+from .mail_queue import enqueue_alert_notifications
+from .models import CurrentWeather, WeatherAlert
+from .push import alerts_event, get_broker, get_push_config, hub, sse_frame, weather_event
+from .refresh import EXPIRED, STALE, freshness, mark_location_requested, stale_refresher
+from .serializers import CurrentWeatherSerializer, LocationInputSerializer, WeatherAlertSerializer
+from .utils import check_weather_alerts, weather_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def api_response(data, status_code=status.HTTP_200_OK):
+    # Dùng encoder của DRF để output giống hệt các view đồng bộ
+    return JsonResponse(data, status=status_code, safe=False, encoder=JSONEncoder)
+
+
+def parse_location_input(request):
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, api_response({"error": "Invalid JSON body"}, status.HTTP_400_BAD_REQUEST)
+    serializer = LocationInputSerializer(data=payload)
+    if not serializer.is_valid():
+        return None, api_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    return serializer.validated_data, None
+
+
+async def aresolve_location(validated_data):
+    """Bản async của geo.resolve_location; None nếu không geocode được."""
+    latitude = validated_data.get('latitude')
+    longitude = validated_data.get('longitude')
+    location_name = validated_data.get('name')
+
+    if latitude and longitude:
+        return await sync_to_async(find_or_create_location)(latitude, longitude)
+    elif location_name:
+        location_data = await ageocode_location(location_name)
+        if not location_data:
+            return None
+        return await sync_to_async(find_or_create_location)(
+            location_data['latitude'], location_data['longitude'],
+            location_data['name'], location_data.get('country_code', ''),
+        )
+    return None
+
+
+async def aauthenticate(request):
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    token = await sync_to_async(resolve_token)(auth[1])
+    if token is None or not token.user.is_active:
+        return None
+    # View async đọc các trường của user: nạp ở đây, không để LazyUser query trong event loop
+    return await sync_to_async(materialize_user)(token.user)
+
+
+def _check_and_serialize_alerts(location, weather_data, forecast_data):
+    alerts = check_weather_alerts(location, weather_data, forecast_data)
+    return WeatherAlertSerializer(alerts, many=True).data if alerts else []
+
+
+@csrf_exempt
+@require_POST
+async def current_by_location(request):
+    validated_data, error = parse_location_input(request)
+    if error:
+        return error
+    if not has_location_input(validated_data):
+        return api_response({"error": "Invalid location data"}, status.HTTP_400_BAD_REQUEST)
+    location = await aresolve_location(validated_data)
+    if location is None:
+        return api_response({"error": "Could not find location"}, status.HTTP_404_NOT_FOUND)
+
+    await sync_to_async(mark_location_requested)(location)
+    try:
+        current_weather = await CurrentWeather.objects.select_related('location').filter(location=location).afirst()
+        state = freshness(current_weather)
+        # Dữ liệu STALE vẫn được trả về và được refresh ở thread nền
+        needs_refresh = state == EXPIRED
+
+        # Gọi current weather và forecast song song thay vì lần lượt
+        if needs_refresh:
+            weather_data, forecast_data = await asyncio.gather(
+                afetch_current_weather(location.latitude, location.longitude),
+                afetch_forecast(location.latitude, location.longitude),
+            )
+        else:
+            weather_data, forecast_data = None, await afetch_forecast(location.latitude, location.longitude)
+
+        if current_weather is None:
+            if not weather_data:
+                logger.error("Failed to fetch weather data")
+                return api_response({"error": "Failed to fetch weather data"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            current_weather = await CurrentWeather.objects.acreate(location=location, **weather_data)
+        elif weather_data:
+            for key, value in weather_data.items():
+                setattr(current_weather, key, value)
+            current_weather.timestamp = timezone.now()
+            await current_weather.asave()
+        elif needs_refresh:
+            logger.warning("Using old weather data due to fetch failure")
+        elif state == STALE:
+            stale_refresher.schedule(location)
+            logger.info(f"Serving stale weather for {location}, background refresh scheduled")
+
+        alerts_data = await sync_to_async(_check_and_serialize_alerts)(
+            location, weather_snapshot(current_weather), forecast_data,
+        )
+
+        return api_response({
+            'weather': CurrentWeatherSerializer(current_weather).data,
+            'alerts': alerts_data,
+        })
+    except Exception as e:
+        logger.error(f"Error processing weather data: {str(e)}")
+        return api_response({"error": "Internal server error"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+async def alerts_by_location(request):
+    validated_data, error = parse_location_input(request)
+    if error:
+        return error
+    if not has_location_input(validated_data):
+        return api_response({"error": "Invalid location data"}, status.HTTP_400_BAD_REQUEST)
+    location = await aresolve_location(validated_data)
+    if location is None:
+        return api_response({"error": "Could not find location"}, status.HTTP_404_NOT_FOUND)
+    await sync_to_async(mark_location_requested)(location)
+
+    weather_data, forecast_data = await asyncio.gather(
+        afetch_current_weather(location.latitude, location.longitude),
+        afetch_forecast(location.latitude, location.longitude),
+    )
+    if not weather_data:
+        return api_response({"error": "Failed to fetch weather data"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    alerts_data = await sync_to_async(_check_and_serialize_alerts)(location, weather_data, forecast_data)
+    return api_response(alerts_data)
+
+
+@csrf_exempt
+@require_POST
+async def check_notifications(request):
+    user = await aauthenticate(request)
+    if user is None:
+        return api_response({"detail": "Authentication credentials were not provided."}, status.HTTP_401_UNAUTHORIZED)
+
+    validated_data, error = parse_location_input(request)
+    if error:
+        return error
+    if not has_location_input(validated_data):
+        return api_response({"error": "Invalid location data"}, status.HTTP_400_BAD_REQUEST)
+    location = await aresolve_location(validated_data)
+    if location is None:
+        return api_response({"error": "Could not find location"}, status.HTTP_404_NOT_FOUND)
+    await sync_to_async(mark_location_requested)(location)
+
+    weather_data, forecast_data = await asyncio.gather(
+        afetch_current_weather(location.latitude, location.longitude),
+        afetch_forecast(location.latitude, location.longitude),
+    )
+    if not weather_data:
+        return api_response({"error": "Failed to fetch weather data"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if not forecast_data:
+        return api_response({"error": "Failed to fetch forecast data"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    alerts = await sync_to_async(lambda: list(check_weather_alerts(location, weather_data, forecast_data)))()
+    notification_settings = user.notification_settings
+    filtered_alerts = [alert for alert in alerts if notification_settings.get(alert.alert_type, False)]
+
+    await sync_to_async(enqueue_alert_notifications)(user, filtered_alerts)
+
+    serialized_alerts = await sync_to_async(lambda: WeatherAlertSerializer(filtered_alerts, many=True).data)()
+    return api_response(serialized_alerts)
+
+
+def parse_stream_locations(request):
+    config = get_push_config()
+    try:
+        location_ids = {int(value) for value in request.GET.get('locations', '').split(',') if value.strip()}
+    except ValueError:
+        return None, api_response({"error": "locations must be a comma-separated list of ids"}, status.HTTP_400_BAD_REQUEST)
+    if not location_ids:
+        return None, api_response({"error": "locations is required"}, status.HTTP_400_BAD_REQUEST)
+    if len(location_ids) > config['MAX_LOCATIONS']:
+        return None, api_response(
+            {"error": f"At most {config['MAX_LOCATIONS']} locations per stream"}, status.HTTP_400_BAD_REQUEST,
+        )
+    return location_ids, None
+
+
+async def snapshot_frames(location_ids):
+    """Trạng thái hiện tại của các vị trí, gửi ngay khi kết nối (và khi kết nối lại)."""
+    frames = []
+    async for current_weather in CurrentWeather.objects.filter(location_id__in=location_ids):
+        frames.append(sse_frame('weather', render_json(weather_event(current_weather.location_id, current_weather))))
+    alerts = {location_id: [] for location_id in location_ids}
+    async for alert in WeatherAlert.objects.filter(location_id__in=location_ids).order_by('id'):
+        alerts[alert.location_id].append(alert)
+    for location_id, location_alerts in alerts.items():
+        frames.append(sse_frame('alerts', render_json(alerts_event(location_id, created=location_alerts, reset=True))))
+    return frames
+
+
+async def event_stream(location_ids):
+    config = get_push_config()
+    await get_broker().start()
+    # Đăng ký trước khi đọc snapshot để không lỡ thay đổi xảy ra giữa hai bước
+    subscription = hub.subscribe(location_ids)
+    try:
+        yield b"retry: %d\n\n" % config['RETRY']
+        for frame in await snapshot_frames(location_ids):
+            yield frame
+        while True:
+            frame = await subscription.next(config['HEARTBEAT'])
+            yield frame if frame is not None else b": keep-alive\n\n"
+    finally:
+        # Django hủy generator khi client ngắt kết nối
+        hub.unsubscribe(subscription)
+
+
+@require_GET
+async def stream_updates(request):
+    """Server-Sent Events: ?locations=1,2,3 -> event weather/alerts/forecast khi dữ liệu đã lưu thay đổi.
+
+    Thay cho việc poll by_location; chỉ dùng được dưới ASGI.
+    """
+    location_ids, error = parse_stream_locations(request)
+    if error:
+        return error
+    response = StreamingHttpResponse(event_stream(location_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # tắt buffer của nginx
+    return response
@@ -0,0 +1,226 @@
+# weather/authentication.py
+import copy
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import MemoryLRUBackend, is_shared_cache
+from .models import UserProfile
+
+DEFAULT_AUTH_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 4096,  # Số token giữ trong process
+    # Giây; worker khác thấy token bị xóa/user thay đổi sau tối đa chừng này (worker hiện tại thấy ngay)
+    'LOCAL_TTL': 30,
+    # Tầng thứ hai dùng chung giữa các worker, chỉ khi CACHE_ALIAS là cache dùng chung (Redis...);
+    # chỉ lưu user_id và is_active, không lưu object user (có hash mật khẩu)
+    'SHARED_TTL': 300,
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'auth',
+}
+
+
+def get_auth_cache_config():
+    config = dict(DEFAULT_AUTH_CACHE)
+    config.update(getattr(settings, 'WEATHER_AUTH_CACHE', {}))
+    return config
+
+
+def _digest(key):
+    # Không dùng token gốc làm cache key
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _copy_token(token):
+    """Bản sao cho mỗi request để view không sửa object đang nằm trong cache."""
+    user = copy.copy(token.user)
+    if hasattr(token.user, '_prefetched_objects_cache'):
+        user._prefetched_objects_cache = dict(token.user._prefetched_objects_cache)
+    user._from_cache = True
+    token = copy.copy(token)
+    token.user = user
+    return token
+
+
+def load_user(user_id):
+    # Nạp sẵn vị trí yêu thích để UserProfileSerializer không query thêm
+    return UserProfile.objects.prefetch_related('favorite_locations').get(pk=user_id)
+
+
+class LazyUser(SimpleLazyObject):
+    """User từ tầng cache dùng chung: id/is_active có sẵn, các trường khác nạp từ DB ở lần truy cập đầu.
+
+    View chỉ cần biết đã đăng nhập (vd. by_location) không query bảng user.
+    """
+
+    def __init__(self, user_id, is_active):
+        self.__dict__['_known'] = {
+            'pk': user_id, 'id': user_id, 'is_active': is_active,
+            'is_authenticated': True, 'is_anonymous': False, '_from_cache': False,
+        }
+        super().__init__(lambda: load_user(user_id))
+
+    def __getattr__(self, name):
+        known = self.__dict__['_known']
+        if self._wrapped is empty and name in known:
+            return known[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        return True
+
+
+def materialize_user(user):
+    """Object UserProfile thật (nạp LazyUser nếu cần); gọi trong sync context trước khi dùng ở view async."""
+    if isinstance(user, LazyUser):
+        if user._wrapped is empty:
+            user._setup()
+        return user._wrapped
+    return user
+
+
+class TokenCache:
+    """Token -> user hai tầng: LRU có TTL trong process, sau đó cache dùng chung.
+
+    Tầng dùng chung chỉ bật khi cache alias thực sự dùng chung giữa các process (với LocMem,
+    mỗi worker chỉ dùng tầng trong process và thấy thay đổi từ worker khác sau LOCAL_TTL).
+    """
+
+    def __init__(self):
+        self._local = None
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self._epoch = 0  # tăng mỗi lần invalidate trong process
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = MemoryLRUBackend(get_auth_cache_config()['MAX_ENTRIES'])
+        return self._local
+
+    def _shared(self):
+        alias = get_auth_cache_config()['CACHE_ALIAS']
+        return caches[alias] if is_shared_cache(alias) else None
+
+    def _key(self, *parts):
+        return ':'.join([get_auth_cache_config()['KEY_PREFIX'], *map(str, parts)])
+
+    def _version(self, shared, user_id):
+        # Đổi mỗi lần invalidate_user; phát hiện invalidate xảy ra trong lúc load
+        return shared.get_or_set(self._key('user', user_id, 'version'), time.time_ns, None)
+
+    def _remember_local(self, digest, token):
+        self.local.set(digest, token, get_auth_cache_config()['LOCAL_TTL'])
+        with self._lock:
+            self._keys_by_user[token.user_id] = digest
+
+    def get(self, key):
+        """Token (kèm user) đã cache, hoặc None."""
+        digest = _digest(key)
+        token = self.local.get(digest)
+        if token is not None:
+            return _copy_token(token)
+        shared = self._shared()
+        entry = shared.get(self._key('token', digest)) if shared is not None else None
+        if entry is None:
+            return None
+        token = Token(key=key, user_id=entry['user_id'])
+        token._state.fields_cache['user'] = LazyUser(entry['user_id'], entry['is_active'])
+        return token
+
+    def load(self, key, loader):
+        """Gọi loader() (query DB) rồi lưu vào cả hai tầng, trừ khi user đổi trong lúc đó."""
+        config = get_auth_cache_config()
+        epoch = self._epoch
+        shared = self._shared()
+        token = loader()
+        digest = _digest(key)
+        if shared is not None:
+            version = self._version(shared, token.user_id)
+            shared.set_many({
+                self._key('token', digest): {'user_id': token.user_id, 'is_active': token.user.is_active},
+                self._key('user', token.user_id, 'token'): digest,
+            }, config['SHARED_TTL'])
+            if self._version(shared, token.user_id) != version:
+                # invalidate_user chạy trong lúc đang lưu: bỏ entry có thể đã cũ
+                shared.delete(self._key('token', digest))
+                return _copy_token(token)
+        if self._epoch == epoch:
+            self._remember_local(digest, token)
+        return _copy_token(token)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._epoch += 1
+            digest = self._keys_by_user.pop(user_id, None)
+        if digest is not None:
+            self.local.delete(digest)
+        shared = self._shared()
+        if shared is None:
+            return
+        shared_digest = shared.get(self._key('user', user_id, 'token'))
+        if shared_digest is not None:
+            shared.delete(self._key('token', shared_digest))
+        shared.set(self._key('user', user_id, 'version'), time.time_ns(), None)
+
+
+token_cache = TokenCache()
+
+
+def invalidate_user(user_id):
+    # Sau commit, để request khác không nạp lại dữ liệu cũ vào cache trước khi transaction xong
+    if get_auth_cache_config()['ENABLED']:
+        transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+
+def fresh_user(user):
+    """(user, updated_at) theo DB, dùng làm ETag cho dữ liệu riêng của user.
+
+    User lấy từ tầng trong process có thể cũ tới LOCAL_TTL giây (thay đổi ở worker khác):
+    đọc updated_at (một query) và nạp lại user nếu đã đổi.
+    """
+    if not getattr(user, '_from_cache', False):
+        return user, user.updated_at
+    updated_at = UserProfile.objects.filter(pk=user.pk).values_list('updated_at', flat=True).first()
+    if updated_at is not None and updated_at != user.updated_at:
+        user = load_user(user.pk)
+    return user, updated_at or user.updated_at
+
+
+def load_token(key):
+    # Nạp sẵn vị trí yêu thích để UserProfileSerializer không query thêm
+    return (
+        Token.objects.select_related('user')
+        .prefetch_related('user__favorite_locations')
+        .get(key=key)
+    )
+
+
+def resolve_token(key):
+    """Token (kèm user) cho key, hoặc None; dùng chung cho view DRF và view async."""
+    try:
+        if not get_auth_cache_config()['ENABLED']:
+            return Token.objects.select_related('user').get(key=key)
+        return token_cache.get(key) or token_cache.load(key, lambda: load_token(key))
+    except Token.DoesNotExist:
+        return None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication không query DB khi token đã nằm trong cache."""
+
+    def authenticate_credentials(self, key):
+        token = resolve_token(key)
+        if token is None:
+            raise AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
@@ -1,18 +1,52 @@
 # weather/backends.py
-from django.contrib.auth.backends import ModelBackend
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
+DEFAULT_LOGIN = {
+    # None: số vòng PBKDF2 mặc định của Django. Hash cũ được băm lại khi đăng nhập thành công.
+    'PBKDF2_ITERATIONS': None,
+    'THROTTLE': True,
+    'WINDOW': 300,  # Giây
+    'MAX_FAILURES_PER_IP': 20,  # Số lần đăng nhập sai tối đa trong WINDOW, tính theo IP...
+    'MAX_FAILURES_PER_ACCOUNT': 5,  # ...và theo username/email (trừ IP đăng nhập thành công gần nhất)
+    'MAX_KEYS': 10000,  # Số IP/tài khoản được theo dõi trong bộ nhớ
+}
+
+
+def get_login_config():
+    config = dict(DEFAULT_LOGIN)
+    config.update(getattr(settings, 'WEATHER_LOGIN', {}))
+    return config
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """Đăng nhập bằng username hoặc email: một query có index và tối đa một lần hash.
+
+    Khi không tìm thấy user vẫn hash mật khẩu một lần để thời gian phản hồi không lộ
+    tài khoản nào tồn tại.
+    """
 
-class EmailBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            # Nếu username chứa '@', coi nó là email
-            if '@' in username:
-                user = UserModel.objects.get(email=username)
-            else:
-                user = UserModel.objects.get(username=username)
-            if user.check_password(password):
-                return user
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # Username cũng có thể chứa '@' nên vẫn khớp theo username, username được ưu tiên
+        lookup = Q(username=username) | Q(email=username) if '@' in username else Q(username=username)
+        candidates = list(UserModel._default_manager.filter(lookup)[:2])
+        user = next((candidate for candidate in candidates if candidate.username == username), None)
+        if user is None and len(candidates) == 1:
+            user = candidates[0]
+
+        if user is None:
+            # Email trùng giữa nhiều tài khoản cũng bị từ chối như không tồn tại
+            UserModel().set_password(password)
             return None
-        return None
\ No newline at end of file
+        # check_password tự băm lại (và lưu) khi hasher hoặc số vòng trong settings đã đổi
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
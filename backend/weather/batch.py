@@ -0,0 +1,120 @@
+# weather/batch.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .gazetteer import lookup_place, remember_place
+from .geo import find_or_create_location, has_location_input, resolve_location
+from .models import CurrentWeather
+from .refresh import EXPIRED, STALE, freshness, mark_locations_requested, stale_refresher
+from .utils import (
+    check_weather_alerts, fetch_current_weather, fetch_forecast, fetch_geocode, save_current_weather, weather_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH = {
+    'MAX_LOCATIONS': 50,
+    'MAX_WORKERS': 8,  # Số request upstream chạy song song tối đa cho một batch
+}
+
+
+def get_batch_config():
+    config = dict(DEFAULT_BATCH)
+    config.update(getattr(settings, 'WEATHER_BATCH', {}))
+    return config
+
+
+def _fetch_upstream(location, needs_weather):
+    # Chạy trong thread pool: chỉ gọi HTTP (qua cache); việc ghi DB làm ở thread chính
+    try:
+        weather_data = fetch_current_weather(location.latitude, location.longitude) if needs_weather else None
+        forecast_data = fetch_forecast(location.latitude, location.longitude)
+        return weather_data, forecast_data
+    finally:
+        # advisory lock của single-flight có thể mở kết nối DB riêng cho thread này
+        connection.close()
+
+
+def _fetch_geocode(location_name):
+    # Chạy trong thread pool như _fetch_upstream: chỉ gọi HTTP, ghi gazetteer ở thread chính
+    try:
+        return fetch_geocode(location_name)
+    finally:
+        connection.close()
+
+
+def resolve_batch_locations(items):
+    """Xác định Location cho từng mục 'locations' của batch; trả về danh sách Location hoặc None.
+
+    Các tên chưa có trong gazetteer được geocode song song, mỗi tên một lần.
+    """
+    geocoded = {}
+    for item in items:
+        has_coordinates = item.get('latitude') and item.get('longitude')
+        if not has_coordinates and item.get('name') and lookup_place(item['name']) is None:
+            geocoded[item['name']] = None
+    if geocoded:
+        max_workers = min(get_batch_config()['MAX_WORKERS'], len(geocoded))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for name, location_data in zip(list(geocoded), executor.map(_fetch_geocode, list(geocoded))):
+                geocoded[name] = location_data
+                if location_data:
+                    remember_place(name, location_data)
+
+    locations = []
+    for item in items:
+        if not has_location_input(item):
+            locations.append(None)
+        elif item.get('name') in geocoded and not (item.get('latitude') and item.get('longitude')):
+            # Đã geocode ở trên: không gọi lại API cho tên không tìm thấy
+            location_data = geocoded[item['name']]
+            locations.append(find_or_create_location(
+                location_data['latitude'], location_data['longitude'],
+                location_data['name'], location_data.get('country_code', ''),
+            ) if location_data else None)
+        else:
+            locations.append(resolve_location(item))
+    return locations
+
+
+def get_batch_weather(locations):
+    """Thời tiết hiện tại + cảnh báo cho nhiều vị trí trong một lượt.
+
+    CurrentWeather được đọc bằng một query; các vị trí thiếu/hết hạn được tải song song
+    với số luồng giới hạn. Trả về danh sách (location, current_weather, alerts, error).
+    """
+    if not locations:
+        return []
+    mark_locations_requested(locations)
+
+    weather_by_location = {}
+    for weather in CurrentWeather.objects.filter(location__in=locations).order_by('-id'):
+        weather_by_location[weather.location_id] = weather  # giữ bản ghi id nhỏ nhất như .first()
+
+    for location in locations:
+        if freshness(weather_by_location.get(location.id)) == STALE:
+            stale_refresher.schedule(location)
+
+    max_workers = min(get_batch_config()['MAX_WORKERS'], len(locations))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_fetch_upstream, location, freshness(weather_by_location.get(location.id)) == EXPIRED)
+            for location in locations
+        ]
+        fetched = [future.result() for future in futures]
+
+    results = []
+    for location, (weather_data, forecast_data) in zip(locations, fetched):
+        current_weather = weather_by_location.get(location.id)
+        if weather_data:
+            current_weather = save_current_weather(location, current_weather, weather_data)
+        elif current_weather is None:
+            results.append((location, None, [], "Failed to fetch weather data"))
+            continue
+        current_weather.location = location
+        alerts = check_weather_alerts(location, weather_snapshot(current_weather), forecast_data)
+        results.append((location, current_weather, alerts, None))
+    return results
@@ -0,0 +1,184 @@
+# weather/cache.py
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .singleflight import coalesce
+
+DEFAULT_UPSTREAM_CACHE = {
+    'BACKEND': 'memory',  # 'memory' (LRU trong process) hoặc 'django' (cache framework)
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 1024,
+    'COORD_PRECISION': 2,  # 2 chữ số thập phân ~ 1.1 km
+    'KEY_PREFIX': 'owm',
+    'TTLS': {
+        'current': 300,
+        'forecast': 1800,
+        'geocode': 86400,
+    },
+}
+
+
+def get_cache_config():
+    config = dict(DEFAULT_UPSTREAM_CACHE)
+    config.update(getattr(settings, 'WEATHER_UPSTREAM_CACHE', {}))
+    ttls = dict(DEFAULT_UPSTREAM_CACHE['TTLS'])
+    ttls.update(config.get('TTLS') or {})
+    config['TTLS'] = ttls
+    return config
+
+
+def is_shared_cache(alias='default'):
+    """True nếu cache alias được các process dùng chung (Redis, Memcached, DB...), không phải LocMem."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+class MemoryLRUBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Truy cập dict trong process không chặn event loop nên dùng trực tiếp bản sync
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, ttl):
+        self.set(key, value, ttl)
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    async def aget(self, key):
+        return await self._cache.aget(key)
+
+    async def aset(self, key, value, ttl):
+        await self._cache.aset(key, value, ttl)
+
+    def clear(self):
+        # Không xóa toàn bộ cache dùng chung, chỉ các key upstream hết hạn theo TTL
+        pass
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_upstream_cache():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = get_cache_config()
+                if config['BACKEND'] == 'django':
+                    _backend = DjangoCacheBackend(config['CACHE_ALIAS'])
+                else:
+                    _backend = MemoryLRUBackend(config['MAX_ENTRIES'])
+    return _backend
+
+
+def reset_upstream_cache():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def coordinate_key(endpoint, lat, lon):
+    config = get_cache_config()
+    precision = config['COORD_PRECISION']
+    return f"{config['KEY_PREFIX']}:{endpoint}:{round(float(lat), precision)}:{round(float(lon), precision)}"
+
+
+def query_key(endpoint, query):
+    config = get_cache_config()
+    normalized = ' '.join(str(query).lower().split())
+    digest = hashlib.md5(normalized.encode('utf-8')).hexdigest()
+    return f"{config['KEY_PREFIX']}:{endpoint}:{digest}"
+
+
+def cached_upstream(endpoint, key_func):
+    """Cache kết quả gọi OpenWeatherMap theo key_func, TTL riêng cho từng endpoint.
+
+    Kết quả None (lỗi upstream) và kết quả rỗng ([] / {}) không được cache. Các lần miss đồng thời cho cùng key
+    được gộp lại (single-flight) để chỉ có một request ra OpenWeatherMap.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_upstream_cache()
+            key = key_func(endpoint, *args, **kwargs)
+            value = cache.get(key)
+            if value:
+                return value
+
+            def load():
+                # Kiểm tra lại: request dẫn đầu (có thể ở worker khác) có thể vừa ghi cache
+                value = cache.get(key)
+                if not value:
+                    value = func(*args, **kwargs)
+                    if value:
+                        cache.set(key, value, get_cache_config()['TTLS'][endpoint])
+                return value
+
+            # Advisory lock giữa các worker chỉ có ích khi cache được dùng chung
+            return coalesce(key, load, cross_process=isinstance(cache, DjangoCacheBackend))
+        def refresh(*args, **kwargs):
+            # Gọi upstream bỏ qua cache và ghi đè kết quả mới (dùng cho refresh nền)
+            value = func(*args, **kwargs)
+            if value:
+                get_upstream_cache().set(key_func(endpoint, *args, **kwargs), value, get_cache_config()['TTLS'][endpoint])
+            return value
+
+        wrapper.uncached = func
+        wrapper.refresh = refresh
+        return wrapper
+    return decorator
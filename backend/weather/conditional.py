@@ -0,0 +1,47 @@
+# weather/conditional.py
+import hashlib
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    """ETag từ các thành phần rẻ (id, timestamp...) cộng với path + query string của request."""
+    raw = '|'.join([request.get_full_path()] + [str(part) for part in parts])
+    return quote_etag(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+
+def is_not_modified(request, etag=None, last_modified=None):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag:
+        etags = parse_etags(if_none_match)
+        # So sánh yếu: bỏ tiền tố W/ mà một số proxy thêm vào
+        return '*' in etags or etag.removeprefix('W/') in [e.removeprefix('W/') for e in etags]
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+    return False
+
+
+def set_validators(response, etag=None, last_modified=None, max_age=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if max_age is not None:
+        response['Cache-Control'] = f"private, max-age={max(int(max_age), 0)}"
+    return response
+
+
+def conditional_response(request, build, etag=None, last_modified=None, max_age=None):
+    """Trả về 304 nếu client đã có bản mới nhất, nếu không gọi build() để serialize.
+
+    build chỉ được gọi khi thật sự cần body, nên phần serialize được bỏ qua hoàn toàn với 304.
+    """
+    if is_not_modified(request, etag, last_modified):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+    return set_validators(response, etag, last_modified, max_age)
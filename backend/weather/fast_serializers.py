@@ -0,0 +1,140 @@
+# weather/fast_serializers.py
+import json
+from operator import attrgetter
+
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, fallback về json chuẩn với output giống hệt
+    orjson = None
+
+from .serializers import CurrentWeatherSerializer, ForecastSerializer, WeatherAlertSerializer
+
+
+def _identity(value):
+    return value
+
+
+class FastSerializer:
+    """Serialize chỉ-đọc dựa trên field accessor biên dịch sẵn từ một ModelSerializer.
+
+    Dùng chính các field DRF đã bind (to_representation) cho kiểu phức tạp như Decimal,
+    DateTime nên output giống hệt serializer gốc, nhưng bỏ qua phần khởi tạo serializer,
+    get_attribute/SkipField và ReturnDict cho mỗi object.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._compiled = None
+
+    def _compile_fields(self, serializer, prefix=''):
+        compiled = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if isinstance(field, serializers.BaseSerializer):
+                # Serializer lồng (vd. LocationSerializer): biên dịch đệ quy
+                nested = self._compile_fields(field, prefix=f"{prefix}{source}__")
+                compiled.append((name, attrgetter(source), f"{prefix}{source}", nested))
+                continue
+            if isinstance(field, (serializers.CharField, serializers.ChoiceField)):
+                # Giá trị từ model đã là str; ChoiceField trả về nguyên giá trị
+                convert = str if isinstance(field, serializers.CharField) else _identity
+            elif isinstance(field, serializers.IntegerField):
+                convert = int
+            else:
+                convert = field.to_representation
+            compiled.append((name, attrgetter(source), f"{prefix}{source}", convert))
+        return compiled
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = self._compile_fields(self.serializer_class())
+        return self._compiled
+
+    def _to_dict(self, obj, compiled):
+        data = {}
+        for name, getter, _, convert in compiled:
+            value = getter(obj)
+            if value is None:
+                data[name] = None
+            elif isinstance(convert, list):
+                data[name] = self._to_dict(value, convert)
+            else:
+                data[name] = convert(value)
+        return data
+
+    def _row_to_dict(self, row, compiled):
+        data = {}
+        for name, _, key, convert in compiled:
+            if isinstance(convert, list):
+                data[name] = self._row_to_dict(row, convert)
+                continue
+            value = row[key]
+            data[name] = None if value is None else convert(value)
+        return data
+
+    def _select(self, fields):
+        if not fields:
+            return self.compiled
+        return [entry for entry in self.compiled if entry[0] in fields]
+
+    def serialize(self, obj, fields=None):
+        return self._to_dict(obj, self._select(fields))
+
+    def serialize_many(self, objs, fields=None):
+        compiled = self._select(fields)
+        return [self._to_dict(obj, compiled) for obj in objs]
+
+    def values_fields(self):
+        """Danh sách tên cột cho queryset.values() tương ứng với serialize_rows()."""
+        names = []
+
+        def collect(compiled):
+            for _, _, key, convert in compiled:
+                if isinstance(convert, list):
+                    collect(convert)
+                else:
+                    names.append(key)
+        collect(self.compiled)
+        return names
+
+    def serialize_rows(self, rows, fields=None):
+        # Chỉ dùng cho serializer không có FileField (values() trả về tên file, không phải FieldFile)
+        compiled = self._select(fields)
+        return [self._row_to_dict(row, compiled) for row in rows]
+
+
+fast_alerts = FastSerializer(WeatherAlertSerializer)
+fast_forecasts = FastSerializer(ForecastSerializer)
+fast_current_weather = FastSerializer(CurrentWeatherSerializer)
+
+
+def render_json(data):
+    """Encode giống JSONRenderer mặc định của DRF (compact, UTF-8, escape U+2028/U+2029)."""
+    if orjson is not None:
+        # datetime/date/time đi qua JSONEncoder của DRF (vd. "+00:00" -> "Z") thay vì định dạng riêng của orjson
+        content = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False,
+                             separators=(',', ':')).encode('utf-8')
+    return content.replace('\u2028'.encode('utf-8'), b'\\u2028').replace('\u2029'.encode('utf-8'), b'\\u2029')
+
+
+class FastJSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(render_json(data), **kwargs)
+
+
+def requested_fields(request):
+    # Giống SparseFieldsMixin: ?fields=a,b
+    requested = request.query_params.get('fields') if request is not None else None
+    if not requested:
+        return None
+    return {name.strip() for name in requested.split(',') if name.strip()}
@@ -0,0 +1,64 @@
+# weather/forecasts.py
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Forecast
+from .push import publish_forecasts
+from .refresh import get_refresh_config
+from .utils import fetch_forecast
+
+TYPE_ORDER = {'short': 0, 'daily': 1, 'weekly': 2}
+UPDATE_FIELDS = ['high_temperature', 'low_temperature', 'rain_probability', 'uv_index', 'updated_at']
+
+
+def _ordered(forecasts, location, forecast_type=None):
+    result = []
+    for forecast in forecasts:
+        if forecast_type and forecast.forecast_type != forecast_type:
+            continue
+        forecast.location = location  # tránh query lại Location khi serialize
+        result.append(forecast)
+    result.sort(key=lambda f: (TYPE_ORDER.get(f.forecast_type, len(TYPE_ORDER)), f.forecast_time))
+    return result
+
+
+def store_forecasts(location, forecast_data):
+    """Upsert dự báo theo (location, forecast_type, forecast_time) và xóa các mốc không còn trong dữ liệu mới."""
+    batch_started = timezone.now()
+    objs = [Forecast(location=location, **item) for item in forecast_data]
+    with transaction.atomic():
+        Forecast.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=['location', 'forecast_type', 'forecast_time'],
+            update_fields=UPDATE_FIELDS,
+        )
+        # updated_at (auto_now) của mọi bản ghi vừa ghi >= batch_started
+        Forecast.objects.filter(location=location, updated_at__lt=batch_started).delete()
+    publish_forecasts(location, objs)
+    return objs
+
+
+def get_forecasts(location, forecast_type=None):
+    """Trả về dự báo đã lưu nếu còn mới (chỉ đọc), nếu không thì tải lại và upsert.
+
+    Trả về None khi không có dữ liệu và không tải được từ OpenWeatherMap.
+    """
+    fresh_for = timedelta(seconds=get_refresh_config()['FORECAST_FRESH_FOR'])
+    stored = Forecast.objects.filter(location=location)
+    last_updated = stored.aggregate(last=Max('updated_at'))['last']
+    if last_updated and timezone.now() - last_updated <= fresh_for:
+        if forecast_type:
+            stored = stored.filter(forecast_type=forecast_type)
+        return _ordered(stored, location)
+
+    forecast_data = fetch_forecast(location.latitude, location.longitude)
+    if not forecast_data:
+        if last_updated:
+            # Giữ dữ liệu cũ còn hơn trả lỗi
+            return _ordered(stored, location, forecast_type)
+        return None
+    return _ordered(store_forecasts(location, forecast_data), location, forecast_type)
@@ -0,0 +1,134 @@
+# weather/gazetteer.py
+import bisect
+import threading
+import unicodedata
+
+from .models import GeocodeEntry
+
+AUTOCOMPLETE_SCAN_LIMIT = 200
+
+
+def normalize_name(name):
+    """Chuẩn hóa tên địa danh: bỏ dấu, viết thường, gộp khoảng trắng ("Hà  Nội" -> "ha noi")."""
+    name = str(name).replace('đ', 'd').replace('Đ', 'D')
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    return ' '.join(name.lower().replace(',', ' ').split())
+
+
+def entry_to_location_data(entry):
+    return {
+        'name': entry.name,
+        'latitude': entry.latitude,
+        'longitude': entry.longitude,
+        'country_code': entry.country_code,
+    }
+
+
+class PrefixIndex:
+    """Index trong bộ nhớ: tra cứu chính xác qua dict, gợi ý theo tiền tố qua danh sách key đã sắp xếp."""
+
+    def __init__(self):
+        self._entries = {}
+        self._keys = []
+        self._loaded = False
+        self._added = None  # entry được add() trong lúc đang nạp từ DB
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # chỉ một thread nạp index tại một thời điểm
+
+    def load(self):
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        with self._lock:
+            self._added = {}
+        entries = {}
+        for entry in GeocodeEntry.objects.only(
+            'normalized_name', 'name', 'latitude', 'longitude', 'country_code', 'population'
+        ).iterator(chunk_size=5000):
+            entries[entry.normalized_name] = entry
+        with self._lock:
+            # Snapshot DB có thể đã được đọc trước khi các entry này được ghi
+            entries.update(self._added)
+            self._added = None
+            self._entries = entries
+            self._keys = sorted(entries)
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+
+    def get(self, normalized):
+        self.ensure_loaded()
+        return self._entries.get(normalized)
+
+    def add(self, entry):
+        with self._lock:
+            if self._added is not None:
+                self._added[entry.normalized_name] = entry
+            if entry.normalized_name not in self._entries:
+                bisect.insort(self._keys, entry.normalized_name)
+            self._entries[entry.normalized_name] = entry
+
+    def search(self, prefix, limit=10):
+        self.ensure_loaded()
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            matches = []
+            for key in self._keys[start:start + AUTOCOMPLETE_SCAN_LIMIT]:
+                if not key.startswith(prefix):
+                    break
+                matches.append(self._entries[key])
+        # Ưu tiên khớp chính xác, sau đó theo dân số
+        matches.sort(key=lambda e: (e.normalized_name != prefix, -e.population, e.normalized_name))
+        return matches[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self._keys = []
+            self._loaded = False
+
+
+index = PrefixIndex()
+
+
+def lookup_place(location_name):
+    """Tìm địa danh trong index cục bộ (bộ nhớ, rồi DB); trả về dict như geocode_location hoặc None."""
+    normalized = normalize_name(location_name)
+    if not normalized:
+        return None
+    entry = index.get(normalized)
+    if entry is None:
+        # Worker khác có thể vừa ghi thêm sau khi index được nạp
+        entry = GeocodeEntry.objects.filter(normalized_name=normalized).first()
+        if entry is None:
+            return None
+        index.add(entry)
+    return entry_to_location_data(entry)
+
+
+def remember_place(location_name, location_data, source='api'):
+    """Ghi kết quả geocode từ API vào DB và index, theo cả tên truy vấn lẫn tên chuẩn trả về."""
+    for key in {normalize_name(location_name), normalize_name(location_data['name'])}:
+        if not key:
+            continue
+        entry, _ = GeocodeEntry.objects.get_or_create(
+            normalized_name=key,
+            defaults={
+                'name': location_data['name'],
+                'latitude': location_data['latitude'],
+                'longitude': location_data['longitude'],
+                'country_code': location_data.get('country_code', ''),
+                'source': source,
+            },
+        )
+        index.add(entry)
@@ -0,0 +1,98 @@
+# weather/geo.py
+import copy
+import math
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import Location
+from .singleflight import coalesce
+from .utils import geocode_location
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+DEFAULT_SNAP_RADIUS_KM = 2
+
+
+def get_snap_radius_km():
+    return getattr(settings, 'WEATHER_LOCATION_SNAP_KM', DEFAULT_SNAP_RADIUS_KM)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, radius_km):
+    lat, lon = float(lat), float(lon)
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return (
+        Decimal(str(round(lat - dlat, 7))), Decimal(str(round(lat + dlat, 7))),
+        Decimal(str(round(lon - dlon, 7))), Decimal(str(round(lon + dlon, 7))),
+    )
+
+
+def find_nearest_location(lat, lon, radius_km=None):
+    """Vị trí gần nhất trong bán kính radius_km, dùng index (latitude, longitude) để lọc theo khung."""
+    radius_km = get_snap_radius_km() if radius_km is None else radius_km
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    candidates = Location.objects.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lon, max_lon),
+    )
+    nearest, nearest_distance = None, None
+    for location in candidates:
+        distance = haversine_km(lat, lon, location.latitude, location.longitude)
+        if distance <= radius_km and (nearest is None or distance < nearest_distance):
+            nearest, nearest_distance = location, distance
+    return nearest
+
+
+def find_or_create_location(latitude, longitude, name='Custom Location', country_code=''):
+    """Gắn tọa độ vào Location chuẩn gần nhất, chỉ tạo mới khi không có vị trí nào trong bán kính."""
+    def resolve():
+        location = find_nearest_location(latitude, longitude)
+        if location is None:
+            return Location.objects.create(name=name, latitude=latitude, longitude=longitude, country_code=country_code)
+        # Vị trí tạo từ GPS được đặt lại tên khi có kết quả geocode cho cùng khu vực
+        if location.name == 'Custom Location' and name != 'Custom Location':
+            location.name = name
+            location.country_code = country_code or location.country_code
+            location.save(update_fields=['name', 'country_code'])
+        return location
+
+    # Gộp các request đồng thời cho cùng ô lưới để không tạo trùng vị trí.
+    # Mỗi request nhận bản sao riêng: các thread không dùng chung một instance có thể bị sửa
+    key = f"location:{round(float(latitude), 2)}:{round(float(longitude), 2)}"
+    return copy.deepcopy(coalesce(key, resolve))
+
+
+def has_location_input(validated_data):
+    """Dữ liệu có tên hoặc đủ cặp tọa độ; nếu không, view trả 400 "Invalid location data"."""
+    return bool(
+        (validated_data.get('latitude') and validated_data.get('longitude')) or validated_data.get('name')
+    )
+
+
+def resolve_location(validated_data):
+    """Xác định Location từ dữ liệu LocationInputSerializer; None nếu không geocode được.
+
+    Gọi has_location_input trước để phân biệt dữ liệu thiếu (400) với geocode thất bại (404).
+    """
+    latitude = validated_data.get('latitude')
+    longitude = validated_data.get('longitude')
+    location_name = validated_data.get('name')
+
+    if latitude and longitude:
+        return find_or_create_location(latitude, longitude)
+    if location_name:
+        location_data = geocode_location(location_name)
+        if not location_data:
+            return None
+        return find_or_create_location(
+            location_data['latitude'], location_data['longitude'],
+            location_data['name'], location_data.get('country_code', ''),
+        )
+    return None
@@ -0,0 +1,16 @@
+# weather/hashers.py
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from .backends import get_login_config
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 với số vòng lấy từ WEATHER_LOGIN['PBKDF2_ITERATIONS'].
+
+    Cùng algorithm với hasher mặc định nên đọc được mọi hash cũ; hash có số vòng khác
+    được băm lại khi user đăng nhập (must_update).
+    """
+
+    @property
+    def iterations(self):
+        return get_login_config()['PBKDF2_ITERATIONS'] or PBKDF2PasswordHasher.iterations
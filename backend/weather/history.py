@@ -0,0 +1,72 @@
+# weather/history.py
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncHour
+
+from .models import WeatherObservation
+
+DEFAULT_HISTORY = {
+    'MAX_RAW_POINTS': 5000,  # Số điểm tối đa khi lấy dữ liệu gốc (resolution=raw)
+    'MAX_RANGE_DAYS': 366,
+}
+
+RESOLUTIONS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+}
+
+METRICS = ['temperature', 'humidity', 'wind_speed', 'pressure']
+
+
+def get_history_config():
+    config = dict(DEFAULT_HISTORY)
+    config.update(getattr(settings, 'WEATHER_HISTORY', {}))
+    return config
+
+
+def observation_from_weather(current_weather):
+    return WeatherObservation(
+        location_id=current_weather.location_id,
+        observed_at=current_weather.timestamp,
+        temperature=float(current_weather.temperature),
+        humidity=int(round(float(current_weather.humidity))),
+        wind_speed=float(current_weather.wind_speed),
+        pressure=int(round(float(current_weather.pressure))),
+    )
+
+
+def record_observation(current_weather):
+    # Ghi lại nhiều lần cùng timestamp (vd. save() không đổi dữ liệu) không tạo dòng trùng
+    WeatherObservation.objects.bulk_create([observation_from_weather(current_weather)], ignore_conflicts=True)
+
+
+def _rounded(row):
+    # Cột real chỉ chính xác ~7 chữ số: 24.3 đọc ra thành 24.299999237
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in row.items()}
+
+
+def observation_series(location_id, start, end, resolution='hour'):
+    """Chuỗi quan trắc của một vị trí trong [start, end).
+
+    resolution='raw' trả về từng dòng (giới hạn MAX_RAW_POINTS); 'hour'/'day' gom nhóm
+    min/max/avg ngay trong SQL theo múi giờ hiện tại.
+    """
+    queryset = WeatherObservation.objects.filter(
+        location_id=location_id, observed_at__gte=start, observed_at__lt=end,
+    )
+    if resolution == 'raw':
+        limit = get_history_config()['MAX_RAW_POINTS']
+        return [_rounded(row) for row in queryset.order_by('observed_at').values('observed_at', *METRICS)[:limit]]
+
+    aggregates = {'samples': Count('id')}
+    for metric in METRICS:
+        aggregates[f'{metric}_min'] = Min(metric)
+        aggregates[f'{metric}_max'] = Max(metric)
+        aggregates[f'{metric}_avg'] = Avg(metric)
+    rows = (
+        queryset.annotate(bucket=RESOLUTIONS[resolution]('observed_at'))
+        .values('bucket')
+        .annotate(**aggregates)
+        .order_by('bucket')
+    )
+    return [_rounded(row) for row in rows]
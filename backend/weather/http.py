@@ -0,0 +1,124 @@
+# weather/http.py
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .usage import record_api_call
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CLIENT = {
+    'BASE_URL': 'http://api.openweathermap.org',  # Đổi sang stub server khi test
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 32,
+    'POOL_BLOCK': False,
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.3,
+    'BACKOFF_JITTER': 0.2,
+    'RETRY_STATUSES': [429, 500, 502, 503, 504],
+}
+
+
+def get_http_config():
+    config = dict(DEFAULT_HTTP_CLIENT)
+    config.update(getattr(settings, 'WEATHER_HTTP_CLIENT', {}))
+    return config
+
+
+class JitteredRetry(Retry):
+    """Retry với exponential backoff cộng thêm jitter ngẫu nhiên để tránh retry đồng loạt."""
+
+    def __init__(self, *args, jitter=0.0, **kwargs):
+        self.jitter = jitter
+        super().__init__(*args, **kwargs)
+
+    def new(self, **kwargs):
+        kwargs.setdefault('jitter', self.jitter)
+        return super().new(**kwargs)
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, self.jitter)
+
+
+def build_session(config=None):
+    config = config or get_http_config()
+    retry = JitteredRetry(
+        total=config['MAX_RETRIES'],
+        connect=config['MAX_RETRIES'],
+        read=config['MAX_RETRIES'],
+        status=config['MAX_RETRIES'],
+        backoff_factor=config['BACKOFF_FACTOR'],
+        jitter=config['BACKOFF_JITTER'],
+        status_forcelist=config['RETRY_STATUSES'],
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config['POOL_CONNECTIONS'],
+        pool_maxsize=config['POOL_MAXSIZE'],
+        pool_block=config['POOL_BLOCK'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept': 'application/json'})
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # Session dùng chung: connection pool của urllib3 an toàn khi dùng từ nhiều thread
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def reset_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def upstream_get(path, params=None, request_type=None):
+    """GET tới OpenWeatherMap qua session dùng chung; trả về None nếu lỗi mạng/timeout.
+
+    Nếu có request_type, lần gọi được ghi vào OpenWeatherMapAPIUsage (qua buffer).
+    """
+    config = get_http_config()
+    url = f"{config['BASE_URL'].rstrip('/')}/{path.lstrip('/')}"
+    started = time.monotonic()
+    response = None
+    try:
+        response = get_session().get(
+            url,
+            params=params,
+            timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT']),
+        )
+        return response
+    except requests.RequestException as e:
+        logger.error(f"Upstream request to {path} failed: {e}")
+        return None
+    finally:
+        if request_type:
+            record_api_call(request_type, response, started, params)
@@ -0,0 +1,211 @@
+# weather/mail_queue.py
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAIL_QUEUE = {
+    'BATCH_SIZE': 100,  # Số email tối đa mỗi lượt, gửi qua một kết nối SMTP
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 60,  # Giây; lần thử thứ n chờ BACKOFF_BASE * 2^(n-1) (+ jitter)
+    'DIGEST_WINDOW': 60,  # Cảnh báo của cùng user trong khoảng này được gộp vào một email
+    'DEDUPE_WINDOW': 3600,  # Không xếp lại cùng nội dung đã gửi cho cùng digest_key trong khoảng này
+    'CLAIM_TIMEOUT': 600,  # Email "sending" quá lâu (worker chết giữa chừng) được đưa lại hàng đợi
+    'INTERVAL': 10,
+}
+
+
+def get_mail_queue_config():
+    config = dict(DEFAULT_MAIL_QUEUE)
+    config.update(getattr(settings, 'WEATHER_MAIL_QUEUE', {}))
+    return config
+
+
+def _digest_state(digest_keys, now):
+    """Trạng thái các bản tin: ({digest_key: giờ gửi của bản tin đang chờ}, {(digest_key, subject, body), ...}).
+
+    Tập thứ hai gồm nội dung đang chờ/đang gửi hoặc đã gửi trong DEDUPE_WINDOW.
+    """
+    send_at, seen = {}, set()
+    if not digest_keys:
+        return send_at, seen
+    recent = now - timedelta(seconds=get_mail_queue_config()['DEDUPE_WINDOW'])
+    rows = OutboundEmail.objects.filter(digest_key__in=digest_keys).filter(
+        Q(status__in=['pending', 'sending']) | Q(status='sent', sent_at__gte=recent)
+    ).values_list('digest_key', 'subject', 'body', 'status', 'next_attempt_at')
+    for digest_key, subject, body, status, next_attempt_at in rows:
+        seen.add((digest_key, subject, body))
+        if status == 'pending':
+            # Email mới vào bản tin đang chờ được gửi cùng lúc, không lùi cửa sổ gộp
+            send_at[digest_key] = min(send_at.get(digest_key, next_attempt_at), next_attempt_at)
+    return send_at, seen
+
+
+def enqueue_mail(to_email, subject, body, kind='generic', user=None, digest_key='', delay=0):
+    """Đưa email vào hàng đợi (một câu INSERT); worker send_queued_mail sẽ gửi.
+
+    Với digest_key, email trùng nội dung đang chờ hoặc vừa gửi bị bỏ qua (trả về None).
+    """
+    now = timezone.now()
+    next_attempt_at = now + timedelta(seconds=delay)
+    if digest_key:
+        send_at, seen = _digest_state([digest_key], now)
+        if (digest_key, subject, body) in seen:
+            return None
+        next_attempt_at = send_at.get(digest_key, next_attempt_at)
+    return OutboundEmail.objects.create(
+        user=user,
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        kind=kind,
+        digest_key=digest_key,
+        next_attempt_at=next_attempt_at,
+    )
+
+
+def alert_email(alert):
+    subject = f"Weather Alert: {alert.alert_type.capitalize()}"
+    body = f"{alert.message}\nRecommendation: {alert.recommendation or 'No recommendation'}"
+    return subject, body
+
+
+def enqueue_alert_notifications(user, alerts):
+    """Xếp hàng thông báo cảnh báo cho user; các cảnh báo gần nhau được gộp thành một email."""
+    if not alerts or not user.email:
+        return []
+    return enqueue_alert_fanout({user.pk: (user.email, alerts)})
+
+
+def enqueue_alert_fanout(alerts_by_user):
+    """Xếp hàng thông báo cho nhiều user: {user_id: (email, [alert, ...])}.
+
+    Một câu SELECT đọc các bản tin đang chờ, một câu INSERT cho các email mới. Cảnh báo đã
+    chờ hoặc vừa gửi cho user không được xếp lại; email mới nhập vào bản tin đang chờ.
+    """
+    now = timezone.now()
+    default_send_at = now + timedelta(seconds=get_mail_queue_config()['DIGEST_WINDOW'])
+    recipients = {user_id: value for user_id, value in alerts_by_user.items() if value[0]}
+    send_at, seen = _digest_state([f"alerts:{user_id}" for user_id in recipients], now)
+    emails = []
+    for user_id, (to_email, alerts) in recipients.items():
+        digest_key = f"alerts:{user_id}"
+        for alert in alerts:
+            subject, body = alert_email(alert)
+            if (digest_key, subject, body) in seen:
+                continue
+            seen.add((digest_key, subject, body))
+            emails.append(OutboundEmail(
+                user_id=user_id, to_email=to_email, subject=subject, body=body, kind='alert',
+                digest_key=digest_key, next_attempt_at=send_at.get(digest_key, default_send_at),
+            ))
+    return OutboundEmail.objects.bulk_create(emails) if emails else []
+
+
+def claim_due(now=None, batch_size=None):
+    """Lấy các email đến hạn và đánh dấu 'sending'; SKIP LOCKED để nhiều worker chạy song song.
+
+    Mọi email đang chờ của cùng digest_key được lấy cùng lúc để bản tin không bị tách làm nhiều lượt.
+    """
+    now = now or timezone.now()
+    config = get_mail_queue_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    with transaction.atomic():
+        # Đưa lại hàng đợi các email bị kẹt do worker dừng giữa chừng
+        OutboundEmail.objects.filter(
+            status='sending', next_attempt_at__lt=now - timedelta(seconds=config['CLAIM_TIMEOUT']),
+        ).update(status='pending')
+        claimed = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        digest_keys = {email.digest_key for email in claimed if email.digest_key}
+        if digest_keys:
+            claimed += list(
+                OutboundEmail.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', digest_key__in=digest_keys)
+                .exclude(pk__in=[email.pk for email in claimed])
+            )
+        if claimed:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in claimed]).update(status='sending', next_attempt_at=now)
+    return claimed
+
+
+def build_messages(emails):
+    """Gộp email theo digest_key: [(EmailMessage, [OutboundEmail, ...]), ...]."""
+    groups = {}
+    for email in emails:
+        key = (email.digest_key, email.to_email) if email.digest_key else ('', email.pk)
+        groups.setdefault(key, []).append(email)
+
+    messages = []
+    for group in groups.values():
+        # Bỏ nội dung trùng (vd. cùng một cảnh báo được kiểm tra nhiều lần trong cửa sổ gộp)
+        unique = list({(email.subject, email.body): email for email in group}.values())
+        if len(unique) == 1:
+            subject, body = unique[0].subject, unique[0].body
+        else:
+            subject = f"Weather Alerts: {len(unique)} updates"
+            body = '\n\n'.join(f"{email.subject}\n{email.body}" for email in unique)
+        messages.append((EmailMessage(subject, body, None, [group[0].to_email]), group))
+    return messages
+
+
+def _mark_failed(emails, error, now):
+    config = get_mail_queue_config()
+    for email in emails:
+        email.attempts += 1
+        email.last_error = str(error)[:1000]
+        if email.attempts >= config['MAX_ATTEMPTS']:
+            email.status = 'failed'
+        else:
+            email.status = 'pending'
+            backoff = config['BACKOFF_BASE'] * 2 ** (email.attempts - 1)
+            email.next_attempt_at = now + timedelta(seconds=backoff * random.uniform(1, 1.2))
+    OutboundEmail.objects.bulk_update(emails, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_queued_mail(now=None):
+    """Gửi một lượt email đến hạn qua một kết nối SMTP dùng lại. Trả về (đã gửi, lỗi)."""
+    now = now or timezone.now()
+    claimed = claim_due(now)
+    if not claimed:
+        return 0, 0
+
+    messages = build_messages(claimed)
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f"Could not connect to mail server: {e}")
+        _mark_failed(claimed, e, now)
+        return 0, len(claimed)
+
+    sent, failed = [], []
+    try:
+        for message, emails in messages:
+            message.connection = connection
+            try:
+                # Từng message một để biết chính xác message nào lỗi, vẫn trên cùng kết nối
+                connection.send_messages([message])
+                sent.extend(emails)
+            except Exception as e:
+                logger.warning(f"Failed to send email to {message.to}: {e}")
+                _mark_failed(emails, e, now)
+                failed.extend(emails)
+    finally:
+        connection.close()
+
+    if sent:
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in sent]).update(status='sent', sent_at=timezone.now())
+    return len(sent), len(failed)
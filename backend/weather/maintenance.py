@@ -0,0 +1,174 @@
+# weather/maintenance.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import (
+    ApiUsageRollup, Forecast, Location, OpenWeatherMapAPIUsage, WeatherAlert, WeatherObservation,
+)
+from .push import alerts_event, publish
+from .response_cache import invalidate_location
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAINTENANCE = {
+    'USAGE_RAW_DAYS': 7,  # Giữ từng dòng OpenWeatherMapAPIUsage 7 ngày, sau đó chỉ còn rollup theo giờ
+    'USAGE_ROLLUP_DAYS': 400,
+    'ROLLUP_LOOKBACK_HOURS': 3,  # Tính lại vài giờ đã rollup: dòng usage được flush trễ vẫn được đếm
+    'OBSERVATION_DAYS': 400,
+    'ALERT_DAYS': 30,  # Cảnh báo của vị trí không còn được truy cập
+    'FORECAST_DAYS': 2,  # Dự báo cho thời điểm đã qua
+    'BATCH_SIZE': 5000,  # Số dòng tối đa mỗi câu DELETE, tránh transaction dài và lock lâu
+    'INTERVAL': 3600,
+}
+
+REPORT_MODELS = [
+    OpenWeatherMapAPIUsage, ApiUsageRollup, WeatherObservation, WeatherAlert, Forecast, Location,
+]
+
+
+def get_maintenance_config():
+    config = dict(DEFAULT_MAINTENANCE)
+    config.update(getattr(settings, 'WEATHER_MAINTENANCE', {}))
+    return config
+
+
+def _current_hour(now):
+    return timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_since(last_rollup):
+    # Các giờ từ mốc này trở đi còn được rollup_api_usage tính lại
+    return last_rollup - timedelta(hours=get_maintenance_config()['ROLLUP_LOOKBACK_HOURS'])
+
+
+def rollup_api_usage(now=None):
+    """Tổng hợp các giờ đã kết thúc của OpenWeatherMapAPIUsage vào ApiUsageRollup.
+
+    Tính lại ROLLUP_LOOKBACK_HOURS giờ trước giờ rollup gần nhất nên chạy nhiều lần cho
+    cùng kết quả (upsert). Trả về số dòng rollup được ghi.
+    """
+    until = _current_hour(now or timezone.now())
+    last = ApiUsageRollup.objects.aggregate(last=Max('hour'))['last']
+    usage = OpenWeatherMapAPIUsage.objects.filter(api_call_time__lt=until)
+    if last is not None:
+        usage = usage.filter(api_call_time__gte=_rollup_since(last))
+
+    rows = (
+        usage.annotate(hour=TruncHour('api_call_time'))
+        .values('hour', 'request_type')
+        .annotate(
+            calls=Count('id'),
+            errors=Count('id', filter=Q(response_status__lt=200) | Q(response_status__gte=300)),
+            avg_latency_ms=Avg('latency_ms'),
+        )
+    )
+    rollups = [ApiUsageRollup(**row) for row in rows]
+    if rollups:
+        ApiUsageRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['hour', 'request_type'],
+            update_fields=['calls', 'errors', 'avg_latency_ms', 'updated_at'],
+        )
+    return len(rollups)
+
+
+def prune_in_batches(queryset, batch_size):
+    """Xóa theo từng lô khóa chính để mỗi câu DELETE ngắn và autovacuum theo kịp."""
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(pk__in=ids).delete()[1].get(model._meta.label, 0)
+
+
+def prune_alerts_in_batches(queryset, batch_size):
+    """prune_in_batches cho WeatherAlert, không phát post_delete cho từng dòng.
+
+    Cache response và event SSE được cập nhật một lần cho mỗi vị trí thay vì mỗi cảnh báo.
+    """
+    deleted = 0
+    deleted_by_location = {}
+    while True:
+        rows = list(queryset.values_list('pk', 'location_id')[:batch_size])
+        if not rows:
+            break
+        # WeatherAlert không có quan hệ trỏ tới nên xóa thẳng bằng SQL là an toàn
+        deleted += WeatherAlert.objects.filter(pk__in=[pk for pk, _ in rows])._raw_delete(queryset.db)
+        for pk, location_id in rows:
+            deleted_by_location.setdefault(location_id, []).append(WeatherAlert(pk=pk, location_id=location_id))
+    for location_id, alerts in deleted_by_location.items():
+        invalidate_location(location_id)
+        publish(
+            location_id, 'alerts',
+            lambda location_id=location_id, alerts=alerts: alerts_event(location_id, deleted=alerts),
+        )
+    return deleted
+
+
+PRUNERS = {
+    'alerts': prune_alerts_in_batches,
+}
+
+
+def prune_targets(now=None):
+    """Các queryset cần xóa theo TTL, theo thứ tự chạy."""
+    now = now or timezone.now()
+    config = get_maintenance_config()
+    usage_cutoff = now - timedelta(days=config['USAGE_RAW_DAYS'])
+    # Không xóa dòng gốc của giờ chưa được rollup (vd. rollup bị dừng lâu hơn USAGE_RAW_DAYS)
+    last_rollup = ApiUsageRollup.objects.aggregate(last=Max('hour'))['last']
+    usage_cutoff = min(usage_cutoff, _rollup_since(last_rollup)) if last_rollup else None
+    alert_cutoff = now - timedelta(days=config['ALERT_DAYS'])
+
+    targets = [
+        ('observations', WeatherObservation.objects.filter(
+            observed_at__lt=now - timedelta(days=config['OBSERVATION_DAYS']))),
+        # Cảnh báo vẫn được reconcile_alerts cập nhật cho vị trí đang được truy cập, chỉ xóa vị trí "nguội"
+        ('alerts', WeatherAlert.objects.filter(issued_at__lt=alert_cutoff).filter(
+            Q(location__last_requested_at__lt=alert_cutoff) | Q(location__last_requested_at__isnull=True))),
+        ('forecasts', Forecast.objects.filter(forecast_time__lt=now - timedelta(days=config['FORECAST_DAYS']))),
+        ('usage_rollups', ApiUsageRollup.objects.filter(hour__lt=now - timedelta(days=config['USAGE_ROLLUP_DAYS']))),
+    ]
+    if usage_cutoff is not None:
+        targets.insert(0, ('api_usage', OpenWeatherMapAPIUsage.objects.filter(api_call_time__lt=usage_cutoff)))
+    return targets
+
+
+def prune_expired(now=None):
+    batch_size = get_maintenance_config()['BATCH_SIZE']
+    results = {}
+    for name, queryset in prune_targets(now):
+        results[name] = PRUNERS.get(name, prune_in_batches)(queryset, batch_size)
+        if results[name]:
+            logger.info(f"Pruned {results[name]} {name} row(s)")
+    return results
+
+
+def table_sizes():
+    """Kích thước (bao gồm index, TOAST) và số tuple chết của các bảng chính; chỉ hỗ trợ Postgres."""
+    if connection.vendor != 'postgresql':
+        return []
+    tables = [model._meta.db_table for model in REPORT_MODELS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_total_relation_size(c.oid), pg_indexes_size(c.oid),
+                   COALESCE(s.n_live_tup, 0), COALESCE(s.n_dead_tup, 0), s.last_autovacuum
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.relname = ANY(%s) AND c.relkind = 'r'
+            ORDER BY pg_total_relation_size(c.oid) DESC
+            """,
+            [tables],
+        )
+        columns = ['table', 'total_bytes', 'index_bytes', 'live_rows', 'dead_rows', 'last_autovacuum']
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
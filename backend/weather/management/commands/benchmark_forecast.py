@@ -0,0 +1,85 @@
+# weather/management/commands/benchmark_forecast.py
+import random
+import timeit
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from weather.utils import parse_forecast_batch
+
+
+def legacy_parse_forecast(data):
+    # Cách tổng hợp cũ (3 vòng lặp, ngày theo giờ server), giữ lại để so sánh
+    forecasts = []
+    for item in data['list'][:8]:
+        forecasts.append({
+            'forecast_type': 'short',
+            'forecast_time': datetime.fromtimestamp(item['dt']),
+            'high_temperature': item['main']['temp_max'],
+            'low_temperature': item['main']['temp_min'],
+            'rain_probability': item.get('pop', 0) * 100,
+            'uv_index': item.get('uvi', 0),
+        })
+    daily = {}
+    for item in data['list']:
+        day = datetime.fromtimestamp(item['dt']).date()
+        if day not in daily:
+            daily[day] = {
+                'forecast_type': 'daily',
+                'forecast_time': datetime.fromtimestamp(item['dt']),
+                'high_temperature': item['main']['temp_max'],
+                'low_temperature': item['main']['temp_min'],
+                'rain_probability': item.get('pop', 0) * 100,
+                'uv_index': item.get('uvi', 0),
+            }
+        else:
+            daily[day]['high_temperature'] = max(daily[day]['high_temperature'], item['main']['temp_max'])
+            daily[day]['low_temperature'] = min(daily[day]['low_temperature'], item['main']['temp_min'])
+            daily[day]['rain_probability'] = max(daily[day]['rain_probability'], item.get('pop', 0) * 100)
+    forecasts.extend(daily.values())
+    forecasts.append({
+        'forecast_type': 'weekly',
+        'forecast_time': timezone.now(),
+        'high_temperature': max(item['main']['temp_max'] for item in data['list']),
+        'low_temperature': min(item['main']['temp_min'] for item in data['list']),
+        'rain_probability': max(item.get('pop', 0) * 100 for item in data['list']),
+        'uv_index': max(item.get('uvi', 0) for item in data['list']),
+    })
+    return forecasts
+
+
+def build_response(slots, rng):
+    # Giống response của /data/2.5/forecast: mốc 3 giờ, city.timezone tính bằng giây
+    start = int(timezone.now().timestamp()) // 10800 * 10800
+    return {
+        'city': {'timezone': rng.choice([-18000, 0, 19800, 25200, 32400])},
+        'list': [{
+            'dt': start + 10800 * i,
+            'main': {'temp_max': round(rng.uniform(20, 38), 2), 'temp_min': round(rng.uniform(12, 25), 2)},
+            'pop': round(rng.random(), 2),
+        } for i in range(slots)],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the columnar forecast aggregation with the previous per-item loops.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=40, help='3-hour slots per location (40 = 5 days).')
+        parser.add_argument('--locations', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        responses = [build_response(options['slots'], rng) for _ in range(options['locations'])]
+
+        legacy = min(timeit.repeat(lambda: [legacy_parse_forecast(data) for data in responses],
+                                   number=1, repeat=options['repeat']))
+        columnar = min(timeit.repeat(lambda: parse_forecast_batch(responses), number=1, repeat=options['repeat']))
+        per_location = 1e6 / len(responses)
+        self.stdout.write(
+            f"{options['locations']} location(s) x {options['slots']} slot(s): "
+            f"loop {legacy * per_location:.1f} us/location, columnar {columnar * per_location:.1f} us/location "
+            f"({legacy / columnar:.2f}x)"
+        )
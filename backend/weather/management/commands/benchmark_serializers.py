@@ -0,0 +1,65 @@
+# weather/management/commands/benchmark_serializers.py
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from weather.fast_serializers import fast_alerts, fast_forecasts, render_json
+from weather.models import Forecast, Location, WeatherAlert
+from weather.serializers import ForecastSerializer, WeatherAlertSerializer
+
+
+def build_objects(count):
+    # Object trong bộ nhớ, không cần DB
+    now = timezone.now()
+    location = Location(id=1, name='Hà Nội', latitude=Decimal('21.0277640'), longitude=Decimal('105.8341600'), country_code='VN')
+    alerts = [
+        WeatherAlert(id=i, location=location, alert_type='storm', severity='high',
+                     message=f"Storm warning in {location.name}: High winds ({20 + i % 10} m/s).",
+                     recommendation='Stay indoors, secure outdoor objects.' if i % 2 else None,
+                     issued_at=now - timedelta(minutes=i))
+        for i in range(1, count + 1)
+    ]
+    forecasts = [
+        Forecast(id=i, location=location, forecast_type='short', forecast_time=now + timedelta(hours=3 * i),
+                 high_temperature=31.5 + i % 5, low_temperature=24.25, rain_probability=i % 100 * 1.0, uv_index=0,
+                 updated_at=now)
+        for i in range(1, count + 1)
+    ]
+    return alerts, forecasts
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF serializers with the fast read-only serializers (per-object cost and output equality).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        alerts, forecasts = build_objects(options['objects'])
+        renderer = JSONRenderer()
+        cases = [
+            ('WeatherAlertSerializer', WeatherAlertSerializer, fast_alerts, alerts),
+            ('ForecastSerializer', ForecastSerializer, fast_forecasts, forecasts),
+        ]
+        for label, serializer_class, fast, objs in cases:
+            def drf():
+                return renderer.render(serializer_class(objs, many=True).data)
+
+            def fast_path():
+                return render_json(fast.serialize_many(objs))
+
+            if drf() != fast_path():
+                raise CommandError(f"{label}: fast output differs from DRF output")
+
+            drf_time = min(timeit.repeat(drf, number=1, repeat=options['repeat']))
+            fast_time = min(timeit.repeat(fast_path, number=1, repeat=options['repeat']))
+            per_object = 1e6 / len(objs)
+            self.stdout.write(
+                f"{label}: DRF {drf_time * per_object:.1f} us/object, "
+                f"fast {fast_time * per_object:.1f} us/object ({drf_time / fast_time:.1f}x), output identical"
+            )
@@ -0,0 +1,28 @@
+# weather/management/commands/evaluate_alerts.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from weather.refresh import run_alert_pass
+from weather.subscribers import fan_out_pending_alerts
+
+
+class Command(BaseCommand):
+    help = 'Re-evaluate alert rules for every tracked location from stored weather data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit.')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between passes.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            evaluated, changed = run_alert_pass()
+            notified = fan_out_pending_alerts()
+            self.stdout.write(
+                f"Evaluated {evaluated} location(s), alerts changed for {changed}, "
+                f"notified {notified} user(s) in {time.monotonic() - started:.2f}s"
+            )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,82 @@
+# weather/management/commands/load_gazetteer.py
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.gazetteer import index, normalize_name
+from weather.models import GeocodeEntry
+
+BATCH_SIZE = 1000
+UPDATE_FIELDS = ['name', 'latitude', 'longitude', 'country_code', 'population', 'source']
+
+
+def read_geonames(path):
+    # Định dạng GeoNames (cities15000.txt...): geonameid, name, asciiname, alternatenames, lat, lon, ..., country code (8), ..., population (14)
+    with open(path, encoding='utf-8') as f:
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if len(row) < 15:
+                continue
+            yield {
+                'names': [row[1], row[2]],
+                'name': row[1],
+                'latitude': row[4],
+                'longitude': row[5],
+                'country_code': row[8],
+                'population': int(row[14] or 0),
+            }
+
+
+def read_csv(path):
+    # CSV có header: name,latitude,longitude,country_code[,population]
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'names': [row['name']],
+                'name': row['name'],
+                'latitude': row['latitude'],
+                'longitude': row['longitude'],
+                'country_code': row.get('country_code', ''),
+                'population': int(row.get('population') or 0),
+            }
+
+
+class Command(BaseCommand):
+    help = 'Preload the local geocoding index from a gazetteer file (GeoNames TSV or CSV).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the gazetteer file.')
+        parser.add_argument('--format', choices=['geonames', 'csv'], default='geonames')
+        parser.add_argument('--min-population', type=int, default=0)
+
+    def handle(self, *args, **options):
+        reader = read_geonames if options['format'] == 'geonames' else read_csv
+        # Nhiều địa danh cùng tên: giữ nơi đông dân nhất
+        entries = {}
+        try:
+            for place in reader(options['path']):
+                if place['population'] < options['min_population']:
+                    continue
+                for name in place['names']:
+                    key = normalize_name(name)
+                    if key and (key not in entries or entries[key].population < place['population']):
+                        entries[key] = GeocodeEntry(
+                            normalized_name=key,
+                            name=place['name'],
+                            latitude=round(float(place['latitude']), 7),
+                            longitude=round(float(place['longitude']), 7),
+                            country_code=place['country_code'],
+                            population=place['population'],
+                            source='gazetteer',
+                        )
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not read gazetteer: {e}")
+
+        GeocodeEntry.objects.bulk_create(
+            entries.values(),
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['normalized_name'],
+            update_fields=UPDATE_FIELDS,
+        )
+        index.reset()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(entries)} gazetteer entries"))
@@ -0,0 +1,32 @@
+# weather/management/commands/refresh_weather.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from weather.refresh import RateBudget, get_refresh_config, run_refresh_pass
+from weather.subscribers import fan_out_pending_alerts
+from weather.usage import QuotaGovernor
+
+
+class Command(BaseCommand):
+    help = 'Refresh weather data for hot locations (recently requested or favorited) ahead of expiry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single refresh pass and exit.')
+        parser.add_argument('--interval', type=int, help='Seconds between refresh passes.')
+        parser.add_argument('--rate-budget', type=int, help='Max upstream requests per minute.')
+
+    def handle(self, *args, **options):
+        config = get_refresh_config()
+        interval = options['interval'] or config['INTERVAL']
+        budget = RateBudget(options['rate_budget'] or config['RATE_BUDGET'])
+        governor = QuotaGovernor()
+
+        while True:
+            refreshed, skipped = run_refresh_pass(budget, governor)
+            self.stdout.write(f"Refreshed {refreshed} location(s), deferred {skipped} over rate budget or API quota")
+            # Cảnh báo do refresh (hoặc request) tạo/đổi mức độ: gửi email cho người theo dõi
+            fan_out_pending_alerts()
+            if options['once']:
+                break
+            time.sleep(interval)
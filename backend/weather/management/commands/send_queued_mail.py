@@ -0,0 +1,25 @@
+# weather/management/commands/send_queued_mail.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from weather.mail_queue import get_mail_queue_config, send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails (alert digests, password resets) over a reused SMTP connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+        parser.add_argument('--interval', type=int, help='Seconds between passes when the queue is empty.')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_mail_queue_config()['INTERVAL']
+        while True:
+            sent, failed = send_queued_mail()
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed (will retry with backoff)")
+                continue  # Có thể còn email đến hạn: chạy lượt tiếp ngay
+            if options['once']:
+                break
+            time.sleep(interval)
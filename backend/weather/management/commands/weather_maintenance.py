@@ -0,0 +1,53 @@
+# weather/management/commands/weather_maintenance.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from weather.maintenance import get_maintenance_config, prune_expired, rollup_api_usage, table_sizes
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = 'Roll up API usage per hour, prune expired rows in batches and report table sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rollup', action='store_true', help='Only roll up API usage.')
+        parser.add_argument('--prune', action='store_true', help='Only prune expired rows.')
+        parser.add_argument('--report', action='store_true', help='Only report table sizes.')
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of a single pass (e.g. without cron).')
+        parser.add_argument('--interval', type=int, help='Seconds between passes with --loop.')
+
+    def handle(self, *args, **options):
+        # Không chọn bước nào = chạy tất cả
+        run_all = not (options['rollup'] or options['prune'] or options['report'])
+        interval = options['interval'] or get_maintenance_config()['INTERVAL']
+
+        while True:
+            if run_all or options['rollup']:
+                self.stdout.write(f"Rolled up {rollup_api_usage()} usage hour/type row(s)")
+            if run_all or options['prune']:
+                for name, count in prune_expired().items():
+                    self.stdout.write(f"Pruned {count} {name} row(s)")
+            if run_all or options['report']:
+                self.report()
+            if not options['loop']:
+                break
+            time.sleep(interval)
+
+    def report(self):
+        sizes = table_sizes()
+        if not sizes:
+            self.stdout.write("Table size report is only available on PostgreSQL")
+            return
+        for row in sizes:
+            self.stdout.write(
+                f"{row['table']}: {format_bytes(row['total_bytes'])} total, {format_bytes(row['index_bytes'])} indexes, "
+                f"{row['live_rows']} live / {row['dead_rows']} dead rows, last autovacuum {row['last_autovacuum'] or 'never'}"
+            )
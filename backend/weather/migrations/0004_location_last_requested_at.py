@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_newsarticle_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='last_requested_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
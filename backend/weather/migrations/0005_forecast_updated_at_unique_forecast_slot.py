@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def clear_forecasts(apps, schema_editor):
+    # Dự báo cũ có thể trùng (location, forecast_type, forecast_time); chúng sẽ được tải lại khi đọc
+    Forecast = apps.get_model('weather', 'Forecast')
+    Forecast.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_location_last_requested_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_forecasts, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='forecast',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='forecast',
+            constraint=models.UniqueConstraint(fields=('location', 'forecast_type', 'forecast_time'), name='unique_forecast_slot'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0006_location_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_name', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('latitude', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('longitude', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('country_code', models.CharField(blank=True, max_length=10)),
+                ('population', models.BigIntegerField(default=0)),
+                ('source', models.CharField(choices=[('api', 'OpenWeatherMap API'), ('gazetteer', 'Gazetteer')], default='api', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0008_newsarticle_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='currentweather',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='forecast',
+            name='forecast_time',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='weatheralert',
+            name='issued_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='newsarticle',
+            name='published_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
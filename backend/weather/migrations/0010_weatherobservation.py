@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:10
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import weather.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0009_timestamp_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('observed_at', models.DateTimeField()),
+                ('temperature', weather.models.RealField()),
+                ('humidity', models.PositiveSmallIntegerField()),
+                ('wind_speed', weather.models.RealField()),
+                ('pressure', models.PositiveSmallIntegerField()),
+                ('location', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='weather.location')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['observed_at'], name='observation_time_brin')],
+                'constraints': [models.UniqueConstraint(fields=('location', 'observed_at'), name='unique_observation')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0010_weatherobservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('request_type', models.CharField(choices=[('current', 'Current Weather'), ('forecast', 'Forecast'), ('alert', 'Weather Alert')], max_length=20)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'request_type'), name='unique_usage_rollup')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='openweathermapapiusage',
+            index=models.Index(fields=['api_call_time'], name='api_usage_call_time_idx'),
+        ),
+    ]
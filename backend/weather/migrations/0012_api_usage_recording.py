@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+REQUEST_TYPES = [('current', 'Current Weather'), ('forecast', 'Forecast'), ('alert', 'Weather Alert'), ('geocode', 'Geocoding')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0011_apiusagerollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='openweathermapapiusage',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='weather.location'),
+        ),
+        migrations.AlterField(
+            model_name='openweathermapapiusage',
+            name='api_call_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='openweathermapapiusage',
+            name='request_type',
+            field=models.CharField(choices=REQUEST_TYPES, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='openweathermapapiusage',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='apiusagerollup',
+            name='request_type',
+            field=models.CharField(choices=REQUEST_TYPES, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='apiusagerollup',
+            name='avg_latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0012_api_usage_recording'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('country_code', models.CharField(blank=True, max_length=10)),
+                ('alert_type', models.CharField(max_length=50)),
+                ('match', models.CharField(choices=[('any', 'Any condition'), ('all', 'All conditions')], default='any', max_length=3)),
+                ('conditions', models.JSONField(default=list)),
+                ('escalations', models.JSONField(blank=True, default=list)),
+                ('severity', models.CharField(default='medium', max_length=20)),
+                ('message', models.TextField()),
+                ('recommendation', models.TextField(blank=True)),
+                ('fallback', models.BooleanField(default=False)),
+                ('enabled', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'country_code'), name='unique_alert_rule')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0014_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['email'], name='userprofile_email_idx'),
+        ),
+    ]
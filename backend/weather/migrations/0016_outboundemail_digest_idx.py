@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0015_userprofile_email_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(fields=['digest_key', 'status'], name='outbound_email_digest_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_existing_notified(apps, schema_editor):
+    # Cảnh báo cũ đã được thông báo khi tạo: không gửi lại sau khi chuyển sang fan-out nền
+    WeatherAlert = apps.get_model('weather', 'WeatherAlert')
+    WeatherAlert.objects.filter(notified_at__isnull=True).update(notified_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0016_outboundemail_digest_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weatheralert',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='weatheralert',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['id'], name='weather_alert_unnotified_idx'),
+        ),
+    ]
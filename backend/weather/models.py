@@ -1,18 +1,52 @@
 # weather/models.py
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+class RealField(models.FloatField):
+    # Số thực 4 byte (Postgres real) thay cho double/numeric cho dữ liệu lịch sử
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'real'
+        return super().db_type(connection)
+
 class Location(models.Model):
     name = models.CharField(max_length=255)
     latitude = models.DecimalField(max_digits=10, decimal_places=7)
     longitude = models.DecimalField(max_digits=10, decimal_places=7)
     country_code = models.CharField(max_length=10)
     is_auto_detected = models.BooleanField(default=False) # để phân biệt vị trí tự động
+    last_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)  # dùng để xác định vị trí "nóng" cần refresh nền
+
+    class Meta:
+        indexes = [
+            # Tìm vị trí gần nhất theo khung tọa độ (xem weather/geo.py)
+            models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class GeocodeEntry(models.Model):
+    SOURCES = [
+        ('api', 'OpenWeatherMap API'),
+        ('gazetteer', 'Gazetteer'),
+    ]
+
+    normalized_name = models.CharField(max_length=255, unique=True)  # tên đã bỏ dấu, viết thường
+    name = models.CharField(max_length=255)
+    latitude = models.DecimalField(max_digits=10, decimal_places=7)
+    longitude = models.DecimalField(max_digits=10, decimal_places=7)
+    country_code = models.CharField(max_length=10, blank=True)
+    population = models.BigIntegerField(default=0)  # dùng để xếp hạng gợi ý autocomplete
+    source = models.CharField(max_length=20, choices=SOURCES, default='api')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.country_code})"
+
 class CurrentWeather(models.Model):
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     temperature = models.DecimalField(max_digits=5, decimal_places=2)
@@ -21,11 +55,33 @@ class CurrentWeather(models.Model):
     pressure = models.DecimalField(max_digits=10, decimal_places=2)
     weather_condition = models.CharField(max_length=255)
     icon_url = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(default=timezone.now)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
         return f"Weather at {self.location.name}"
 
+class WeatherObservation(models.Model):
+    # Lịch sử thời tiết chỉ ghi thêm (append-only), mỗi lần CurrentWeather được cập nhật là một dòng
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, db_index=False)  # đã có trong unique (location, observed_at)
+    observed_at = models.DateTimeField()
+    temperature = RealField()
+    humidity = models.PositiveSmallIntegerField()  # %
+    wind_speed = RealField()
+    pressure = models.PositiveSmallIntegerField()  # hPa
+
+    class Meta:
+        constraints = [
+            # Đồng thời là index cho truy vấn theo khoảng thời gian của một vị trí
+            models.UniqueConstraint(fields=['location', 'observed_at'], name='unique_observation'),
+        ]
+        indexes = [
+            # Dữ liệu được ghi theo thứ tự thời gian nên BRIN rất nhỏ mà vẫn lọc tốt (rollup, xóa dữ liệu cũ)
+            BrinIndex(fields=['observed_at'], name='observation_time_brin', autosummarize=True),
+        ]
+
+    def __str__(self):
+        return f"Observation for {self.location.name} at {self.observed_at}"
+
 class Forecast(models.Model):
     FORECAST_TYPES = [
         ('short', 'Short-term'),
@@ -35,11 +91,18 @@ class Forecast(models.Model):
 
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     forecast_type = models.CharField(max_length=20, choices=FORECAST_TYPES)
-    forecast_time = models.DateTimeField()
+    forecast_time = models.DateTimeField(db_index=True)
     high_temperature = models.DecimalField(max_digits=5, decimal_places=2)
     low_temperature = models.DecimalField(max_digits=5, decimal_places=2)
     rain_probability = models.DecimalField(max_digits=5, decimal_places=2)
     uv_index = models.DecimalField(max_digits=5, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Khóa cho upsert: mỗi vị trí chỉ có một dự báo cho mỗi loại và thời điểm
+            models.UniqueConstraint(fields=['location', 'forecast_type', 'forecast_time'], name='unique_forecast_slot'),
+        ]
 
     def __str__(self):
         return f"{self.forecast_type.capitalize()} Forecast for {self.location.name}"
@@ -57,15 +120,73 @@ class WeatherAlert(models.Model):
     message = models.TextField()
     severity = models.CharField(max_length=20, choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], default='medium')
     recommendation = models.TextField(blank=True, null=True)  # Khuyến nghị an toàn
-    issued_at = models.DateTimeField(auto_now_add=True)
+    issued_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    notified_at = models.DateTimeField(null=True, blank=True)  # NULL: chưa gửi email cho người theo dõi
+
+    class Meta:
+        indexes = [
+            # fan_out_pending_alerts chỉ đọc các cảnh báo chưa thông báo
+            models.Index(fields=['id'], condition=models.Q(notified_at__isnull=True), name='weather_alert_unnotified_idx'),
+        ]
 
     def __str__(self):
         return f"{self.alert_type.capitalize()} Alert for {self.location.name}"
 
+class AlertRule(models.Model):
+    # Ghi đè/bổ sung luật cảnh báo mặc định trong weather/alert_rules.py theo name
+    MATCH_CHOICES = [
+        ('any', 'Any condition'),
+        ('all', 'All conditions'),
+    ]
+
+    name = models.CharField(max_length=50)
+    country_code = models.CharField(max_length=10, blank=True)  # '' = mọi vùng, 'VN' = ngưỡng riêng cho Việt Nam
+    alert_type = models.CharField(max_length=50)
+    match = models.CharField(max_length=3, choices=MATCH_CHOICES, default='any')
+    conditions = models.JSONField(default=list)  # [["wind_speed", "gt", 20], ["condition", "contains", "storm"]]
+    escalations = models.JSONField(default=list, blank=True)  # [["wind_speed", "gt", 25, "high"]]
+    severity = models.CharField(max_length=20, default='medium')
+    message = models.TextField()  # str.format với {location}, {temperature}, {wind_speed}, ...
+    recommendation = models.TextField(blank=True)
+    fallback = models.BooleanField(default=False)  # chỉ áp dụng khi không có luật nào khác khớp
+    enabled = models.BooleanField(default=True)  # False để tắt luật mặc định cùng tên
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'country_code'], name='unique_alert_rule'),
+        ]
+
+    def clean(self):
+        # Luật lỗi bị bỏ qua khi nạp; báo lỗi ngay trong form admin thay vì để luật không có hiệu lực
+        from .alert_rules import validate_rule
+        try:
+            validate_rule(self.as_definition())
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    def as_definition(self):
+        return {
+            'name': self.name,
+            'alert_type': self.alert_type,
+            'match': self.match,
+            'conditions': self.conditions,
+            'escalations': self.escalations,
+            'severity': self.severity,
+            'message': self.message,
+            'recommendation': self.recommendation,
+            'fallback': self.fallback,
+            'enabled': self.enabled,
+        }
+
+    def __str__(self):
+        return f"{self.name} ({self.country_code or 'global'})"
+
 class UserProfile(AbstractUser):
     favorite_locations = models.ManyToManyField('Location', blank=True)
     notification_settings = models.JSONField(default=dict)
     confirmation_token = models.CharField(max_length=36, null=True, blank=True)  # Token cho reset mật khẩu
+    updated_at = models.DateTimeField(auto_now=True)  # ETag của profile; cũng đổi khi vị trí yêu thích đổi
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -80,14 +201,21 @@ class UserProfile(AbstractUser):
         help_text='Specific permissions for this user.',
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Đăng nhập bằng email (UsernameOrEmailBackend)
+            models.Index(fields=['email'], name='userprofile_email_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
 class NewsArticle(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
-    published_at = models.DateTimeField(default=timezone.now)
+    published_at = models.DateTimeField(default=timezone.now, db_index=True)
     image = models.ImageField(upload_to='news_images/', null=True, blank=True)  # Thêm trường hình ảnh
+    updated_at = models.DateTimeField(auto_now=True)  # dùng cho ETag / Last-Modified
 
     def __str__(self):
         return self.title
@@ -115,12 +243,75 @@ class OpenWeatherMapAPIUsage(models.Model):
         ('current', 'Current Weather'),
         ('forecast', 'Forecast'),
         ('alert', 'Weather Alert'),
+        ('geocode', 'Geocoding'),
     ]
 
-    location = models.ForeignKey(Location, on_delete=models.CASCADE)
-    api_call_time = models.DateTimeField(auto_now_add=True)
-    response_status = models.IntegerField()
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, null=True, blank=True)  # request theo tọa độ/tên không gắn với Location
+    api_call_time = models.DateTimeField(default=timezone.now)  # thời điểm gọi, không phải lúc ghi buffer vào DB
+    response_status = models.IntegerField()  # 0: lỗi mạng/timeout
     request_type = models.CharField(max_length=20, choices=REQUEST_TYPES)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Rollup theo giờ và xóa dữ liệu cũ đều lọc theo thời gian
+            models.Index(fields=['api_call_time'], name='api_usage_call_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.request_type} API call at {self.api_call_time}"
+
+class ApiUsageRollup(models.Model):
+    # Tổng hợp OpenWeatherMapAPIUsage theo giờ và loại request (xem weather/maintenance.py)
+    hour = models.DateTimeField()
+    request_type = models.CharField(max_length=20, choices=OpenWeatherMapAPIUsage.REQUEST_TYPES)
+    calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)  # response_status ngoài 2xx
+    avg_latency_ms = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'request_type'], name='unique_usage_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.request_type} usage at {self.hour}: {self.calls} call(s)"
+
+class OutboundEmail(models.Model):
+    # Hàng đợi email gửi bởi send_queued_mail (xem weather/mail_queue.py)
+    KINDS = [
+        ('alert', 'Weather Alert'),
+        ('password_reset', 'Password Reset'),
+        ('generic', 'Generic'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, null=True, blank=True)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    kind = models.CharField(max_length=20, choices=KINDS, default='generic')
+    digest_key = models.CharField(max_length=100, blank=True)  # các email cùng key được gộp thành một bản tin
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker lấy các email đến hạn: status = 'pending' AND next_attempt_at <= now
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+            # Bản tin đang chờ / nội dung vừa gửi của một digest_key khi xếp hàng
+            models.Index(fields=['digest_key', 'status'], name='outbound_email_digest_idx'),
+        ]
 
     def __str__(self):
-        return f"API Call for {self.location.name} at {self.api_call_time}"
\ No newline at end of file
+        return f"{self.kind} email to {self.to_email} ({self.status})"
@@ -0,0 +1,43 @@
+# weather/pagination.py
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+DEFAULT_PAGINATION = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,  # Giới hạn cứng, page_size lớn hơn sẽ bị cắt
+}
+
+
+def get_pagination_config():
+    config = dict(DEFAULT_PAGINATION)
+    config.update(getattr(settings, 'WEATHER_PAGINATION', {}))
+    return config
+
+
+class KeysetPagination(CursorPagination):
+    """Phân trang theo cursor trên cột thời gian có index: độ trễ không tăng theo số trang."""
+    page_size = DEFAULT_PAGINATION['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = DEFAULT_PAGINATION['MAX_PAGE_SIZE']
+
+    def get_page_size(self, request):
+        # Đọc WEATHER_PAGINATION mỗi request (không cố định lúc import)
+        config = get_pagination_config()
+        self.page_size, self.max_page_size = config['PAGE_SIZE'], config['MAX_PAGE_SIZE']
+        return super().get_page_size(request)
+
+
+class CurrentWeatherPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class ForecastPagination(KeysetPagination):
+    ordering = ('-forecast_time', '-id')
+
+
+class WeatherAlertPagination(KeysetPagination):
+    ordering = ('-issued_at', '-id')
+
+
+class NewsArticlePagination(KeysetPagination):
+    ordering = ('-published_at', '-id')
@@ -0,0 +1,284 @@
+# weather/push.py
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .fast_serializers import fast_alerts, fast_current_weather, fast_forecasts, render_json
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # redis là tùy chọn, chỉ cần cho RedisBroker
+    redis = aioredis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUSH = {
+    'ENABLED': True,
+    # 'auto': 'redis' khi đã đặt WEATHER_REDIS_URL và có package redis, nếu không thì 'memory';
+    # 'memory': chỉ trong process (thay đổi từ refresh_weather/evaluate_alerts/worker khác không tới được stream);
+    # 'redis': qua Redis pub/sub giữa các process; hoặc đường dẫn tới class broker
+    'BROKER': 'auto',
+    'REDIS_URL': 'redis://localhost:6379/0',
+    'CHANNEL': 'weather:push',
+    'HEARTBEAT': 25,  # Giây; comment giữ kết nối qua proxy
+    'MAX_LOCATIONS': 50,  # Số vị trí tối đa mỗi stream
+    'QUEUE_SIZE': 100,  # Client chậm: bỏ event cũ nhất khi hàng đợi đầy
+    'RETRY': 5000,  # ms; EventSource tự kết nối lại sau chừng này
+}
+
+
+def get_push_config():
+    config = dict(DEFAULT_PUSH)
+    config.update(getattr(settings, 'WEATHER_PUSH', {}))
+    return config
+
+
+def sse_frame(kind, data):
+    """Một event SSE đã encode; JSON compact không chứa xuống dòng nên nằm gọn trong một dòng data."""
+    return b"event: " + kind.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class Subscription:
+    """Hàng đợi event của một stream, sống trên event loop của stream đó."""
+
+    def __init__(self, location_ids, loop, maxsize):
+        self.location_ids = set(location_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, frame):
+        # Chỉ gọi trên self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+
+    async def next(self, timeout):
+        """Frame tiếp theo, hoặc None sau timeout giây (để gửi heartbeat)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalHub:
+    """Subscription theo location id trong process; dispatch() an toàn từ mọi thread.
+
+    Frame được encode một lần cho mọi subscriber, stream rảnh chỉ tốn một coroutine đang chờ.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, location_ids):
+        config = get_push_config()
+        subscription = Subscription(location_ids, asyncio.get_running_loop(), config['QUEUE_SIZE'])
+        with self._lock:
+            for location_id in subscription.location_ids:
+                self._subscribers.setdefault(location_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for location_id in subscription.location_ids:
+                subscribers = self._subscribers.get(location_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[location_id]
+
+    def has_subscribers(self, location_id):
+        return location_id in self._subscribers
+
+    def dispatch(self, location_id, frame):
+        with self._lock:
+            subscribers = list(self._subscribers.get(location_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, frame)
+            except RuntimeError:  # loop đã đóng, stream sẽ tự unsubscribe
+                pass
+
+
+class InMemoryBroker:
+    """Fan-out trực tiếp trong process; cũng là broker thay thế khi không có Redis."""
+
+    def __init__(self, hub, config):
+        self.hub = hub
+
+    def wants(self, location_id):
+        # Bỏ qua serialize khi không có ai nghe vị trí này
+        return self.hub.has_subscribers(location_id)
+
+    def publish(self, location_id, frame):
+        self.hub.dispatch(location_id, frame)
+
+    async def start(self):
+        pass
+
+
+class RedisBroker:
+    """Fan-out giữa các process qua Redis pub/sub.
+
+    publish() (sync, từ view/refresh_weather/worker khác) gửi lên một channel chung; mỗi
+    process ASGI có một listener duy nhất chuyển message vào LocalHub của nó.
+    """
+
+    def __init__(self, hub, config):
+        if redis is None:
+            raise ImproperlyConfigured("WEATHER_PUSH['BROKER'] = 'redis' requires the redis package")
+        self.hub = hub
+        self.url = config['REDIS_URL']
+        self.channel = config['CHANNEL']
+        self._client = None
+        self._task = None
+
+    def wants(self, location_id):
+        # Không biết process khác có subscriber hay không
+        return True
+
+    def publish(self, location_id, frame):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        try:
+            self._client.publish(self.channel, b"%d " % location_id + frame)
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish push event for location {location_id}: {e}")
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        location_id, frame = message['data'].split(b" ", 1)
+                        self.hub.dispatch(int(location_id), frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Push listener lost Redis connection: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+BROKERS = {
+    'memory': InMemoryBroker,
+    'redis': RedisBroker,
+}
+
+hub = LocalHub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker_name(config):
+    name = config['BROKER']
+    if name != 'auto':
+        return name
+    if redis is not None and getattr(settings, 'REDIS_URL', ''):
+        return 'redis'
+    logger.warning(
+        "Push events use the in-memory broker: writes from refresh_weather, evaluate_alerts or other "
+        "workers will not reach SSE streams. Set WEATHER_REDIS_URL and install redis to relay them."
+    )
+    return 'memory'
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = get_push_config()
+                name = broker_name(config)
+                broker_class = BROKERS[name] if name in BROKERS else import_string(name)
+                _broker = broker_class(hub, config)
+    return _broker
+
+
+def reset_broker():
+    # Dùng khi đổi cấu hình (test)
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(location_id, kind, build):
+    """Gửi event sau khi transaction commit; build() chỉ chạy khi có người nghe."""
+    if not get_push_config()['ENABLED']:
+        return
+    broker = get_broker()
+    if not broker.wants(location_id):
+        return
+    frame = sse_frame(kind, render_json(build()))
+    transaction.on_commit(lambda: broker.publish(location_id, frame))
+
+
+def _fields(serializer):
+    # location_id đã có trong event, bỏ object location lồng
+    return [entry[0] for entry in serializer.compiled if entry[0] != 'location']
+
+
+def weather_event(location_id, current_weather):
+    return {
+        'location_id': location_id,
+        'weather': fast_current_weather.serialize(current_weather, _fields(fast_current_weather)),
+    }
+
+
+def alerts_event(location_id, created=(), updated=(), deleted=(), reset=False):
+    fields = _fields(fast_alerts)
+    event = {
+        'location_id': location_id,
+        'created': fast_alerts.serialize_many(created, fields),
+        'updated': fast_alerts.serialize_many(updated, fields),
+        'deleted': [alert.pk for alert in deleted],
+    }
+    if reset:
+        # Snapshot khi mới kết nối: client thay toàn bộ danh sách cảnh báo
+        event['reset'] = True
+    return event
+
+
+def forecast_event(location_id, forecasts):
+    return {
+        'location_id': location_id,
+        'forecasts': fast_forecasts.serialize_many(forecasts, _fields(fast_forecasts)),
+    }
+
+
+def publish_weather(current_weather):
+    location_id = current_weather.location_id
+    publish(location_id, 'weather', lambda: weather_event(location_id, current_weather))
+
+
+def publish_alert_changes(reconciliations):
+    """Một event 'alerts' cho mỗi vị trí có thay đổi (dùng cho đường ghi bulk của reconcile_alerts).
+
+    Bản ghi bị xóa đã được publish qua post_delete (QuerySet.delete() vẫn phát signal).
+    """
+    changes = {}
+    for result in reconciliations:
+        for key in ('created', 'updated'):
+            for alert in getattr(result, key):
+                changes.setdefault(alert.location_id, {'created': [], 'updated': []})[key].append(alert)
+    for location_id, change in changes.items():
+        publish(location_id, 'alerts', lambda location_id=location_id, change=change: alerts_event(location_id, **change))
+
+
+def publish_forecasts(location, forecasts):
+    publish(location.pk, 'forecast', lambda: forecast_event(location.pk, forecasts))
@@ -0,0 +1,244 @@
+# weather/refresh.py
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .alert_rules import alert_inputs, engine as rule_engine
+from .models import CurrentWeather, Forecast, Location
+from .singleflight import advisory_lock
+from .utils import (
+    fetch_current_weather, fetch_forecast, reconcile_alerts_batch, save_current_weather, weather_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH = {
+    'FRESH_FOR': 300,  # Dữ liệu dưới 5 phút được coi là mới
+    'STALE_FOR': 900,  # 5-15 phút: vẫn trả về dữ liệu cũ và refresh ở thread nền
+    'REFRESH_ON_STALE': True,  # Request gặp dữ liệu STALE tự kích hoạt refresh, không cần refresh_weather
+    'STALE_REFRESH_WORKERS': 2,
+    'FORECAST_FRESH_FOR': 1800,  # Dự báo đã lưu được dùng lại (chỉ đọc) trong 30 phút
+    'REFRESH_AHEAD': 60,  # Refresh trước khi hết hạn bao nhiêu giây
+    'HOT_WINDOW': 3600,  # Vị trí được request trong 1 giờ qua được coi là "nóng"
+    'TOUCH_INTERVAL': 60,  # Chỉ ghi last_requested_at tối đa mỗi phút một lần
+    'INTERVAL': 30,  # Chu kỳ chạy của refresh_weather
+    'RATE_BUDGET': 50,  # Số request upstream tối đa mỗi phút cho refresh nền
+}
+
+FRESH = 'fresh'
+STALE = 'stale'
+EXPIRED = 'expired'
+
+
+def get_refresh_config():
+    config = dict(DEFAULT_REFRESH)
+    config.update(getattr(settings, 'WEATHER_REFRESH', {}))
+    return config
+
+
+def freshness(current_weather, now=None):
+    """Trạng thái của bản ghi CurrentWeather theo kiểu stale-while-revalidate."""
+    if current_weather is None:
+        return EXPIRED
+    config = get_refresh_config()
+    age = ((now or timezone.now()) - current_weather.timestamp).total_seconds()
+    if age <= config['FRESH_FOR']:
+        return FRESH
+    if age <= config['STALE_FOR']:
+        return STALE
+    return EXPIRED
+
+
+def mark_location_requested(location, now=None):
+    now = now or timezone.now()
+    last = location.last_requested_at
+    if last is None or (now - last).total_seconds() >= get_refresh_config()['TOUCH_INTERVAL']:
+        Location.objects.filter(pk=location.pk).update(last_requested_at=now)
+        location.last_requested_at = now
+
+
+def mark_locations_requested(locations, now=None):
+    # Bản gom nhóm của mark_location_requested: một câu UPDATE cho nhiều vị trí
+    now = now or timezone.now()
+    interval = get_refresh_config()['TOUCH_INTERVAL']
+    stale = [
+        location for location in locations
+        if location.last_requested_at is None or (now - location.last_requested_at).total_seconds() >= interval
+    ]
+    if stale:
+        Location.objects.filter(pk__in=[location.pk for location in stale]).update(last_requested_at=now)
+        for location in stale:
+            location.last_requested_at = now
+
+
+def hot_locations(now=None):
+    now = now or timezone.now()
+    hot_since = now - timedelta(seconds=get_refresh_config()['HOT_WINDOW'])
+    return Location.objects.filter(
+        Q(last_requested_at__gte=hot_since) | Q(userprofile__isnull=False)
+    ).distinct()
+
+
+def due_locations(now=None):
+    """Các vị trí nóng mà dữ liệu sắp hết hạn (hoặc chưa có), cũ nhất trước."""
+    now = now or timezone.now()
+    config = get_refresh_config()
+    due_before = now - timedelta(seconds=config['FRESH_FOR'] - config['REFRESH_AHEAD'])
+    locations = list(hot_locations(now))
+    weather_by_location = {
+        weather.location_id: weather  # giống .first() trong view: bản ghi id nhỏ nhất
+        for weather in CurrentWeather.objects.filter(location__in=locations).order_by('-id')
+    }
+    due = []
+    for location in locations:
+        weather = weather_by_location.get(location.id)
+        if weather is None or weather.timestamp <= due_before:
+            due.append((weather.timestamp if weather else None, location, weather))
+    due.sort(key=lambda item: (item[0] is not None, item[0] or now))
+    return [(location, weather) for _, location, weather in due]
+
+
+class RateBudget:
+    """Token bucket giới hạn số request upstream mỗi phút cho refresh nền."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+
+def refresh_location(location, current_weather=None):
+    from .forecasts import store_forecasts
+
+    weather_data = fetch_current_weather.refresh(location.latitude, location.longitude)
+    forecast_data = fetch_forecast.refresh(location.latitude, location.longitude)
+    if forecast_data:
+        store_forecasts(location, forecast_data)
+    if not weather_data:
+        logger.warning(f"Background refresh failed for {location}")
+        return False
+    save_current_weather(location, current_weather, weather_data)
+    return True
+
+
+def refresh_stale(location_id):
+    """Refresh một vị trí nếu dữ liệu vẫn chưa mới; bỏ qua nếu worker khác đang refresh nó."""
+    with advisory_lock(f"refresh:{location_id}", timeout=0) as acquired:
+        if not acquired and connection.vendor == 'postgresql':
+            return False
+        location = Location.objects.filter(pk=location_id).first()
+        if location is None:
+            return False
+        # Đọc lại: refresh_weather hoặc worker khác có thể vừa cập nhật
+        current_weather = CurrentWeather.objects.filter(location=location).first()
+        if freshness(current_weather) == FRESH:
+            return False
+        return refresh_location(location, current_weather)
+
+
+class StaleRefresher:
+    """Refresh không chặn response cho vị trí có dữ liệu STALE.
+
+    Mỗi vị trí tối đa một lần refresh đang chạy trong process; giữa các worker dùng
+    advisory lock (không chờ) nên chỉ một worker gọi upstream.
+    """
+
+    def __init__(self):
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def schedule(self, location):
+        config = get_refresh_config()
+        if not config['REFRESH_ON_STALE']:
+            return False
+        with self._lock:
+            if location.pk in self._inflight:
+                return False
+            self._inflight.add(location.pk)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=config['STALE_REFRESH_WORKERS'], thread_name_prefix='stale-refresh',
+                )
+        self._executor.submit(self._run, location.pk)
+        return True
+
+    def _run(self, location_id):
+        try:
+            refresh_stale(location_id)
+        except Exception:
+            logger.exception(f"Stale refresh failed for location {location_id}")
+        finally:
+            with self._lock:
+                self._inflight.discard(location_id)
+            connection.close()
+
+
+stale_refresher = StaleRefresher()
+
+
+def run_refresh_pass(budget, governor=None):
+    refreshed = skipped = 0
+    for location, current_weather in due_locations():
+        # Mỗi vị trí tốn 2 request: current weather + forecast.
+        # governor hoãn refresh khi tổng lưu lượng thực tế (kể cả người dùng) gần chạm quota của API key
+        if (governor is not None and not governor.try_acquire(2)) or not budget.try_acquire(2):
+            skipped += 1
+            continue
+        if refresh_location(location, current_weather):
+            refreshed += 1
+    return refreshed, skipped
+
+
+ALERT_CHUNK_SIZE = 1000
+
+
+def run_alert_pass(now=None):
+    """Đánh giá lại cảnh báo cho mọi vị trí đang theo dõi từ dữ liệu đã lưu (không gọi upstream).
+
+    Mỗi lô: 2 query đọc, bộ luật chạy theo cột cho cả lô, một lượt ghi cho các thay đổi.
+    Trả về (số vị trí đã đánh giá, số vị trí có cảnh báo thay đổi).
+    """
+    locations = list(hot_locations(now))
+    evaluated = changed = 0
+    for start in range(0, len(locations), ALERT_CHUNK_SIZE):
+        chunk = locations[start:start + ALERT_CHUNK_SIZE]
+        weather_by_location = {
+            weather.location_id: weather  # giống .first() trong view: bản ghi id nhỏ nhất
+            for weather in CurrentWeather.objects.filter(location__in=chunk).order_by('-id')
+        }
+        max_rain = dict(
+            Forecast.objects.filter(location__in=chunk).values_list('location').annotate(Max('rain_probability'))
+        )
+        tracked, rows = [], []
+        for location in chunk:
+            weather = weather_by_location.get(location.id)
+            if weather is None:
+                continue
+            rain = max_rain.get(location.id)
+            tracked.append(location)
+            rows.append(alert_inputs(weather_snapshot(weather), [{'rain_probability': rain}] if rain is not None else None))
+
+        results = reconcile_alerts_batch(list(zip(tracked, rule_engine.evaluate(tracked, rows))))
+        evaluated += len(tracked)
+        changed += sum(1 for result in results if result.created or result.updated or result.deleted)
+    return evaluated, changed
@@ -0,0 +1,142 @@
+# weather/response_cache.py
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import MemoryLRUBackend, is_shared_cache
+from .conditional import is_not_modified, set_validators
+from .gazetteer import normalize_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',  # Dùng chung giữa các worker qua cache framework
+    # Tắt khi CACHE_ALIAS là LocMem: invalidate ở worker này không xóa được entry của worker khác
+    'REQUIRE_SHARED': True,
+    'KEY_PREFIX': 'weather:response',
+    'ALIAS_ENTRIES': 4096,  # Số input (tọa độ/tên) -> location id giữ trong process
+    'ALIAS_TTL': 3600,
+}
+
+
+def get_response_cache_config():
+    config = dict(DEFAULT_RESPONSE_CACHE)
+    config.update(getattr(settings, 'WEATHER_RESPONSE_CACHE', {}))
+    return config
+
+
+_aliases = None
+
+
+def _get_aliases():
+    global _aliases
+    if _aliases is None:
+        _aliases = MemoryLRUBackend(get_response_cache_config()['ALIAS_ENTRIES'])
+    return _aliases
+
+
+def input_alias(validated_data):
+    """Key cho input của LocationInputSerializer, giống thứ tự ưu tiên của resolve_location."""
+    latitude = validated_data.get('latitude')
+    longitude = validated_data.get('longitude')
+    if latitude and longitude:
+        return f"coord:{round(float(latitude), 4)}:{round(float(longitude), 4)}"
+    name = validated_data.get('name')
+    if name:
+        return f"name:{normalize_name(name)}"
+    return None
+
+
+def remember_alias(alias, location_id):
+    if alias:
+        _get_aliases().set(alias, location_id, get_response_cache_config()['ALIAS_TTL'])
+
+
+def response_key(location_id):
+    return f"{get_response_cache_config()['KEY_PREFIX']}:{location_id}"
+
+
+def generation_key(location_id):
+    return f"{get_response_cache_config()['KEY_PREFIX']}:{location_id}:generation"
+
+
+def _cache():
+    return caches[get_response_cache_config()['CACHE_ALIAS']]
+
+
+def is_enabled():
+    config = get_response_cache_config()
+    return config['ENABLED'] and (not config['REQUIRE_SHARED'] or is_shared_cache(config['CACHE_ALIAS']))
+
+
+def current_generation(location_id):
+    """Thế hệ dữ liệu của vị trí, đổi mỗi lần invalidate; đọc trước khi lấy dữ liệu để truyền cho store_response."""
+    if not is_enabled():
+        return None
+    # Giá trị mới nếu key bị xóa khỏi cache, để mọi entry cũ không còn khớp
+    return _cache().get_or_set(generation_key(location_id), time.time_ns, None)
+
+
+def get_cached_response(alias):
+    """Entry đã render cho input này, hoặc None. Một lần đọc cache, không query DB."""
+    if not alias or not is_enabled():
+        return None
+    location_id = _get_aliases().get(alias)
+    if location_id is None:
+        return None
+    key, generation = response_key(location_id), generation_key(location_id)
+    values = _cache().get_many([key, generation])
+    entry = values.get(key)
+    if entry is None or entry['generation'] != values.get(generation):
+        return None
+    return entry
+
+
+def store_response(location_id, generation, body, etag, last_modified, timestamp, ttl):
+    """Lưu JSON đã render của by_location; entry tự hết hạn khi dữ liệu hết FRESH (ttl do view tính).
+
+    Bỏ qua nếu vị trí đã bị invalidate kể từ lúc đọc generation: body có thể đã cũ.
+    """
+    if generation is None or ttl <= 0 or not is_enabled():
+        return
+    if _cache().get(generation_key(location_id)) != generation:
+        return
+    _cache().set(response_key(location_id), {
+        'etag': etag,
+        'last_modified': last_modified,
+        'timestamp': timestamp.timestamp(),
+        'generation': generation,
+        'body': body,
+    }, int(ttl))
+
+
+def invalidate_location(location_id):
+    def delete():
+        try:
+            cache = _cache()
+            # Đổi generation trước: entry do request đang chạy ghi sau đó cũng không còn được dùng
+            cache.set(generation_key(location_id), time.time_ns(), None)
+            cache.delete(response_key(location_id))
+        except Exception as e:  # Cache lỗi không được làm hỏng việc ghi dữ liệu
+            logger.warning(f"Could not invalidate response cache for location {location_id}: {e}")
+
+    # Xóa sau khi commit để request khác không cache lại dữ liệu cũ trước khi transaction xong
+    transaction.on_commit(delete)
+
+
+def cached_response(request, entry, fresh_for):
+    """Response từ entry đã cache, tôn trọng If-None-Match/If-Modified-Since."""
+    etag, last_modified = entry['etag'], entry['last_modified']
+    if is_not_modified(request, etag, last_modified):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    age = time.time() - entry['timestamp']
+    return set_validators(response, etag, last_modified, fresh_for - age)
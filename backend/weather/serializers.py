@@ -1,7 +1,9 @@
 # weather/serializers.py
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import Location, CurrentWeather, Forecast, NewsArticle, UserProfile, WeatherAlert
+from django.utils import timezone
+from datetime import timedelta
+from .models import Location, CurrentWeather, Forecast, NewsArticle, UserProfile, WeatherAlert, GeocodeEntry
 
 
 
@@ -16,14 +18,86 @@ class LocationInputSerializer(serializers.Serializer):
             raise serializers.ValidationError("Either 'name' or both 'latitude' and 'longitude' must be provided.")
         return data
 
+class EagerLoadingMixin:
+    """Serializer khai báo các quan hệ cần nạp sẵn để viewset tránh N+1 query."""
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+class SparseFieldsMixin:
+    """Cho phép chọn field qua query param ?fields=id,temperature (chỉ áp dụng cho serializer gốc)."""
+    fields_query_param = 'fields'
+
+    def _is_root(self):
+        root = self.root
+        return self is root or (self.parent is root and isinstance(root, serializers.ListSerializer))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self._is_root():
+            return fields
+        requested = request.query_params.get(self.fields_query_param)
+        if requested:
+            allowed = {name.strip() for name in requested.split(',') if name.strip()}
+            for name in list(fields):
+                if name not in allowed:
+                    fields.pop(name)
+        return fields
+
+class HistoryQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    resolution = serializers.ChoiceField(choices=['raw', 'hour', 'day'], default='hour')
+
+    def validate(self, data):
+        # Mặc định: 24 giờ gần nhất
+        end = data.get('end') or timezone.now()
+        start = data.get('start') or end - timedelta(days=1)
+        if start >= end:
+            raise serializers.ValidationError("'start' must be before 'end'.")
+        max_days = self.context.get('max_range_days')
+        if max_days and end - start > timedelta(days=max_days):
+            raise serializers.ValidationError(f"Range must not exceed {max_days} days.")
+        data['start'], data['end'] = start, end
+        return data
+
+class BatchLocationInputSerializer(serializers.Serializer):
+    locations = LocationInputSerializer(many=True, required=False)
+    location_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    favorites = serializers.BooleanField(default=False)  # Thêm tất cả vị trí yêu thích của user
+
+    def validate(self, data):
+        max_locations = self.context.get('max_locations')
+        count = len(data.get('locations', [])) + len(data.get('location_ids', []))
+        if not count and not data.get('favorites'):
+            raise serializers.ValidationError("Provide 'locations', 'location_ids' or 'favorites'.")
+        if max_locations and count > max_locations:
+            raise serializers.ValidationError(f"At most {max_locations} locations per request.")
+        return data
+
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = ['id', 'name', 'latitude', 'longitude', 'country_code']
 
 
-class CurrentWeatherSerializer(serializers.ModelSerializer):
+class PlaceSuggestionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GeocodeEntry
+        fields = ['name', 'latitude', 'longitude', 'country_code']
+
+
+class CurrentWeatherSerializer(EagerLoadingMixin, SparseFieldsMixin, serializers.ModelSerializer):
     location = LocationSerializer(read_only=True)
+    select_related_fields = ['location']
 
 
     class Meta:
@@ -31,8 +105,9 @@ class CurrentWeatherSerializer(serializers.ModelSerializer):
         fields = ['id', 'location', 'temperature', 'humidity', 'wind_speed', 'pressure',
                   'weather_condition', 'icon_url', 'timestamp', 'updated_at']
        
-class ForecastSerializer(serializers.ModelSerializer):
+class ForecastSerializer(EagerLoadingMixin, SparseFieldsMixin, serializers.ModelSerializer):
     location = LocationSerializer(read_only=True)
+    select_related_fields = ['location']
 
 
     class Meta:
@@ -40,7 +115,7 @@ class ForecastSerializer(serializers.ModelSerializer):
         fields = ['id', 'location', 'forecast_type', 'forecast_time', 'high_temperature',
                   'low_temperature', 'rain_probability', 'uv_index']
        
-class NewsArticleSerializer(serializers.ModelSerializer):
+class NewsArticleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = NewsArticle
         fields = ['id', 'title', 'content', 'published_at','image']
@@ -83,14 +158,8 @@ class UserLoginSerializer(serializers.Serializer):
         if not login or not password:
             raise serializers.ValidationError({"non_field_errors": ["Both login and password are required."]})
 
-        # Xác thực bằng username hoặc email
+        # UsernameOrEmailBackend nhận cả username lẫn email trong một lần gọi
         user = authenticate(request=self.context.get('request'), username=login, password=password)
-        if not user and '@' in login:
-            try:
-                user_obj = UserProfile.objects.get(email=login)
-                user = authenticate(request=self.context.get('request'), username=user_obj.username, password=password)
-            except UserProfile.DoesNotExist:
-                user = None
 
         if user is None:
             raise serializers.ValidationError({"non_field_errors": ["Invalid login credentials."]})
@@ -98,8 +167,9 @@ class UserLoginSerializer(serializers.Serializer):
         data['user'] = user
         return data
     
-class WeatherAlertSerializer(serializers.ModelSerializer):
+class WeatherAlertSerializer(EagerLoadingMixin, SparseFieldsMixin, serializers.ModelSerializer):
     location = LocationSerializer(read_only=True)
+    select_related_fields = ['location']
 
     class Meta:
         model = WeatherAlert
@@ -111,6 +181,7 @@ class FavoriteLocationSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'latitude', 'longitude', 'country_code']
 
 # Serializer cho UserProfile (bao gồm vị trí yêu thích và cài đặt thông báo)
+# favorite_locations được nạp sẵn khi xác thực token (authentication.load_token)
 class UserProfileSerializer(serializers.ModelSerializer):
     favorite_locations = FavoriteLocationSerializer(many=True, read_only=True)
 
@@ -0,0 +1,96 @@
+# weather/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .alert_rules import engine as rule_engine
+from .authentication import invalidate_user
+from .history import record_observation
+from .models import AlertRule, CurrentWeather, Location, UserProfile, WeatherAlert
+from .push import alerts_event, publish, publish_weather
+from .response_cache import invalidate_location
+from .subscribers import index as subscriber_index
+
+
+@receiver([post_save, post_delete], sender=CurrentWeather)
+@receiver([post_save, post_delete], sender=WeatherAlert)
+def invalidate_cached_response(sender, instance, **kwargs):
+    # bulk_create/bulk_update không phát signal: reconcile_alerts tự invalidate
+    invalidate_location(instance.location_id)
+
+
+@receiver(post_save, sender=Location)
+def location_changed(sender, instance, created=False, **kwargs):
+    # Response đã cache nhúng tên/tọa độ của vị trí (vd. "Custom Location" được đặt lại tên)
+    if not created:
+        invalidate_location(instance.pk)
+
+
+@receiver(post_save, sender=CurrentWeather)
+def append_observation(sender, instance, **kwargs):
+    # Mọi đường ghi CurrentWeather (by_location, batch, async, refresh_weather) đều lưu lịch sử
+    record_observation(instance)
+
+
+@receiver(post_save, sender=CurrentWeather)
+def push_weather(sender, instance, **kwargs):
+    publish_weather(instance)
+
+
+@receiver(post_save, sender=WeatherAlert)
+@receiver(post_delete, sender=WeatherAlert)
+def push_alert(sender, instance, created=False, **kwargs):
+    # Ghi từng bản ghi (vd. WeatherAlertViewSet); reconcile_alerts tự publish cho đường bulk
+    if kwargs['signal'] is post_delete:
+        change = {'deleted': [instance]}
+    else:
+        change = {'created' if created else 'updated': [instance]}
+    publish(instance.location_id, 'alerts', lambda: alerts_event(instance.location_id, **change))
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def reload_alert_rules(sender, **kwargs):
+    # Worker hiện tại biên dịch lại ngay; worker khác sau RELOAD_INTERVAL
+    rule_engine.reset()
+
+
+SUBSCRIPTION_FIELDS = {'email', 'notification_settings'}
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_locations.through)
+def favorites_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        subscriber_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def subscriber_changed(sender, instance, update_fields=None, **kwargs):
+    # Bỏ qua các lần lưu không liên quan (vd. login chỉ cập nhật last_login)
+    if update_fields is not None and not SUBSCRIPTION_FIELDS & set(update_fields):
+        return
+    subscriber_index.invalidate()
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_locations.through)
+def favorites_changed_for_user(sender, instance, action, reverse, pk_set, **kwargs):
+    # Token cache giữ sẵn danh sách yêu thích của user; profile trả danh sách này nên đổi cả updated_at (ETag)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    user_ids = list(pk_set or ()) if reverse else [instance.pk]
+    UserProfile.objects.filter(pk__in=user_ids).update(updated_at=timezone.now())
+    for user_id in user_ids:
+        invalidate_user(user_id)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Login chỉ cập nhật last_login, không cần bỏ cache
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
@@ -0,0 +1,119 @@
+# weather/singleflight.py
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SINGLE_FLIGHT = {
+    'ADVISORY_LOCK': True,  # Khóa advisory của Postgres để gộp request giữa các worker
+    'WAIT_TIMEOUT': 10,  # Số giây tối đa chờ request đang chạy
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def get_single_flight_config():
+    config = dict(DEFAULT_SINGLE_FLIGHT)
+    config.update(getattr(settings, 'WEATHER_SINGLE_FLIGHT', {}))
+    return config
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời có cùng key thành một lần chạy duy nhất trong process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.event.wait(timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            logger.warning(f"Single-flight wait timed out for {key}, calling upstream directly")
+            return fn()
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+
+def advisory_lock_id(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(key, timeout):
+    """Khóa advisory theo session trên Postgres; bỏ qua nếu DB khác hoặc hết thời gian chờ."""
+    if connection.vendor != 'postgresql':
+        yield False
+        return
+
+    lock_id = advisory_lock_id(key)
+    poll_interval = get_single_flight_config()['POLL_INTERVAL']
+    deadline = time.monotonic() + timeout
+    acquired = False
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+            acquired = cursor.fetchone()[0]
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+    if not acquired:
+        logger.warning(f"Could not acquire advisory lock for {key}")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+_flight = SingleFlight()
+
+
+def coalesce(key, fn, cross_process=True):
+    """Chạy fn một lần cho mỗi key, dùng chung kết quả cho các request đồng thời.
+
+    Trong một worker dùng threading.Event, giữa các worker dùng advisory lock của Postgres.
+    fn nên tự kiểm tra lại cache sau khi có lock để worker đến sau dùng kết quả đã có.
+    """
+    config = get_single_flight_config()
+    timeout = config['WAIT_TIMEOUT']
+
+    def run():
+        if not (cross_process and config['ADVISORY_LOCK']):
+            return fn()
+        with advisory_lock(key, timeout):
+            return fn()
+
+    return _flight.do(key, run, timeout)
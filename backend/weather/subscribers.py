@@ -0,0 +1,139 @@
+# weather/subscribers.py
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import is_shared_cache
+from .mail_queue import enqueue_alert_fanout
+from .models import UserProfile, WeatherAlert
+
+VERSION_KEY = 'weather:subscribers:version'
+
+DEFAULT_SUBSCRIBERS = {
+    'LOCAL_MAX_AGE': 60,  # Cache không dùng chung (LocMem): dựng lại index sau chừng này giây
+    'BATCH_SIZE': 1000,  # Số cảnh báo chưa thông báo xử lý mỗi transaction
+}
+
+
+def get_subscribers_config():
+    config = dict(DEFAULT_SUBSCRIBERS)
+    config.update(getattr(settings, 'WEATHER_SUBSCRIBERS', {}))
+    return config
+
+_bits = {}
+_bits_lock = threading.Lock()
+
+
+def alert_bit(alert_type):
+    # Mỗi loại cảnh báo một bit (cấp phát khi gặp lần đầu, kể cả loại mới từ AlertRule)
+    bit = _bits.get(alert_type)
+    if bit is None:
+        with _bits_lock:
+            bit = _bits.setdefault(alert_type, 1 << len(_bits))
+    return bit
+
+
+def pack_flags(notification_settings):
+    flags = 0
+    for alert_type, enabled in (notification_settings or {}).items():
+        if enabled:
+            flags |= alert_bit(alert_type)
+    return flags
+
+
+class SubscriberIndex:
+    """Index Location -> user đã thêm vào yêu thích, kèm notification_settings đóng gói thành bitmask.
+
+    Dựng lại (2 query) khi danh sách yêu thích hoặc cài đặt thông báo thay đổi ở bất kỳ worker nào:
+    phiên bản được lưu trong cache dùng chung. Với LocMem, thay đổi ở process khác không thấy được
+    nên index được dựng lại sau LOCAL_MAX_AGE giây.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = 0.0
+        self._locations = None  # {location_id: (user_ids, flags)}
+        self._emails = None  # {user_id: email}
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        with self._lock:
+            self._locations = None
+
+    def _build(self):
+        through = UserProfile.favorite_locations.through
+        user_ids_by_location = {}
+        for location_id, user_id in through.objects.values_list('location_id', 'userprofile_id'):
+            user_ids_by_location.setdefault(location_id, []).append(user_id)
+        user_ids = {user_id for ids in user_ids_by_location.values() for user_id in ids}
+        emails, flags = {}, {}
+        for user_id, email, notification_settings in UserProfile.objects.filter(id__in=user_ids).values_list(
+            'id', 'email', 'notification_settings'
+        ):
+            emails[user_id] = email
+            flags[user_id] = pack_flags(notification_settings)
+        locations = {
+            location_id: (tuple(ids), tuple(flags.get(user_id, 0) for user_id in ids))
+            for location_id, ids in user_ids_by_location.items()
+        }
+        return locations, emails
+
+    def _current_version(self):
+        if is_shared_cache():
+            # Giá trị mới nếu key bị xóa khỏi cache, để mọi worker dựng lại thay vì dùng index cũ
+            return cache.get_or_set(VERSION_KEY, time.time_ns, None)
+        if time.monotonic() - self._built_at >= get_subscribers_config()['LOCAL_MAX_AGE']:
+            return object()  # khác mọi phiên bản trước: buộc dựng lại
+        return self._version
+
+    def snapshot(self):
+        version = self._current_version()
+        with self._lock:
+            if self._locations is None or self._version != version:
+                self._locations, self._emails = self._build()
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._locations, self._emails
+
+    def subscribers(self, location_id, alert_type, snapshot=None):
+        """(user_id, email) của các user theo dõi vị trí và bật thông báo cho loại cảnh báo này."""
+        locations, emails = snapshot or self.snapshot()
+        user_ids, flags = locations.get(location_id, ((), ()))
+        bit = alert_bit(alert_type)
+        return [(user_id, emails[user_id]) for user_id, user_flags in zip(user_ids, flags) if user_flags & bit]
+
+
+index = SubscriberIndex()
+
+
+def fan_out_pending_alerts(now=None):
+    """Gửi thông báo cho các cảnh báo chưa thông báo (mới, hoặc đổi mức độ) tới user theo dõi vị trí.
+
+    Chạy ở tiến trình nền (evaluate_alerts, refresh_weather), không trong request. Các dòng được
+    khóa SKIP LOCKED nên nhiều tiến trình chạy cùng lúc không gửi trùng. Trả về số user được thông báo.
+    """
+    now = now or timezone.now()
+    batch_size = get_subscribers_config()['BATCH_SIZE']
+    notified_users = set()
+    while True:
+        with transaction.atomic():
+            alerts = list(
+                WeatherAlert.objects.select_for_update(skip_locked=True)
+                .filter(notified_at__isnull=True).order_by('id')[:batch_size]
+            )
+            if not alerts:
+                return len(notified_users)
+            alerts_by_user = {}
+            snapshot = index.snapshot()  # một lần kiểm tra phiên bản cho cả lô
+            for alert in alerts:
+                for user_id, email in index.subscribers(alert.location_id, alert.alert_type, snapshot):
+                    alerts_by_user.setdefault(user_id, (email, []))[1].append(alert)
+            if alerts_by_user:
+                enqueue_alert_fanout(alerts_by_user)
+            WeatherAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=now)
+        notified_users.update(alerts_by_user)
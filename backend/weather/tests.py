@@ -1,3 +1,1598 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .cache import (
+    DjangoCacheBackend, MemoryLRUBackend, cached_upstream, coordinate_key, is_shared_cache, query_key,
+    reset_upstream_cache,
+)
+from . import fast_serializers
+from .alert_rules import DEFAULT_ALERT_RULES, RuleSet, alert_inputs, engine as rule_engine, to_columns
+from .async_utils import _cached_call
+from .backends import UsernameOrEmailBackend
+from .authentication import LazyUser, TokenCache, load_token
+from .fast_serializers import render_json
+from .forecasts import get_forecasts, store_forecasts
+from .history import observation_series
+from .mail_queue import claim_due, enqueue_alert_fanout, enqueue_mail, get_mail_queue_config, send_queued_mail
+from .gazetteer import PrefixIndex, index as place_index
+from .geo import find_or_create_location, has_location_input
+from .maintenance import prune_expired, rollup_api_usage
+from .models import (
+    AlertRule, ApiUsageRollup, CurrentWeather, Forecast, GeocodeEntry, Location, NewsArticle, OpenWeatherMapAPIUsage,
+    OutboundEmail, UserProfile, WeatherAlert, WeatherObservation,
+)
+from . import response_cache
+from . import push
+from .async_views import event_stream
+from .push import InMemoryBroker, LocalHub, broker_name, hub as push_hub
+from .refresh import EXPIRED, FRESH, STALE, StaleRefresher, freshness, refresh_stale
+from .http import JitteredRetry, get_session, reset_session, upstream_get
+from .subscribers import SubscriberIndex, fan_out_pending_alerts
+from .throttling import LoginThrottle
+from .singleflight import SingleFlight, advisory_lock, advisory_lock_id
+from . import usage
+from .usage import QuotaGovernor, UsageRecorder, calls_last_minute
+from .management.commands.benchmark_forecast import build_response
+from .utils import (
+    aggregate_forecast, forecast_columns, parse_forecast, parse_forecast_batch, reconcile_alerts,
+    reconcile_alerts_batch,
+)
+
+
+def make_location(name='Hanoi', latitude='21.0285000', longitude='105.8542000', country_code='VN', **kwargs):
+    return Location.objects.create(
+        name=name, latitude=Decimal(latitude), longitude=Decimal(longitude), country_code=country_code, **kwargs,
+    )
+
+
+WEATHER_DATA = {
+    'temperature': Decimal('30.00'), 'humidity': Decimal('70.00'), 'wind_speed': Decimal('3.00'),
+    'pressure': Decimal('1010.00'), 'weather_condition': 'Clouds', 'icon_url': 'http://example.com/04d.png',
+}
+
+
+def make_weather(location, age=0, **overrides):
+    data = {**WEATHER_DATA, **overrides}
+    return CurrentWeather.objects.create(location=location, timestamp=timezone.now() - timedelta(seconds=age), **data)
+
+
+class MemoryLRUBackendTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = MemoryLRUBackend(max_entries=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entries_are_dropped(self):
+        cache = MemoryLRUBackend()
+        with mock.patch('weather.cache.time.monotonic', return_value=100):
+            cache.set('a', 1, 10)
+        with mock.patch('weather.cache.time.monotonic', return_value=109):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('weather.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+
+@override_settings(WEATHER_UPSTREAM_CACHE={'BACKEND': 'memory'})
+class CachedUpstreamTests(SimpleTestCase):
+    def setUp(self):
+        reset_upstream_cache()
+        self.addCleanup(reset_upstream_cache)
+
+    def test_hits_upstream_once_per_key(self):
+        calls = []
+
+        @cached_upstream('current', coordinate_key)
+        def fetch(lat, lon):
+            calls.append((lat, lon))
+            return {'temperature': 30}
+
+        self.assertEqual(fetch(10.7626, 106.6601), {'temperature': 30})
+        # Cùng ô lưới sau khi làm tròn 2 chữ số
+        self.assertEqual(fetch(10.7649, 106.6598), {'temperature': 30})
+        fetch(21.0285, 105.8542)
+        self.assertEqual(len(calls), 2)
+
+    def test_failures_are_not_cached(self):
+        results = [None, {'name': 'Hanoi'}]
+
+        @cached_upstream('geocode', query_key)
+        def fetch(name):
+            return results.pop(0)
+
+        self.assertIsNone(fetch('Hanoi'))
+        self.assertEqual(fetch(' hanoi '), {'name': 'Hanoi'})
+        self.assertEqual(results, [])
+
+    def test_refresh_bypasses_and_overwrites_cache(self):
+        values = [{'v': 1}, {'v': 2}]
+
+        @cached_upstream('current', coordinate_key)
+        def fetch(lat, lon):
+            return values.pop(0)
+
+        self.assertEqual(fetch(1, 2), {'v': 1})
+        self.assertEqual(fetch.refresh(1, 2), {'v': 2})
+        self.assertEqual(fetch(1, 2), {'v': 2})
+
+
+    def test_empty_results_are_not_cached(self):
+        results = [[], [], [{'forecast_type': 'short'}]]
+
+        @cached_upstream('forecast', coordinate_key)
+        def fetch(lat, lon):
+            return results.pop(0)
+
+        self.assertEqual(fetch(1, 2), [])
+        self.assertEqual(fetch.refresh(1, 2), [])
+        self.assertEqual(fetch(1, 2), [{'forecast_type': 'short'}])
+        self.assertEqual(fetch(1, 2), [{'forecast_type': 'short'}])
+        self.assertEqual(results, [])
+
+    def test_async_empty_results_are_not_cached(self):
+        results = [[], [{'forecast_type': 'short'}]]
+
+        async def load():
+            return results.pop(0)
+
+        async def fetch_repeatedly():
+            key = coordinate_key('forecast', 1, 2)
+            return [await _cached_call('forecast', key, load) for _ in range(3)]
+
+        self.assertEqual(async_to_sync(fetch_repeatedly)(), [[], [{'forecast_type': 'short'}], [{'forecast_type': 'short'}]])
+
+class SharedCacheDetectionTests(SimpleTestCase):
+    def test_locmem_is_not_shared(self):
+        self.assertFalse(is_shared_cache('default'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'weather_cache'}})
+    def test_database_cache_is_shared(self):
+        self.assertTrue(is_shared_cache('default'))
+
+    def test_django_backend_round_trip(self):
+        backend = DjangoCacheBackend('default')
+        backend.set('weather-test-key', {'a': 1}, 60)
+        self.assertEqual(backend.get('weather-test-key'), {'a': 1})
+        backend.delete('weather-test-key')
+        self.assertIsNone(backend.get('weather-test-key'))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', slow, timeout=5)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow, timeout=5)))
+                     for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.2)  # để các follower kịp chờ trên lời gọi đang chạy
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_error_is_raised_and_key_released(self):
+        flight = SingleFlight()
+
+        def boom():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            flight.do('k', boom)
+        self.assertEqual(flight.do('k', lambda: 42), 42)
+
+
+class AdvisoryLockTests(TestCase):
+    def test_lock_is_acquired_and_released(self):
+        with advisory_lock('weather-test', timeout=1) as acquired:
+            self.assertTrue(acquired)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND objid = %s",
+                    [advisory_lock_id('weather-test') & 0xFFFFFFFF],
+                )
+                self.assertEqual(cursor.fetchone()[0], 1)
+        with advisory_lock('weather-test', timeout=1) as acquired:
+            self.assertTrue(acquired)
+
+
+class StubUpstream:
+    """Server HTTP/1.1 cục bộ trả về lần lượt các status trong script (hết script thì 200)."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # giữ kết nối để kiểm tra keep-alive
+
+            def do_GET(self):
+                stub.requests.append((self.client_address[1], self.path))
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                body = json.dumps({'status': status}).encode()
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class UpstreamClientTests(SimpleTestCase):
+    def setUp(self):
+        reset_session()
+        self.addCleanup(reset_session)
+
+    def client_settings(self, stub, **overrides):
+        config = {'BASE_URL': stub.url, 'BACKOFF_FACTOR': 0.05, 'BACKOFF_JITTER': 0, 'MAX_RETRIES': 2}
+        config.update(overrides)
+        return override_settings(WEATHER_HTTP_CLIENT=config)
+
+    def test_retries_transient_errors(self):
+        with StubUpstream([503, 502]) as stub, self.client_settings(stub):
+            response = upstream_get('/data/2.5/weather', {'q': 'Hanoi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stub.requests), 3)
+        self.assertTrue(stub.requests[0][1].startswith('/data/2.5/weather?q=Hanoi'))
+
+    def test_gives_up_after_max_retries(self):
+        with StubUpstream([500] * 5) as stub, self.client_settings(stub):
+            response = upstream_get('/data/2.5/weather')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_backoff_grows_between_retries(self):
+        with StubUpstream([503, 503, 503]) as stub, self.client_settings(stub, MAX_RETRIES=3, BACKOFF_FACTOR=0.1):
+            started = time.monotonic()
+            upstream_get('/data/2.5/weather')
+            elapsed = time.monotonic() - started
+        # urllib3: 0 trước retry đầu, sau đó 0.1 * 2, 0.1 * 4
+        self.assertGreaterEqual(elapsed, 0.6)
+        self.assertEqual(len(stub.requests), 4)
+
+    def test_retry_after_on_429(self):
+        with StubUpstream([429]) as stub, self.client_settings(stub):
+            self.assertEqual(upstream_get('/data/2.5/weather').status_code, 200)
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_reuses_connection(self):
+        with StubUpstream() as stub, self.client_settings(stub):
+            for _ in range(5):
+                self.assertEqual(upstream_get('/data/2.5/weather').status_code, 200)
+        self.assertEqual(len({port for port, _ in stub.requests}), 1)
+        self.assertIs(get_session(), get_session())
+
+    def test_connection_error_returns_none(self):
+        stub = StubUpstream()
+        stub.server.server_close()  # cổng không còn nghe
+        with self.client_settings(stub, MAX_RETRIES=0):
+            self.assertIsNone(upstream_get('/data/2.5/weather'))
+
+    def test_jitter_is_bounded(self):
+        retry = JitteredRetry(total=5, backoff_factor=0.1, jitter=0.2)
+        for _ in range(3):
+            retry = retry.increment(method='GET', url='/x', error=ConnectionError())
+        backoff = retry.get_backoff_time()
+        self.assertGreaterEqual(backoff, 0.4)
+        self.assertLessEqual(backoff, 0.6)
+
+
+@override_settings(WEATHER_RESPONSE_CACHE={'ENABLED': False})
+class StaleRefreshTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+
+    def test_freshness_states(self):
+        self.assertEqual(freshness(None), EXPIRED)
+        self.assertEqual(freshness(make_weather(self.location, age=60)), FRESH)
+        self.assertEqual(freshness(make_weather(self.location, age=600)), STALE)
+        self.assertEqual(freshness(make_weather(self.location, age=1200)), EXPIRED)
+
+    def test_stale_row_is_served_and_refreshed_in_background(self):
+        make_weather(self.location, age=600, temperature=Decimal('25.00'))
+        with mock.patch('weather.views.stale_refresher.schedule') as schedule, \
+                mock.patch('weather.views.fetch_current_weather') as fetch_current, \
+                mock.patch('weather.views.fetch_forecast', return_value=[]):
+            response = APIClient().post('/api/current/by_location/', {'latitude': 21.0285, 'longitude': 105.8542},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['weather']['temperature'], '25.00')
+        fetch_current.assert_not_called()  # không chặn response
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args[0][0].pk, self.location.pk)
+
+    def test_schedule_deduplicates_per_location(self):
+        refresher = StaleRefresher()
+        refresher._executor = mock.Mock()
+        self.assertTrue(refresher.schedule(self.location))
+        self.assertFalse(refresher.schedule(self.location))
+        self.assertEqual(refresher._executor.submit.call_count, 1)
+
+    @override_settings(WEATHER_REFRESH={'REFRESH_ON_STALE': False})
+    def test_schedule_can_be_disabled(self):
+        refresher = StaleRefresher()
+        refresher._executor = mock.Mock()
+        self.assertFalse(refresher.schedule(self.location))
+        refresher._executor.submit.assert_not_called()
+
+    def test_refresh_stale_updates_row(self):
+        weather = make_weather(self.location, age=600)
+        with mock.patch('weather.refresh.fetch_current_weather') as fetch_current, \
+                mock.patch('weather.refresh.fetch_forecast') as fetch_forecast:
+            fetch_current.refresh.return_value = {**WEATHER_DATA, 'temperature': Decimal('31.50')}
+            fetch_forecast.refresh.return_value = []
+            self.assertTrue(refresh_stale(self.location.pk))
+        weather.refresh_from_db()
+        self.assertEqual(weather.temperature, Decimal('31.50'))
+        self.assertEqual(freshness(weather), FRESH)
+
+    def test_refresh_stale_skips_rows_refreshed_meanwhile(self):
+        make_weather(self.location, age=10)
+        with mock.patch('weather.refresh.fetch_current_weather') as fetch_current:
+            self.assertFalse(refresh_stale(self.location.pk))
+        fetch_current.refresh.assert_not_called()
+
+
+def forecast_item(forecast_type, hours, high='31.00', rain='20.00'):
+    slot = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=hours)
+    return {
+        'forecast_type': forecast_type, 'forecast_time': slot, 'high_temperature': Decimal(high),
+        'low_temperature': Decimal('24.00'), 'rain_probability': Decimal(rain), 'uv_index': Decimal('5.00'),
+    }
+
+
+class ForecastStoreTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+
+    def test_upsert_keeps_rows_and_drops_missing_slots(self):
+        store_forecasts(self.location, [forecast_item('short', 3), forecast_item('short', 6), forecast_item('daily', 24)])
+        ids = dict(Forecast.objects.values_list('forecast_time', 'id'))
+
+        store_forecasts(self.location, [forecast_item('short', 3, high='33.00'), forecast_item('daily', 24)])
+        stored = list(Forecast.objects.order_by('forecast_time'))
+        self.assertEqual(len(stored), 2)
+        self.assertEqual([f.id for f in stored], [ids[f.forecast_time] for f in stored])
+        self.assertEqual(stored[0].high_temperature, Decimal('33.00'))
+
+    def test_fresh_forecasts_are_read_without_upstream_call(self):
+        store_forecasts(self.location, [forecast_item('short', 3), forecast_item('daily', 24)])
+        with mock.patch('weather.forecasts.fetch_forecast') as fetch, self.assertNumQueries(2):
+            forecasts = get_forecasts(self.location, 'daily')
+        fetch.assert_not_called()
+        self.assertEqual([f.forecast_type for f in forecasts], ['daily'])
+
+    def test_expired_forecasts_are_refetched(self):
+        store_forecasts(self.location, [forecast_item('short', 3)])
+        Forecast.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        with mock.patch('weather.forecasts.fetch_forecast', return_value=[forecast_item('short', 3, high='35.00')]):
+            forecasts = get_forecasts(self.location)
+        self.assertEqual(forecasts[0].high_temperature, Decimal('35.00'))
+
+    def test_old_forecasts_are_kept_when_upstream_fails(self):
+        store_forecasts(self.location, [forecast_item('short', 3)])
+        Forecast.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        with mock.patch('weather.forecasts.fetch_forecast', return_value=None):
+            self.assertEqual(len(get_forecasts(self.location)), 1)
+        with mock.patch('weather.forecasts.fetch_forecast', return_value=None):
+            self.assertIsNone(get_forecasts(make_location(name='Hue', latitude='16.4637', longitude='107.5909')))
+
+
+def loop_forecast(data):
+    # Cách tổng hợp cũ bằng vòng lặp từng item, đổi sang ngày theo múi giờ của vị trí để so sánh
+    tz = dt_timezone(timedelta(seconds=data['city']['timezone']))
+    items = sorted(data['list'], key=lambda item: item['dt'])
+    forecasts = [{
+        'forecast_type': 'short', 'forecast_time': datetime.fromtimestamp(item['dt'], tz),
+        'high_temperature': item['main']['temp_max'], 'low_temperature': item['main']['temp_min'],
+        'rain_probability': item.get('pop', 0) * 100, 'uv_index': item.get('uvi', 0),
+    } for item in items[:8]]
+    daily = {}
+    for item in items:
+        day = datetime.fromtimestamp(item['dt'], tz).date()
+        if day not in daily:
+            daily[day] = {
+                'forecast_type': 'daily', 'forecast_time': datetime.fromtimestamp(item['dt'], tz),
+                'high_temperature': item['main']['temp_max'], 'low_temperature': item['main']['temp_min'],
+                'rain_probability': item.get('pop', 0) * 100, 'uv_index': item.get('uvi', 0),
+            }
+        else:
+            daily[day]['high_temperature'] = max(daily[day]['high_temperature'], item['main']['temp_max'])
+            daily[day]['low_temperature'] = min(daily[day]['low_temperature'], item['main']['temp_min'])
+            daily[day]['rain_probability'] = max(daily[day]['rain_probability'], item.get('pop', 0) * 100)
+    return forecasts + list(daily.values())
+
+
+class ForecastAggregationTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.responses = [build_response(40, rng) for _ in range(5)]
+
+    def test_daily_rows_follow_city_timezone(self):
+        # 14:00 và 17:00 UTC ngày 1/1: cùng một ngày theo UTC, nhưng 17:00 UTC đã là 00:00 ngày 2/1 ở Hà Nội
+        start = int(datetime(2026, 1, 1, 14, tzinfo=dt_timezone.utc).timestamp())
+        items = [{'dt': start + 10800 * i, 'main': {'temp_max': 30 + i, 'temp_min': 20 - i}} for i in range(2)]
+
+        utc = [f for f in parse_forecast({'city': {'timezone': 0}, 'list': items}) if f['forecast_type'] == 'daily']
+        hanoi = [f for f in parse_forecast({'city': {'timezone': 25200}, 'list': items}) if f['forecast_type'] == 'daily']
+
+        self.assertEqual([(f['high_temperature'], f['low_temperature']) for f in utc], [(31, 19)])
+        self.assertEqual([(f['high_temperature'], f['low_temperature']) for f in hanoi], [(30, 20), (31, 19)])
+        self.assertEqual(hanoi[1]['forecast_time'].utcoffset(), timedelta(hours=7))
+
+    def test_unsorted_slots_are_sorted_before_grouping(self):
+        data = self.responses[0]
+        shuffled = dict(data, list=random.Random(7).sample(data['list'], len(data['list'])))
+
+        self.assertEqual(forecast_columns(shuffled)['dt'], sorted(item['dt'] for item in data['list']))
+        self.assertEqual(parse_forecast(shuffled), parse_forecast(data))
+
+    def test_matches_per_item_loop(self):
+        for data in self.responses:
+            forecasts = parse_forecast(data)
+            self.assertEqual([f for f in forecasts if f['forecast_type'] != 'weekly'], loop_forecast(data))
+
+            weekly = forecasts[-1]
+            items = data['list']
+            self.assertEqual(weekly['forecast_type'], 'weekly')
+            self.assertEqual(weekly['high_temperature'], max(item['main']['temp_max'] for item in items))
+            self.assertEqual(weekly['low_temperature'], min(item['main']['temp_min'] for item in items))
+            self.assertEqual(weekly['rain_probability'], max(item['pop'] * 100 for item in items))
+
+    def test_weekly_row_is_anchored_to_local_midnight(self):
+        # 03:00 UTC = 10:00 giờ Hà Nội; refresh sau 3 giờ vẫn phải cập nhật cùng một dòng weekly
+        start = int(datetime(2026, 1, 1, 3, tzinfo=dt_timezone.utc).timestamp())
+        items = [{'dt': start + 10800 * i, 'main': {'temp_max': 30, 'temp_min': 20}} for i in range(16)]
+        hanoi = dt_timezone(timedelta(hours=7))
+
+        weekly = parse_forecast({'city': {'timezone': 25200}, 'list': items})[-1]
+        refreshed = parse_forecast({'city': {'timezone': 25200}, 'list': items[1:]})[-1]
+
+        self.assertEqual(weekly['forecast_time'], datetime(2026, 1, 1, tzinfo=hanoi))
+        self.assertEqual(refreshed['forecast_time'], weekly['forecast_time'])
+
+    def test_batch_matches_per_location_results(self):
+        responses = [self.responses[0], None, self.responses[1], {'list': []}, self.responses[2]]
+
+        self.assertEqual(parse_forecast_batch(responses), [
+            parse_forecast(self.responses[0]), None, parse_forecast(self.responses[1]), [],
+            parse_forecast(self.responses[2]),
+        ])
+        self.assertEqual(aggregate_forecast(forecast_columns({'list': []})), [])
+
+
+def alert_data(alert_type='storm', severity='high', message='Wind 80 km/h'):
+    return {'alert_type': alert_type, 'message': message, 'severity': severity, 'recommendation': 'Stay indoors'}
+
+
+class AlertReconcileTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+
+    def test_creates_updates_in_place_and_deletes(self):
+        reconcile_alerts(self.location, [alert_data(), alert_data('fog', 'medium', 'Visibility 200 m')])
+        storm = WeatherAlert.objects.get(alert_type='storm')
+
+        result = reconcile_alerts(self.location, [alert_data(message='Wind 95 km/h')])
+        self.assertEqual((len(result.created), len(result.updated), len(result.deleted)), (0, 1, 1))
+        refreshed = WeatherAlert.objects.get()
+        self.assertEqual(refreshed.pk, storm.pk)
+        self.assertEqual(refreshed.issued_at, storm.issued_at)
+        self.assertEqual(refreshed.message, 'Wind 95 km/h')
+
+    def test_duplicate_rows_are_collapsed(self):
+        first = WeatherAlert.objects.create(location=self.location, **alert_data())
+        WeatherAlert.objects.create(location=self.location, **alert_data())
+        result = reconcile_alerts(self.location, [alert_data()])
+        self.assertEqual(len(result.deleted), 1)
+        self.assertEqual(list(WeatherAlert.objects.values_list('pk', flat=True)), [first.pk])
+
+    def test_unchanged_alerts_issue_a_single_read(self):
+        reconcile_alerts(self.location, [alert_data()])
+        with self.assertNumQueries(1):
+            result = reconcile_alerts(self.location, [alert_data()])
+        self.assertFalse(result.created or result.updated or result.deleted)
+        self.assertEqual(len(result.alerts), 1)
+
+    def test_batch_reads_once_for_all_locations(self):
+        other = make_location(name='Hue', latitude='16.4637000', longitude='107.5909000')
+        reconcile_alerts_batch([(self.location, [alert_data()]), (other, [alert_data('fog', 'low')])])
+        with self.assertNumQueries(1):
+            results = reconcile_alerts_batch([(self.location, [alert_data()]), (other, [alert_data('fog', 'low')])])
+        self.assertEqual([len(result.alerts) for result in results], [1, 1])
+
+
+@override_settings(WEATHER_RESPONSE_CACHE={'ENABLED': False})
+class LocationInputTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_has_location_input(self):
+        self.assertTrue(has_location_input({'name': 'Hanoi'}))
+        self.assertTrue(has_location_input({'latitude': Decimal('21.0'), 'longitude': Decimal('105.8')}))
+        self.assertFalse(has_location_input({'latitude': Decimal('21.0')}))
+        self.assertFalse(has_location_input({}))
+
+    def test_missing_input_is_a_bad_request(self):
+        for url in ('/api/current/by_location/', '/api/alerts/by_location/', '/api/async/current/by_location/'):
+            response = self.client.post(url, {}, format='json')
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_failed_geocode_is_not_found(self):
+        with mock.patch('weather.geo.geocode_location', return_value=None):
+            response = self.client.post('/api/current/by_location/', {'name': 'Atlantis'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Could not find location'})
+
+        with mock.patch('weather.async_views.ageocode_location', new=mock.AsyncMock(return_value=None)):
+            response = self.client.post('/api/async/current/by_location/', {'name': 'Atlantis'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_coalesced_callers_get_their_own_instance(self):
+        shared = make_location()
+        with mock.patch('weather.geo.coalesce', return_value=shared):
+            location = find_or_create_location(shared.latitude, shared.longitude)
+        self.assertIsNot(location, shared)
+        self.assertEqual(location.pk, shared.pk)
+
+
+def geocode_entry(name, population=0, save=True):
+    entry = GeocodeEntry(
+        normalized_name=name.lower(), name=name, latitude=Decimal('21.0'), longitude=Decimal('105.8'),
+        population=population,
+    )
+    if save:
+        entry.save()
+    return entry
+
+
+class PlaceIndexTests(TestCase):
+    def setUp(self):
+        place_index.reset()
+        self.addCleanup(place_index.reset)
+
+    def test_autocomplete_limit_is_clamped(self):
+        geocode_entry('Hanoi', 8000000)
+        geocode_entry('Hai Phong', 2000000)
+        client = APIClient()
+        for limit, expected in (('0', 1), ('-5', 1), ('1000', 2)):
+            response = client.get('/api/places/autocomplete/', {'q': 'ha', 'limit': limit})
+            self.assertEqual(len(response.json()), expected, limit)
+        self.assertEqual(client.get('/api/places/autocomplete/', {'q': 'ha', 'limit': 'x'}).status_code, 400)
+
+    def test_concurrent_ensure_loaded_loads_once(self):
+        places = PrefixIndex()
+        calls = []
+
+        def slow_load():
+            calls.append(1)
+            time.sleep(0.05)
+            places._loaded = True
+
+        with mock.patch.object(places, '_load', side_effect=slow_load):
+            threads = [threading.Thread(target=places.ensure_loaded) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_entries_added_during_load_are_kept(self):
+        places = PrefixIndex()
+        existing, added = geocode_entry('Hanoi', save=False), geocode_entry('Hue', save=False)
+
+        def rows(chunk_size):
+            yield existing
+            places.add(added)  # request khác ghi entry mới trong lúc đang nạp
+
+        with mock.patch('weather.gazetteer.GeocodeEntry.objects') as objects:
+            objects.only.return_value.iterator.side_effect = rows
+            places.load()
+        self.assertIs(places.get('hue'), added)
+        self.assertIs(places.get('hanoi'), existing)
+
+
+def geocode_result(name, latitude, longitude):
+    return {'name': name, 'latitude': Decimal(latitude), 'longitude': Decimal(longitude), 'country_code': 'VN'}
+
+
+@override_settings(WEATHER_RESPONSE_CACHE={'ENABLED': False})
+class BatchWeatherTests(TestCase):
+    def setUp(self):
+        place_index.reset()
+        self.addCleanup(place_index.reset)
+        self.client = APIClient()
+
+    def test_unknown_names_are_geocoded_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=2)
+        places = {'Hue': geocode_result('Hue', '16.4637', '107.5909'), 'Vinh': geocode_result('Vinh', '18.6796', '105.6813')}
+
+        def geocode(name):
+            barrier.wait()  # lỗi BrokenBarrierError nếu hai tên được geocode lần lượt
+            return places[name]
+
+        with mock.patch('weather.batch.fetch_geocode', side_effect=geocode) as fetch, \
+                mock.patch('weather.batch.fetch_current_weather', return_value=dict(WEATHER_DATA)), \
+                mock.patch('weather.batch.fetch_forecast', return_value=[]):
+            response = self.client.post(
+                '/api/current/batch/', {'locations': [{'name': 'Hue'}, {'name': 'Vinh'}, {'name': 'Hue'}]}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(
+            sorted(entry['location']['name'] for entry in response.json()['results']), ['Hue', 'Vinh'],
+        )
+        self.assertEqual(GeocodeEntry.objects.count(), 2)
+
+    def test_failed_geocode_is_reported_once(self):
+        with mock.patch('weather.batch.fetch_geocode', return_value=None) as fetch, \
+                mock.patch('weather.utils.fetch_geocode') as serial_fetch:
+            response = self.client.post('/api/current/batch/', {'locations': [{'name': 'Atlantis'}]}, format='json')
+        self.assertEqual(fetch.call_count, 1)
+        serial_fetch.assert_not_called()
+        self.assertEqual(response.json(), {'results': [], 'not_found': ['Atlantis']})
+
+    def test_error_and_success_entries_share_keys(self):
+        fresh, missing = make_location(), make_location(name='Hue', latitude='16.4637000', longitude='107.5909000')
+        make_weather(fresh)
+        with mock.patch('weather.batch.fetch_current_weather', return_value=None), \
+                mock.patch('weather.batch.fetch_forecast', return_value=[]):
+            response = self.client.post(
+                '/api/current/batch/', {'location_ids': [fresh.id, missing.id]}, format='json',
+            )
+        ok, failed = response.json()['results']
+        self.assertEqual(set(ok), {'location', 'weather', 'alerts', 'error'})
+        self.assertEqual(set(failed), set(ok))
+        self.assertIsNone(ok['error'])
+        self.assertEqual((failed['weather'], failed['error']), (None, 'Failed to fetch weather data'))
+        self.assertEqual(failed['location']['id'], missing.id)
+
+
+@override_settings(WEATHER_RESPONSE_CACHE={'ENABLED': False})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_news_list_revalidates_with_etag(self):
+        NewsArticle.objects.create(title='Storm season', content='...')
+        first = self.client.get('/api/news/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], 'private, max-age=60')
+
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/news/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+        NewsArticle.objects.create(title='Flood warning', content='...')
+        changed = self.client.get('/api/news/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_news_detail_honours_if_modified_since(self):
+        article = NewsArticle.objects.create(title='Storm season', content='...')
+        first = self.client.get(f'/api/news/{article.pk}/')
+        response = self.client.get(f'/api/news/{article.pk}/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_weak_etags_match(self):
+        NewsArticle.objects.create(title='Storm season', content='...')
+        etag = self.client.get('/api/news/')['ETag']
+        self.assertEqual(self.client.get('/api/news/', HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+    def test_forecasts_revalidate_without_serializing(self):
+        location = make_location()
+        store_forecasts(location, [forecast_item('short', 3), forecast_item('daily', 24)])
+        first = self.client.get(f'/api/forecast/{location.pk}/all_types/')
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['Cache-Control'].startswith('private, max-age='))
+
+        with mock.patch('weather.views.fast_forecasts.serialize_many') as serialize:
+            response = self.client.get(f'/api/forecast/{location.pk}/all_types/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        serialize.assert_not_called()
+
+    def test_current_weather_revalidates(self):
+        location = make_location()
+        make_weather(location)
+        payload = {'latitude': '21.0285000', 'longitude': '105.8542000'}
+        with mock.patch('weather.views.fetch_forecast', return_value=[]):
+            first = self.client.post('/api/current/by_location/', payload, format='json')
+            self.assertEqual(first.status_code, 200)
+            response = self.client.post(
+                '/api/current/by_location/', payload, format='json', HTTP_IF_NONE_MATCH=first['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.location = make_location()
+        now = timezone.now()
+        alerts = WeatherAlert.objects.bulk_create([
+            WeatherAlert(location=self.location, alert_type='storm', message=f'Alert {i}') for i in range(105)
+        ])
+        for i, alert in enumerate(alerts):
+            alert.issued_at = now - timedelta(minutes=i)
+        WeatherAlert.objects.bulk_update(alerts, ['issued_at'])
+
+    def test_cursor_pages_do_not_overlap(self):
+        first = self.client.get('/api/alerts/', {'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([a['message'] for a in first['results']], ['Alert 0', 'Alert 1', 'Alert 2'])
+        self.assertEqual([a['message'] for a in second['results']], ['Alert 3', 'Alert 4', 'Alert 5'])
+        self.assertIsNone(first['previous'])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/alerts/', {'page_size': 1000}).json()
+        self.assertEqual(len(response['results']), 100)
+        self.assertEqual(len(self.client.get('/api/alerts/').json()['results']), 20)
+
+    def test_settings_are_read_per_request(self):
+        with self.settings(WEATHER_PAGINATION={'PAGE_SIZE': 5, 'MAX_PAGE_SIZE': 10}):
+            self.assertEqual(len(self.client.get('/api/alerts/').json()['results']), 5)
+            self.assertEqual(len(self.client.get('/api/alerts/', {'page_size': 50}).json()['results']), 10)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/alerts/', {'page_size': 1, 'fields': 'id,severity'}).json()
+        self.assertEqual(set(response['results'][0]), {'id', 'severity'})
+        make_weather(self.location)
+        response = self.client.get('/api/current/', {'fields': 'temperature, location'}).json()
+        self.assertEqual(set(response['results'][0]), {'temperature', 'location'})
+        self.assertIn('name', response['results'][0]['location'])
+
+
+class QueryBudgetTests(TestCase):
+    """Mỗi endpoint list chạy cùng số query dù có 1 hay nhiều dòng."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_rows(self, count):
+        for i in range(count):
+            location = make_location(name=f'City {i}', latitude=f'{10 + i}.0000000', longitude='105.0000000')
+            make_weather(location)
+            store_forecasts(location, [forecast_item('short', 3)])
+            WeatherAlert.objects.create(location=location, alert_type='storm', message='Wind 80 km/h')
+            NewsArticle.objects.create(title=f'News {i}', content='...')
+
+    def assert_list_queries(self, url, expected):
+        for count in (1, 9):
+            self.add_rows(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_current_weather_list(self):
+        self.assert_list_queries('/api/current/', 1)
+
+    def test_forecast_list(self):
+        self.assert_list_queries('/api/forecast/', 1)
+
+    def test_alert_list(self):
+        self.assert_list_queries('/api/alerts/', 1)
+
+    def test_news_list(self):
+        self.assert_list_queries('/api/news/', 2)
+
+    @override_settings(WEATHER_AUTH_CACHE={'ENABLED': False})
+    def test_profile_favorites(self):
+        user = UserProfile.objects.create_user('minh', 'minh@example.com', 'secret-pass')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        for count in (1, 9):
+            self.add_rows(count)
+            user.favorite_locations.set(Location.objects.all())
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/user/profile/')
+            self.assertEqual(len(response.json()['favorite_locations']), Location.objects.count())
+
+
+class RenderJSONTests(SimpleTestCase):
+    payload = {
+        'utc': datetime(2026, 10, 18, 9, 30, 0, 123456, tzinfo=dt_timezone.utc),
+        'utc_whole_second': datetime(2026, 10, 18, 9, 30, tzinfo=dt_timezone.utc),
+        'ict': datetime(2026, 10, 18, 16, 30, tzinfo=dt_timezone(timedelta(hours=7))),
+        'naive': datetime(2026, 10, 18, 9, 30),
+        'day': date(2026, 10, 18),
+        'temperature': Decimal('30.50'),
+        'name': 'Hà Nội \u2028 Huế',
+        'points': [{'avg': 1.5, 'count': 3, 'empty': None, 'ok': True}],
+    }
+
+    def assert_matches_drf(self):
+        self.assertEqual(render_json(self.payload), JSONRenderer().render(self.payload))
+
+    def test_orjson_matches_drf(self):
+        if fast_serializers.orjson is None:
+            self.skipTest('orjson is not installed')
+        self.assert_matches_drf()
+
+    def test_stdlib_fallback_matches_drf(self):
+        with mock.patch.object(fast_serializers, 'orjson', None):
+            self.assert_matches_drf()
+
+
+class HistoryRenderingTests(TestCase):
+    def test_history_matches_drf_rendering(self):
+        location = make_location()
+        observed_at = timezone.now().replace(microsecond=250000) - timedelta(hours=1)
+        WeatherObservation.objects.create(
+            location=location, observed_at=observed_at, temperature=30.5, humidity=70, wind_speed=3.0, pressure=1010,
+        )
+        for resolution in ('raw', 'hour'):
+            response = APIClient().get(f'/api/history/{location.pk}/', {'resolution': resolution})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            expected = {
+                **body,
+                'start': datetime.fromisoformat(body['start']),
+                'end': datetime.fromisoformat(body['end']),
+                'points': observation_series(
+                    location.pk, datetime.fromisoformat(body['start']), datetime.fromisoformat(body['end']), resolution,
+                ),
+            }
+            self.assertEqual(response.content, JSONRenderer().render(expected))
+            self.assertEqual(len(body['points']), 1)
+        raw = APIClient().get(f'/api/history/{location.pk}/', {'resolution': 'raw'}).json()
+        self.assertTrue(raw['points'][0]['observed_at'].endswith('.250000Z'))
+
+
+@override_settings(WEATHER_RESPONSE_CACHE={'REQUIRE_SHARED': False})
+class ResponseCacheTests(TestCase):
+    payload = {'latitude': '21.0285000', 'longitude': '105.8542000'}
+
+    def setUp(self):
+        caches['default'].clear()
+        response_cache._aliases = None
+        self.client = APIClient()
+        self.location = make_location()
+        make_weather(self.location)
+
+    def get(self):
+        with mock.patch('weather.views.fetch_forecast', return_value=[]):
+            return self.client.post('/api/current/by_location/', self.payload, format='json')
+
+    def test_disabled_without_shared_cache(self):
+        with self.settings(WEATHER_RESPONSE_CACHE={}):
+            self.assertFalse(response_cache.is_enabled())
+            self.assertIsNone(response_cache.current_generation(self.location.pk))
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(second.content, first.content)
+
+    def test_store_is_skipped_after_concurrent_invalidation(self):
+        generation = response_cache.current_generation(self.location.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.invalidate_location(self.location.pk)  # worker khác ghi dữ liệu mới
+        response_cache.store_response(self.location.pk, generation, b'{}', '"old"', None, timezone.now(), 60)
+        response_cache.remember_alias('coord:21.0285:105.8542', self.location.pk)
+        self.assertIsNone(response_cache.get_cached_response('coord:21.0285:105.8542'))
+
+    def test_entries_from_an_old_generation_are_ignored(self):
+        self.get()
+        self.assertIsNotNone(response_cache.get_cached_response('coord:21.0285:105.8542'))
+        caches['default'].set(response_cache.generation_key(self.location.pk), 1, None)
+        self.assertIsNone(response_cache.get_cached_response('coord:21.0285:105.8542'))
+
+    def test_stale_data_is_not_served_from_cache(self):
+        CurrentWeather.objects.update(timestamp=timezone.now() - timedelta(seconds=290))
+        with mock.patch('weather.views.store_response', wraps=response_cache.store_response) as store:
+            self.get()
+        self.assertLessEqual(store.call_args.args[-1], 10)  # entry hết hạn cùng lúc với FRESH_FOR
+
+        # Dữ liệu đã STALE: mọi request đi qua đường đầy đủ, đánh dấu vị trí và lên lịch refresh nền
+        CurrentWeather.objects.update(timestamp=timezone.now() - timedelta(seconds=600))
+        caches['default'].delete(response_cache.response_key(self.location.pk))  # entry đã hết TTL
+        with mock.patch('weather.views.stale_refresher.schedule') as schedule:
+            self.get()
+            self.get()
+        self.assertEqual(schedule.call_count, 2)
+        self.assertIsNone(response_cache.get_cached_response('coord:21.0285:105.8542'))
+        self.location.refresh_from_db()
+        self.assertIsNotNone(self.location.last_requested_at)
+
+    def test_renaming_a_location_invalidates(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.name = 'Ha Noi'
+            self.location.save(update_fields=['name'])
+        self.assertEqual(self.get().json()['weather']['location']['name'], 'Ha Noi')
+
+
+class ObservationHistoryTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+    def observe(self, minutes, temperature):
+        WeatherObservation.objects.create(
+            location=self.location, observed_at=self.hour + timedelta(minutes=minutes),
+            temperature=temperature, humidity=70, wind_speed=3.0, pressure=1010,
+        )
+
+    def test_every_weather_save_appends_one_observation(self):
+        weather = make_weather(self.location)
+        weather.save()  # cùng timestamp: không tạo dòng trùng
+        weather.timestamp += timedelta(minutes=5)
+        weather.save()
+        self.assertEqual(WeatherObservation.objects.filter(location=self.location).count(), 2)
+
+    def test_hourly_buckets_are_aggregated(self):
+        for minutes, temperature in ((5, 24.3), (35, 26.1), (65, 30.0)):
+            self.observe(minutes, temperature)
+        points = observation_series(self.location.pk, self.hour, self.hour + timedelta(hours=3), 'hour')
+        self.assertEqual([point['samples'] for point in points], [2, 1])
+        self.assertEqual(
+            (points[0]['temperature_min'], points[0]['temperature_max'], points[0]['temperature_avg']), (24.3, 26.1, 25.2),
+        )
+
+    def test_range_is_half_open_and_raw_is_capped(self):
+        for minutes in range(4):
+            self.observe(minutes, 25.0)
+        end = self.hour + timedelta(minutes=3)
+        self.assertEqual(len(observation_series(self.location.pk, self.hour, end, 'raw')), 3)
+        with self.settings(WEATHER_HISTORY={'MAX_RAW_POINTS': 2}):
+            self.assertEqual(len(observation_series(self.location.pk, self.hour, end, 'raw')), 2)
+
+    def test_invalid_ranges_are_rejected(self):
+        client = APIClient()
+        url = f'/api/history/{self.location.pk}/'
+        self.assertEqual(client.get(url, {'start': '2026-01-02T00:00:00Z', 'end': '2026-01-01T00:00:00Z'}).status_code, 400)
+        self.assertEqual(client.get(url, {'start': '2024-01-01T00:00:00Z', 'end': '2026-01-01T00:00:00Z'}).status_code, 400)
+        self.assertEqual(client.get('/api/history/999999/').status_code, 404)
+
+
+class MaintenanceTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+
+    def record_usage(self, hours_ago, status=200):
+        OpenWeatherMapAPIUsage.objects.create(
+            api_call_time=self.now - timedelta(hours=hours_ago), response_status=status,
+            request_type='current', latency_ms=100,
+        )
+
+    def calls_by_hour(self):
+        return sorted(ApiUsageRollup.objects.values_list('calls', flat=True))
+
+    def test_rollup_recounts_late_flushed_rows(self):
+        self.record_usage(3)
+        self.record_usage(1)
+        rollup_api_usage(self.now)
+        self.record_usage(3, status=500)  # buffer của worker khác được ghi sau khi giờ đó đã rollup
+        rollup_api_usage(self.now)
+        rollup = ApiUsageRollup.objects.order_by('hour').first()
+        self.assertEqual((rollup.calls, rollup.errors), (2, 1))
+        self.assertEqual(self.calls_by_hour(), [1, 2])
+
+    def test_raw_usage_inside_the_lookback_window_is_kept(self):
+        self.record_usage(3)
+        self.record_usage(1)
+        rollup_api_usage(self.now)
+        with self.settings(WEATHER_MAINTENANCE={'USAGE_RAW_DAYS': 0}):
+            self.assertEqual(prune_expired(self.now)['api_usage'], 0)
+
+    def test_alert_pruning_skips_per_row_signals(self):
+        cold = make_location()
+        alerts = WeatherAlert.objects.bulk_create([
+            WeatherAlert(location=cold, alert_type='storm', message=str(i)) for i in range(5)
+        ])
+        WeatherAlert.objects.filter(pk__in=[a.pk for a in alerts]).update(issued_at=self.now - timedelta(days=60))
+        with mock.patch('weather.signals.invalidate_location') as per_row, \
+                mock.patch('weather.maintenance.invalidate_location') as per_location:
+            self.assertEqual(prune_expired(self.now)['alerts'], 5)
+        per_row.assert_not_called()
+        per_location.assert_called_once_with(cold.pk)
+        self.assertFalse(WeatherAlert.objects.exists())
+
+
+class ApiUsageTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(UsageRecorder, '_run')  # không chạy thread flush nền trong test
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recorder = UsageRecorder()
+        usage._db_count['expires_at'] = 0
+        caches['default'].clear()
+
+    def test_calls_are_attributed_to_the_location(self):
+        location = make_location()
+        self.recorder.record('current', 200, 120, (location.latitude, location.longitude))
+        self.recorder.record('forecast', 200, 80, (float(location.latitude), float(location.longitude)))
+        self.recorder.record('geocode', 200, 50)
+        with self.assertNumQueries(2):  # một query tra Location + một bulk INSERT
+            self.assertEqual(self.recorder.flush(), 3)
+        self.assertEqual(
+            dict(OpenWeatherMapAPIUsage.objects.values_list('request_type', 'location_id')),
+            {'current': location.pk, 'forecast': location.pk, 'geocode': None},
+        )
+
+    def test_record_api_call_reads_coordinates_from_params(self):
+        with mock.patch.object(usage.recorder, 'record') as record:
+            usage.record_api_call('current', None, time.monotonic(), {'lat': 21.0, 'lon': 105.8, 'units': 'metric'})
+            usage.record_api_call('geocode', None, time.monotonic(), {'q': 'Hanoi'})
+        self.assertEqual(record.call_args_list[0].args[3], (21.0, 105.8))
+        self.assertIsNone(record.call_args_list[1].args[3])
+
+    def test_quota_counts_other_workers_from_the_database(self):
+        self.assertFalse(is_shared_cache())
+        for _ in range(10):  # đã được worker khác flush
+            OpenWeatherMapAPIUsage.objects.create(request_type='current', response_status=200)
+        OpenWeatherMapAPIUsage.objects.create(
+            request_type='current', response_status=200, api_call_time=timezone.now() - timedelta(minutes=5),
+        )
+        with mock.patch.object(usage, 'recorder', self.recorder):
+            self.recorder.record('current', 200, 100)
+            self.assertEqual(calls_last_minute(), 11)
+            governor = QuotaGovernor(quota_per_minute=20, interactive_reserve=0.3)
+            self.assertEqual(governor.available(), 3)
+            self.assertTrue(governor.try_acquire(2))
+            self.assertFalse(governor.try_acquire(4))
+            self.assertEqual(governor.available(), 1)  # 2 token đã cấp vẫn được tính tới khi lần gọi được flush
+
+    def test_concurrent_acquires_do_not_overshoot(self):
+        governor = QuotaGovernor(quota_per_minute=10, interactive_reserve=0.5)
+        barrier = threading.Barrier(20)
+        granted = []
+
+        def acquire():
+            barrier.wait()
+            granted.append(governor.try_acquire(1))
+
+        with mock.patch('weather.usage.calls_last_minute', return_value=0):
+            threads = [threading.Thread(target=acquire) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(granted.count(True), 5)
+            self.assertEqual(governor.available(), 0)  # token bị từ chối đã được trả lại
+
+
+def legacy_alerts(name, current, forecast=None):
+    # Bộ ngưỡng viết tay trước khi có alert_rules, chỉ khác ở chỗ làm tròn xác suất mưa 2 chữ số
+    alerts = []
+    temp, wind_speed, humidity = current['temperature'], current['wind_speed'], current['humidity']
+    condition = current['weather_condition'].lower()
+
+    def add(alert_type, message, severity, recommendation):
+        alerts.append({'alert_type': alert_type, 'message': message, 'severity': severity, 'recommendation': recommendation})
+
+    if wind_speed > 20 or 'storm' in condition or 'thunderstorm' in condition:
+        add('storm', f"Storm warning in {name}: High winds ({wind_speed} m/s) or stormy conditions detected.",
+            'high' if wind_speed > 25 else 'medium', 'Stay indoors, secure outdoor objects.')
+    if temp > 40:
+        add('extreme_temperature', f"Extreme heat warning in {name}: Temperature reached {temp}°C.",
+            'high', 'Stay hydrated, avoid outdoor activities.')
+    elif temp < -10:
+        add('extreme_temperature', f"Extreme cold warning in {name}: Temperature dropped to {temp}°C.",
+            'high', 'Dress warmly, limit outdoor exposure.')
+    if 'fog' in condition and humidity > 90:
+        add('fog', f"Dense fog warning in {name}: Low visibility due to high humidity ({humidity}%).",
+            'medium', 'Drive slowly, use fog lights.')
+    if forecast:
+        max_rain = round(float(max(item['rain_probability'] for item in forecast)), 2)
+        if max_rain > 80:
+            add('flood', f"Flood risk in {name}: High rain probability ({max_rain}%) expected.",
+                'high', 'Avoid low-lying areas, prepare emergency supplies.')
+    if not alerts:
+        add('good_weather', f"Great weather in {name}: Temperature at {temp}°C, {condition}.",
+            'low', 'Perfect day for outdoor activities!')
+    return alerts
+
+
+class AlertRuleTests(SimpleTestCase):
+    ruleset = RuleSet(DEFAULT_ALERT_RULES)
+
+    def evaluate(self, current, forecast=None, name='Hanoi'):
+        return self.ruleset.evaluate([name], to_columns([alert_inputs(current, forecast)]))[0]
+
+    def reading(self, temperature=30.0, wind_speed=3.0, humidity=70.0, condition='clear sky'):
+        return {'temperature': temperature, 'wind_speed': wind_speed, 'humidity': humidity,
+                'weather_condition': condition}
+
+    def assert_equivalent(self, current, forecast=None):
+        self.assertEqual(self.evaluate(current, forecast), legacy_alerts('Hanoi', current, forecast))
+
+    def test_boundary_values_match_hand_written_thresholds(self):
+        for wind_speed in (20, 20.01, 25, 25.01):
+            self.assert_equivalent(self.reading(wind_speed=wind_speed))
+        for temperature in (40, 40.01, -10, -10.01):
+            self.assert_equivalent(self.reading(temperature=temperature))
+        for humidity in (90, 90.01):
+            self.assert_equivalent(self.reading(humidity=humidity, condition='fog'))
+        for rain in (80, 80.01, 80.004, 80.006):
+            self.assert_equivalent(self.reading(), [{'rain_probability': rain}])
+
+    def test_random_inputs_match_hand_written_thresholds(self):
+        rng = random.Random(20)
+        conditions = ['clear sky', 'fog', 'thunderstorm', 'Heavy Storm', 'light rain', 'mist and fog', 'clouds']
+        boundaries = {'temperature': [40, -10], 'wind_speed': [20, 25], 'humidity': [90], 'rain': [80]}
+
+        def value(metric, low, high):
+            if rng.random() < 0.2:
+                return rng.choice(boundaries[metric])
+            return round(rng.uniform(low, high), 2)
+
+        for _ in range(3000):
+            current = self.reading(
+                value('temperature', -25, 50), value('wind_speed', 0, 35), value('humidity', 0, 100),
+                rng.choice(conditions),
+            )
+            forecast = None
+            if rng.random() < 0.7:
+                forecast = [{'rain_probability': value('rain', 0, 100)} for _ in range(rng.randint(1, 8))]
+            self.assert_equivalent(current, forecast)
+
+    def test_flood_message_uses_rounded_probability(self):
+        for rain in (85.126, Decimal('85.13')):
+            alerts = self.evaluate(self.reading(), [{'rain_probability': rain}])
+            self.assertIn('(85.13%)', alerts[0]['message'])
+        self.assertEqual(self.evaluate(self.reading(), [{'rain_probability': 80.004}])[0]['alert_type'], 'good_weather')
+
+    def test_rules_with_missing_inputs_are_skipped(self):
+        # Không có nhiệt độ: không suy ra "rét đậm" từ 0°C, cũng không báo thời tiết đẹp
+        self.assertEqual(self.evaluate({'wind_speed': 3.0, 'weather_condition': 'clear sky'}), [])
+        missing_wind = self.evaluate({'temperature': 45.0, 'weather_condition': 'thunderstorm'})
+        self.assertEqual([alert['alert_type'] for alert in missing_wind], ['extreme_temperature'])
+        self.assertEqual(self.evaluate({'temperature': 30.0, 'humidity': 95.0, 'wind_speed': 3.0}), [])
+        no_rain = self.evaluate(self.reading(), [{'rain_probability': None}])
+        self.assertEqual([alert['alert_type'] for alert in no_rain], ['good_weather'])
+
+
+def fake_alert(message, alert_type='storm'):
+    return SimpleNamespace(alert_type=alert_type, message=message, recommendation='Stay indoors.')
+
+
+class MailQueueTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user('lan', 'lan@example.com', 'secret-pass')
+
+    def fan_out(self, *messages):
+        return enqueue_alert_fanout({self.user.pk: (self.user.email, [fake_alert(m) for m in messages])})
+
+    def test_pending_or_recently_sent_alerts_are_not_queued_again(self):
+        self.assertEqual(len(self.fan_out('Wind 22 m/s', 'Wind 22 m/s')), 1)
+        self.assertEqual(len(self.fan_out('Wind 22 m/s')), 0)
+        OutboundEmail.objects.update(status='sent', sent_at=timezone.now())
+        self.assertEqual(len(self.fan_out('Wind 22 m/s')), 0)
+        OutboundEmail.objects.update(sent_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(len(self.fan_out('Wind 22 m/s')), 1)
+        self.assertIsNone(enqueue_mail(
+            'lan@example.com', 'Weather Alert: Storm', 'Wind 22 m/s\nRecommendation: Stay indoors.',
+            digest_key=f"alerts:{self.user.pk}",
+        ))
+
+    def test_new_alerts_join_the_pending_digest(self):
+        first = self.fan_out('Wind 22 m/s')[0]
+        with mock.patch('weather.mail_queue.timezone.now', return_value=timezone.now() + timedelta(seconds=45)):
+            second = self.fan_out('Wind 27 m/s')[0]
+        self.assertEqual(second.next_attempt_at, first.next_attempt_at)
+
+    def test_whole_digest_is_claimed_together(self):
+        self.fan_out('Wind 22 m/s', 'Wind 27 m/s', 'Wind 30 m/s')
+        later = OutboundEmail.objects.order_by('id').last()
+        OutboundEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        other = enqueue_mail('ops@example.com', 'Report', 'Daily report', delay=600)
+
+        claimed = claim_due(now=timezone.now() + timedelta(minutes=5), batch_size=1)
+        self.assertEqual(len(claimed), 3)
+        self.assertNotIn(other.pk, [email.pk for email in claimed])
+        self.assertEqual(OutboundEmail.objects.filter(status='sending').count(), 3)
+
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_digest_is_sent_as_one_message(self):
+        self.fan_out('Wind 22 m/s', 'Wind 27 m/s')
+        enqueue_mail('ops@example.com', 'Report', 'Daily report')
+
+        self.assertEqual(send_queued_mail(now=timezone.now() + timedelta(minutes=5)), (3, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        digest = next(message for message in mail.outbox if message.to == ['lan@example.com'])
+        self.assertEqual(digest.subject, 'Weather Alerts: 2 updates')
+        self.assertIn('Wind 22 m/s', digest.body)
+        self.assertIn('Wind 27 m/s', digest.body)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 3)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_send_errors_back_off_then_fail(self):
+        email = enqueue_mail('ops@example.com', 'Report', 'Daily report')
+        max_attempts = get_mail_queue_config()['MAX_ATTEMPTS']
+        now = timezone.now()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=ConnectionError('SMTP down')):
+            for attempt in range(1, max_attempts + 1):
+                self.assertEqual(send_queued_mail(now=now), (0, 1))
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempt)
+                self.assertEqual(email.last_error, 'SMTP down')
+                if attempt < max_attempts:
+                    self.assertEqual(email.status, 'pending')
+                    self.assertGreater(email.next_attempt_at, now)
+                    now = email.next_attempt_at
+        self.assertEqual(email.status, 'failed')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(send_queued_mail(now=now + timedelta(days=1)), (0, 0))
+
+class AlertFanOutTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+        self.user = UserProfile.objects.create_user(
+            'hoa', 'hoa@example.com', 'secret-pass', notification_settings={'storm': True},
+        )
+        self.user.favorite_locations.add(self.location)
+
+    def storm(self, severity='medium', message='Storm warning in Hanoi: High winds (22 m/s).'):
+        return [{'alert_type': 'storm', 'message': message, 'severity': severity, 'recommendation': 'Stay indoors.'}]
+
+    def test_request_path_only_marks_alerts_for_background_fan_out(self):
+        reconcile_alerts(self.location, self.storm())
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(fan_out_pending_alerts(), 1)
+        self.assertEqual(OutboundEmail.objects.get().to_email, 'hoa@example.com')
+        self.assertEqual(fan_out_pending_alerts(), 0)
+
+    def test_only_new_alerts_or_severity_changes_are_fanned_out(self):
+        reconcile_alerts(self.location, self.storm())
+        fan_out_pending_alerts()
+        reconcile_alerts(self.location, self.storm(message='Storm warning in Hanoi: High winds (23 m/s).'))
+        self.assertEqual(fan_out_pending_alerts(), 0)
+        reconcile_alerts(self.location, self.storm('high', 'Storm warning in Hanoi: High winds (27 m/s).'))
+        self.assertEqual(fan_out_pending_alerts(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_local_index_picks_up_changes_from_other_processes(self):
+        other = UserProfile.objects.create_user('tuan', 'tuan@example.com', 'secret-pass', notification_settings={'storm': True})
+        subscribers = SubscriberIndex()
+        self.assertEqual(subscribers.subscribers(self.location.pk, 'storm'), [(self.user.pk, 'hoa@example.com')])
+        # Ghi thẳng bảng trung gian như một process khác (không có signal trong process này)
+        UserProfile.favorite_locations.through.objects.create(userprofile_id=other.pk, location_id=self.location.pk)
+        self.assertEqual(len(subscribers.subscribers(self.location.pk, 'storm')), 1)
+        with override_settings(WEATHER_SUBSCRIBERS={'LOCAL_MAX_AGE': 0}):
+            self.assertEqual(len(subscribers.subscribers(self.location.pk, 'storm')), 2)
+
+
+PUSH_MEMORY = {'BROKER': 'memory', 'HEARTBEAT': 0.05, 'QUEUE_SIZE': 2}
+
+
+@override_settings(WEATHER_PUSH=PUSH_MEMORY)
+class PushHubTests(SimpleTestCase):
+    def test_dispatch_from_another_thread_reaches_only_matching_subscriptions(self):
+        async def scenario():
+            hub = LocalHub()
+            subscription = hub.subscribe([1, 2])
+            thread = threading.Thread(target=hub.dispatch, args=(2, b'frame'))
+            thread.start()
+            thread.join()
+            hub.dispatch(3, b'other location')
+            received = [await subscription.next(1), await subscription.next(0.05)]
+            hub.unsubscribe(subscription)
+            return received, hub.has_subscribers(1), hub.has_subscribers(2)
+
+        self.assertEqual(async_to_sync(scenario)(), ([b'frame', None], False, False))
+
+    def test_slow_subscription_drops_oldest_frames(self):
+        async def scenario():
+            subscription = LocalHub().subscribe([1])
+            for frame in (b'1', b'2', b'3'):
+                subscription.deliver(frame)
+            return [await subscription.next(0.05) for _ in range(3)]
+
+        self.assertEqual(async_to_sync(scenario)(), [b'2', b'3', None])
+
+
+class PushBrokerTests(TestCase):
+    def test_auto_uses_redis_only_when_configured_and_installed(self):
+        with override_settings(REDIS_URL='redis://localhost:6379/1'):
+            with mock.patch.object(push, 'redis', mock.Mock()):
+                self.assertEqual(broker_name({'BROKER': 'auto'}), 'redis')
+            with mock.patch.object(push, 'redis', None):
+                self.assertEqual(broker_name({'BROKER': 'auto'}), 'memory')
+        with override_settings(REDIS_URL=''), mock.patch.object(push, 'redis', mock.Mock()):
+            self.assertEqual(broker_name({'BROKER': 'auto'}), 'memory')
+        self.assertEqual(broker_name({'BROKER': 'redis'}), 'redis')
+
+    def test_publish_skips_serialization_without_listeners_and_waits_for_commit(self):
+        hub = mock.Mock()
+        broker = InMemoryBroker(hub, {})
+        build = mock.Mock(return_value={'location_id': 7})
+        with mock.patch.object(push, 'get_broker', return_value=broker):
+            hub.has_subscribers.return_value = False
+            push.publish(7, 'weather', build)
+            build.assert_not_called()
+
+            hub.has_subscribers.return_value = True
+            with self.captureOnCommitCallbacks(execute=True):
+                push.publish(7, 'weather', build)
+                hub.dispatch.assert_not_called()
+        hub.dispatch.assert_called_once_with(7, b'event: weather\ndata: {"location_id":7}\n\n')
+
+
+@override_settings(WEATHER_PUSH=PUSH_MEMORY)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        push.reset_broker()
+        self.addCleanup(push.reset_broker)
+        self.location = make_location()
+        make_weather(self.location)
+        WeatherAlert.objects.create(location=self.location, **alert_data())
+
+    async def test_stream_sends_snapshot_then_pushed_events_and_heartbeats(self):
+        stream = event_stream({self.location.pk})
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        weather_frame, alerts_frame = await anext(stream), await anext(stream)
+        self.assertTrue(weather_frame.startswith(b'event: weather\n'))
+        self.assertTrue(alerts_frame.startswith(b'event: alerts\n'))
+        self.assertTrue(json.loads(alerts_frame.split(b'data: ', 1)[1])['reset'])
+
+        push_hub.dispatch(self.location.pk, b'event: forecast\ndata: {}\n\n')
+        self.assertEqual(await anext(stream), b'event: forecast\ndata: {}\n\n')
+        self.assertEqual(await anext(stream), b': keep-alive\n\n')
+        await stream.aclose()
+        self.assertFalse(push_hub.has_subscribers(self.location.pk))
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user('an', 'an@example.com', 'secret-pass')
+        self.token = Token.objects.create(user=self.user)
+        caches['default'].clear()
+
+    def test_shared_tier_is_skipped_for_process_local_cache(self):
+        tokens = TokenCache()
+        self.assertIsNone(tokens._shared())
+        tokens.load(self.token.key, lambda: load_token(self.token.key))
+        self.assertIsNone(TokenCache().get(self.token.key))
+
+    def test_shared_tier_holds_only_id_and_active_flag(self):
+        with mock.patch('weather.authentication.is_shared_cache', return_value=True):
+            TokenCache().load(self.token.key, lambda: load_token(self.token.key))
+            entries = [value for value in caches['default']._cache.values()]
+            self.assertFalse(any(self.user.password.encode() in entry for entry in entries))
+
+            token = TokenCache().get(self.token.key)  # worker khác: chỉ có tầng dùng chung
+            self.assertIsInstance(token.user, LazyUser)
+            with self.assertNumQueries(0):
+                self.assertEqual((token.user.pk, token.user.is_active, token.user.is_authenticated), (self.user.pk, True, True))
+            with self.assertNumQueries(2):  # user + vị trí yêu thích
+                self.assertEqual(token.user.username, 'an')
+
+    def test_profile_etag_follows_database_not_cached_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        etag = client.get('/api/user/profile/')['ETag']
+        self.assertEqual(client.get('/api/user/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Worker khác đổi cài đặt: process này không nhận signal, user trong cache đã cũ
+        UserProfile.objects.filter(pk=self.user.pk).update(
+            notification_settings={'storm': True}, updated_at=timezone.now(),
+        )
+        response = client.get('/api/user/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['notification_settings'], {'storm': True})
+        self.assertEqual(client.get('/api/user/profile/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_favorite_changes_bump_updated_at(self):
+        before = UserProfile.objects.get(pk=self.user.pk).updated_at
+        make_location().userprofile_set.add(self.user)
+        self.assertGreater(UserProfile.objects.get(pk=self.user.pk).updated_at, before)
+
+
+@override_settings(WEATHER_LOGIN={'PBKDF2_ITERATIONS': 1000})
+class LoginBackendTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user('binh', 'binh@example.com', 'secret-pass')
+
+    def test_username_or_email_in_one_query(self):
+        backend = UsernameOrEmailBackend()
+        for login in ('binh', 'binh@example.com'):
+            with self.assertNumQueries(1):
+                self.assertEqual(backend.authenticate(None, username=login, password='secret-pass'), self.user)
+        self.assertIsNone(backend.authenticate(None, username='binh', password='wrong-pass'))
+
+    def test_unknown_login_still_hashes_once(self):
+        with mock.patch.object(UserProfile, 'set_password', autospec=True) as set_password:
+            with self.assertNumQueries(1):
+                self.assertIsNone(UsernameOrEmailBackend().authenticate(None, username='ghost', password='secret-pass'))
+        set_password.assert_called_once_with(mock.ANY, 'secret-pass')
+
+    def test_password_is_rehashed_when_iterations_change(self):
+        self.assertIn('$1000$', self.user.password)
+        with override_settings(WEATHER_LOGIN={'PBKDF2_ITERATIONS': 1200}):
+            UsernameOrEmailBackend().authenticate(None, username='binh', password='secret-pass')
+        self.assertIn('$1200$', UserProfile.objects.get(pk=self.user.pk).password)
+
+
+@override_settings(WEATHER_LOGIN={'WINDOW': 300, 'MAX_FAILURES_PER_IP': 20, 'MAX_FAILURES_PER_ACCOUNT': 3})
+class LoginThrottleTests(SimpleTestCase):
+    def test_concurrent_attempts_cannot_exceed_the_limit(self):
+        throttle = LoginThrottle()
+        barrier = threading.Barrier(12)
+        results = []
+
+        def attempt():
+            barrier.wait()
+            results.append(throttle.acquire('10.0.0.1', 'binh'))
+
+        threads = [threading.Thread(target=attempt) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(None), 3)
+
+    def test_last_successful_ip_is_exempt_from_account_lockout(self):
+        throttle = LoginThrottle()
+        self.assertIsNone(throttle.acquire('10.0.0.1', 'Binh'))
+        throttle.succeeded('10.0.0.1', 'Binh')
+        for _ in range(3):
+            self.assertIsNone(throttle.acquire('203.0.113.9', 'binh'))
+        self.assertIsNotNone(throttle.acquire('203.0.113.9', 'binh'))
+        self.assertIsNotNone(throttle.acquire('198.51.100.7', 'binh'))
+        self.assertIsNone(throttle.acquire('10.0.0.1', 'binh'))
+
+    def test_released_and_successful_attempts_are_not_failures(self):
+        throttle = LoginThrottle()
+        for _ in range(5):
+            self.assertIsNone(throttle.acquire('10.0.0.1', 'binh'))
+            throttle.release('10.0.0.1', 'binh')
+        self.assertIsNone(throttle.acquire('10.0.0.1', 'binh'))
+        throttle.succeeded('10.0.0.1', 'binh')
+        self.assertEqual(throttle._failures['ip:10.0.0.1'][1], 0)
+        self.assertNotIn('account:binh', throttle._failures)
+
+
+@override_settings(WEATHER_LOGIN={'PBKDF2_ITERATIONS': 1000, 'MAX_FAILURES_PER_ACCOUNT': 2})
+class LoginViewTests(TestCase):
+    def setUp(self):
+        UserProfile.objects.create_user('binh', 'binh@example.com', 'secret-pass')
+        patcher = mock.patch('weather.views.login_throttle', LoginThrottle())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_account_is_throttled_before_hashing(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/auth/login/', {'login': 'binh', 'password': 'nope'}).status_code, 400)
+        with mock.patch.object(UsernameOrEmailBackend, 'authenticate') as authenticate:
+            response = self.client.post('/api/auth/login/', {'login': 'binh', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+
+
+@override_settings(WEATHER_PUSH=PUSH_MEMORY)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.location = make_location()
+        self.coordinates = {'latitude': 21.0285, 'longitude': 105.8542}
+        stormy = {**WEATHER_DATA, 'wind_speed': Decimal('22.00'), 'temperature': Decimal('41.00')}
+        self.fetch_current = mock.AsyncMock(return_value=stormy)
+        self.fetch_forecast = mock.AsyncMock(return_value=[{'rain_probability': 20}])
+        for name, fake in (('afetch_current_weather', self.fetch_current), ('afetch_forecast', self.fetch_forecast)):
+            patcher = mock.patch(f'weather.async_views.{name}', fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def post(self, url, data, **headers):
+        return await self.async_client.post(url, data, content_type='application/json', headers=headers)
+
+    async def test_by_location_fetches_in_parallel_and_stores_weather(self):
+        response = await self.post('/api/async/current/by_location/', self.coordinates)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['weather']['wind_speed'], '22.00')
+        self.assertEqual({alert['alert_type'] for alert in body['alerts']}, {'storm', 'extreme_temperature'})
+        self.assertEqual(await CurrentWeather.objects.filter(location=self.location).acount(), 1)
+
+    async def test_by_location_serves_fresh_weather_without_fetching_it(self):
+        await CurrentWeather.objects.acreate(location=self.location, **WEATHER_DATA)
+        response = await self.post('/api/async/current/by_location/', self.coordinates)
+        self.assertEqual(response.json()['weather']['wind_speed'], '3.00')
+        self.fetch_current.assert_not_awaited()
+        self.fetch_forecast.assert_awaited_once()
+
+    async def test_check_notifications_filters_by_user_settings(self):
+        self.assertEqual((await self.post('/api/async/user/check_notifications/', self.coordinates)).status_code, 401)
+        user = await UserProfile.objects.acreate(username='thu', email='thu@example.com', notification_settings={'storm': True})
+        token = await Token.objects.acreate(user=user)
+        response = await self.post(
+            '/api/async/user/check_notifications/', self.coordinates, Authorization=f'Token {token.key}',
+        )
+        self.assertEqual([alert['alert_type'] for alert in response.json()], ['storm'])
+        self.assertEqual(await OutboundEmail.objects.filter(to_email='thu@example.com').acount(), 1)
+
+
+class AlertRuleValidationTests(TestCase):
+    def rule(self, **overrides):
+        data = {
+            'name': 'gust', 'alert_type': 'storm', 'conditions': [['wind_speed', 'gt', 15]],
+            'message': 'Gusts in {location}: {wind_speed} m/s.',
+        }
+        data.update(overrides)
+        return AlertRule(**data)
+
+    def test_clean_rejects_rules_that_cannot_compile_or_render(self):
+        self.rule().full_clean()
+        for overrides in (
+            {'conditions': [['gust_speed', 'gt', 15]]},
+            {'conditions': [['wind_speed', 'above', 15]]},
+            {'conditions': [['wind_speed', 'gt', '15']]},
+            {'escalations': [['wind_speed', 'gt', 25]]},
+            {'message': 'Gusts in {location}: {gust} m/s.'},
+        ):
+            with self.subTest(overrides=overrides), self.assertRaises(ValidationError):
+                self.rule(**overrides).full_clean()
+
+    def test_bad_database_rule_is_skipped_not_raised(self):
+        location = make_location()
+        make_weather(location, wind_speed=Decimal('22.00'))
+        # Dòng sửa thẳng trong DB, không qua clean()
+        self.rule(message='Gusts in {location}: {gust} m/s.').save()
+        rule_engine.reset()
+        self.addCleanup(rule_engine.reset)
+        with mock.patch('weather.views.fetch_forecast', return_value=[]):
+            response = APIClient().post(
+                '/api/current/by_location/', {'latitude': '21.0285000', 'longitude': '105.8542000'}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([alert['alert_type'] for alert in response.json()['alerts']], ['storm'])
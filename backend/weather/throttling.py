@@ -0,0 +1,99 @@
+# weather/throttling.py
+import threading
+import time
+from collections import OrderedDict
+
+from rest_framework.throttling import BaseThrottle
+
+from .backends import get_login_config
+
+
+class LoginThrottle:
+    """Đếm số lần đăng nhập sai theo IP và theo tài khoản trong bộ nhớ process.
+
+    Request bị từ chối trước khi hash mật khẩu nên flood không làm tăng CPU. Mỗi key giữ
+    một cửa sổ cố định (bắt đầu, số lần sai); số key bị giới hạn theo LRU.
+
+    Giới hạn theo tài khoản không áp dụng cho IP của lần đăng nhập thành công gần nhất,
+    để người khác đoán mật khẩu không khóa được chủ tài khoản.
+    """
+
+    def __init__(self):
+        self._failures = OrderedDict()
+        self._trusted = OrderedDict()  # {tài khoản: IP đăng nhập thành công gần nhất}
+        self._lock = threading.Lock()
+
+    def _keys(self, ip, login):
+        # Gọi khi đang giữ self._lock
+        config = get_login_config()
+        account = login.strip().lower()
+        keys = [(f"ip:{ip}", config['MAX_FAILURES_PER_IP'])]
+        if self._trusted.get(account) != ip:
+            keys.append((f"account:{account}", config['MAX_FAILURES_PER_ACCOUNT']))
+        return keys
+
+    def _evict(self, entries, max_keys):
+        while len(entries) > max_keys:
+            entries.popitem(last=False)
+
+    def acquire(self, ip, login, now=None):
+        """Kiểm tra giới hạn và giữ chỗ một lần thử (tính như một lần sai) trong cùng một lần khóa.
+
+        Trả về số giây phải chờ nếu IP hoặc tài khoản đã vượt giới hạn (không giữ chỗ), nếu không
+        None. Nhờ giữ chỗ, các request đồng thời không thể cùng lọt qua lượt cuối cùng.
+        """
+        config = get_login_config()
+        if not config['THROTTLE']:
+            return None
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            keys = self._keys(ip, login)
+            wait = None
+            for key, limit in keys:
+                entry = self._failures.get(key)
+                if entry is not None and now - entry[0] < config['WINDOW'] and entry[1] >= limit:
+                    wait = max(wait or 0, config['WINDOW'] - (now - entry[0]))
+            if wait is not None:
+                return wait
+            for key, _ in keys:
+                entry = self._failures.pop(key, None)
+                if entry is None or now - entry[0] >= config['WINDOW']:
+                    entry = (now, 0)
+                self._failures[key] = (entry[0], entry[1] + 1)
+            self._evict(self._failures, config['MAX_KEYS'])
+        return None
+
+    def _undo(self, key):
+        entry = self._failures.get(key)
+        if entry is not None and entry[1] > 0:
+            self._failures[key] = (entry[0], entry[1] - 1)
+
+    def release(self, ip, login):
+        """Trả lại chỗ đã giữ khi request không thử mật khẩu (thiếu login/password)."""
+        if not get_login_config()['THROTTLE']:
+            return
+        with self._lock:
+            for key, _ in self._keys(ip, login):
+                self._undo(key)
+
+    def succeeded(self, ip, login):
+        """Đăng nhập đúng: lần thử không tính là sai, xóa bộ đếm của tài khoản, tin IP này."""
+        config = get_login_config()
+        if not config['THROTTLE']:
+            return
+        account = login.strip().lower()
+        with self._lock:
+            # IP vẫn bị tính các lần sai với tài khoản khác
+            self._undo(f"ip:{ip}")
+            self._failures.pop(f"account:{account}", None)
+            self._trusted.pop(account, None)
+            self._trusted[account] = ip
+            self._evict(self._trusted, config['MAX_KEYS'])
+
+
+login_throttle = LoginThrottle()
+
+
+def client_ip(request):
+    # Dùng cách xác định client của DRF (tôn trọng NUM_PROXIES)
+    return BaseThrottle().get_ident(request)
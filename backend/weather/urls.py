@@ -1,7 +1,8 @@
 # weather/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CurrentWeatherViewSet, ForecastViewSet, NewsArticleViewSet, AuthViewSet, WeatherAlertViewSet,UserProfileViewSet
+from .views import CurrentWeatherViewSet, ForecastViewSet, NewsArticleViewSet, AuthViewSet, WeatherAlertViewSet,UserProfileViewSet, PlaceViewSet, HistoryViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'current', CurrentWeatherViewSet, basename='current-weather')
@@ -10,7 +11,14 @@ router.register(r'news', NewsArticleViewSet, basename='news-article')
 router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'alerts', WeatherAlertViewSet, basename='weather-alert')
 router.register(r'user', UserProfileViewSet, basename='user')
+router.register(r'places', PlaceViewSet, basename='place')
+router.register(r'history', HistoryViewSet, basename='history')
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Các endpoint async (chạy dưới ASGI), gọi current weather và forecast song song
+    path('async/current/by_location/', async_views.current_by_location, name='async-current-by-location'),
+    path('async/alerts/by_location/', async_views.alerts_by_location, name='async-alerts-by-location'),
+    path('async/user/check_notifications/', async_views.check_notifications, name='async-check-notifications'),
+    path('async/stream/', async_views.stream_updates, name='async-stream-updates'),
 ]
\ No newline at end of file
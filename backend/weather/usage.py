@@ -0,0 +1,252 @@
+# weather/usage.py
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+
+from .cache import is_shared_cache
+from .models import Location, OpenWeatherMapAPIUsage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_USAGE = {
+    'ENABLED': True,
+    'FLUSH_SIZE': 200,  # Ghi buffer vào DB khi đủ số dòng này...
+    'FLUSH_INTERVAL': 5,  # ...hoặc sau mỗi 5 giây
+    'MAX_BUFFER': 10000,  # Bỏ bớt dòng cũ nhất nếu DB không ghi được trong thời gian dài
+    'CACHE_ALIAS': 'default',  # Bộ đếm theo phút dùng chung giữa các worker
+    'DB_COUNT_TTL': 5,  # Cache LocMem không dùng chung: đếm từ DB, tối đa mỗi 5 giây một lần
+    'KEY_PREFIX': 'owm-usage',
+    'QUOTA_PER_MINUTE': 60,  # Giới hạn của API key OpenWeatherMap
+    'INTERACTIVE_RESERVE': 0.3,  # Phần quota luôn để dành cho request của người dùng
+    # Token QuotaGovernor đã cấp được tính thêm trong 10-20 giây, tới khi lần gọi thực tế vào bộ đếm
+    # (nên lớn hơn FLUSH_INTERVAL)
+    'RESERVATION_TTL': 10,
+}
+
+
+def get_usage_config():
+    config = dict(DEFAULT_API_USAGE)
+    config.update(getattr(settings, 'WEATHER_API_USAGE', {}))
+    return config
+
+
+def _minute(epoch):
+    return int(epoch // 60)
+
+
+def _counter_key(minute):
+    return f"{get_usage_config()['KEY_PREFIX']}:{minute}"
+
+
+def _reservation_key(slot):
+    return f"{get_usage_config()['KEY_PREFIX']}:reserved:{slot}"
+
+
+COORDINATE_STEP = Decimal('0.0000001')  # Location.latitude/longitude có 7 chữ số thập phân
+
+
+def _coordinate_key(latitude, longitude):
+    return (Decimal(str(latitude)).quantize(COORDINATE_STEP), Decimal(str(longitude)).quantize(COORDINATE_STEP))
+
+
+def attach_locations(batch):
+    """Gắn Location cho các lần gọi theo tọa độ; một query cho cả batch."""
+    coordinates = {row.coordinates for row in batch if row.location_id is None and row.coordinates}
+    if not coordinates:
+        return
+    keys = {_coordinate_key(*pair) for pair in coordinates}
+    locations = {}
+    for location_id, latitude, longitude in Location.objects.filter(
+        latitude__in={key[0] for key in keys}, longitude__in={key[1] for key in keys},
+    ).order_by('-id').values_list('id', 'latitude', 'longitude'):
+        locations[_coordinate_key(latitude, longitude)] = location_id  # trùng tọa độ: giữ id nhỏ nhất
+    for row in batch:
+        if row.location_id is None and row.coordinates:
+            row.location_id = locations.get(_coordinate_key(*row.coordinates))
+
+
+class UsageRecorder:
+    """Buffer trong bộ nhớ cho OpenWeatherMapAPIUsage, ghi bằng bulk_create từ một thread nền.
+
+    record() chỉ lấy lock và append nên dùng được từ cả code sync lẫn event loop async.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, request_type, response_status, latency_ms, coordinates=None):
+        config = get_usage_config()
+        if not config['ENABLED']:
+            return
+        row = OpenWeatherMapAPIUsage(
+            request_type=request_type,
+            response_status=response_status,
+            latency_ms=latency_ms,
+            api_call_time=timezone.now(),
+        )
+        row.coordinates = coordinates  # Location được tra khi flush (attach_locations)
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) > config['MAX_BUFFER']:
+                del self._buffer[0]
+            full = len(self._buffer) >= config['FLUSH_SIZE']
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='api-usage-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, minute):
+        # Các lần gọi trong phút này chưa được cộng vào bộ đếm dùng chung
+        with self._lock:
+            return sum(1 for row in self._buffer if _minute(row.api_call_time.timestamp()) == minute)
+
+    def pending_since(self, epoch):
+        with self._lock:
+            return sum(1 for row in self._buffer if row.api_call_time.timestamp() >= epoch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            attach_locations(batch)
+            OpenWeatherMapAPIUsage.objects.bulk_create(batch, batch_size=500)
+        except Exception as e:
+            logger.error(f"Could not write {len(batch)} API usage row(s): {e}")
+            with self._lock:
+                # Đưa lại vào buffer cho lần sau (vẫn được pending() tính), giới hạn MAX_BUFFER
+                self._buffer = (batch + self._buffer)[-get_usage_config()['MAX_BUFFER']:]
+            return 0
+        self._count(batch)
+        return len(batch)
+
+    def _count(self, batch):
+        alias = get_usage_config()['CACHE_ALIAS']
+        if not is_shared_cache(alias):
+            return  # calls_last_minute đếm từ DB
+        cache = caches[alias]
+        per_minute = Counter(_minute(row.api_call_time.timestamp()) for row in batch)
+        for minute, count in per_minute.items():
+            key = _counter_key(minute)
+            try:
+                cache.add(key, 0, 180)
+                cache.incr(key, count)
+            except ValueError:  # key vừa hết hạn giữa add và incr
+                cache.set(key, count, 180)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(get_usage_config()['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("API usage flush failed")
+            finally:
+                connection.close()
+
+
+recorder = UsageRecorder()
+atexit.register(recorder.flush)
+
+
+def record_api_call(request_type, response, started, params=None):
+    """Ghi nhận một lần gọi upstream; response None nghĩa là lỗi mạng/timeout (status 0)."""
+    latency_ms = int((time.monotonic() - started) * 1000)
+    coordinates = (params['lat'], params['lon']) if params and 'lat' in params and 'lon' in params else None
+    recorder.record(request_type, response.status_code if response is not None else 0, latency_ms, coordinates)
+
+
+_db_count = {'expires_at': 0.0, 'calls': 0}
+_db_count_lock = threading.Lock()
+
+
+def _db_calls_last_minute(now):
+    # Dòng đã flush của mọi worker trong 60 giây qua; chậm hơn thực tế tối đa FLUSH_INTERVAL + DB_COUNT_TTL
+    with _db_count_lock:
+        if time.monotonic() >= _db_count['expires_at']:
+            _db_count['calls'] = OpenWeatherMapAPIUsage.objects.filter(
+                api_call_time__gte=datetime.fromtimestamp(now - 60, tz=dt_timezone.utc),
+            ).count()
+            _db_count['expires_at'] = time.monotonic() + get_usage_config()['DB_COUNT_TTL']
+        return _db_count['calls']
+
+
+def calls_last_minute(now=None):
+    """Số lần gọi upstream trong 60 giây qua (cửa sổ trượt xấp xỉ từ bộ đếm theo phút)."""
+    now = now if now is not None else time.time()
+    config = get_usage_config()
+    if not is_shared_cache(config['CACHE_ALIAS']):
+        # Bộ đếm LocMem chỉ thấy process này: đếm từ DB rồi cộng buffer chưa flush
+        return _db_calls_last_minute(now) + recorder.pending_since(now - 60)
+    minute = _minute(now)
+    cache = caches[config['CACHE_ALIAS']]
+    counts = cache.get_many([_counter_key(minute), _counter_key(minute - 1)])
+    current = counts.get(_counter_key(minute), 0) + recorder.pending(minute)
+    previous = counts.get(_counter_key(minute - 1), 0)
+    elapsed = (now % 60) / 60
+    return current + previous * (1 - elapsed)
+
+
+class QuotaGovernor:
+    """Token bucket cho refresh nền theo quota của API key.
+
+    Dung lượng = phần quota dành cho nền trừ đi số lần gọi thực tế (mọi worker, cả request của
+    người dùng) trong phút qua. try_acquire giữ chỗ bằng cache.incr trên bộ đếm có TTL nên các worker
+    chạy song song không cùng lấy một phần quota: token đã cấp được tính cho tới khi lần gọi
+    thực tế xuất hiện trong calls_last_minute. Với cache không dùng chung, việc giữ chỗ chỉ nguyên tử
+    trong process; giữa các worker vẫn dựa vào số đếm từ DB.
+    """
+
+    def __init__(self, quota_per_minute=None, interactive_reserve=None):
+        config = get_usage_config()
+        self.quota_per_minute = quota_per_minute or config['QUOTA_PER_MINUTE']
+        reserve = config['INTERACTIVE_RESERVE'] if interactive_reserve is None else interactive_reserve
+        self.capacity = self.quota_per_minute * (1 - reserve)
+
+    def _reserved(self, cache, slot):
+        # Token của ô hiện tại và ô trước: mỗi token được tính trong RESERVATION_TTL đến 2 * RESERVATION_TTL giây
+        counts = cache.get_many([_reservation_key(slot), _reservation_key(slot - 1)])
+        return sum(counts.values())
+
+    def available(self):
+        # Các lần gọi của process này được tính ngay (buffer chưa flush), của worker khác sau một chu kỳ flush
+        config = get_usage_config()
+        slot = int(time.time() // config['RESERVATION_TTL'])
+        return self.capacity - calls_last_minute() - self._reserved(caches[config['CACHE_ALIAS']], slot)
+
+    def try_acquire(self, amount=1):
+        config = get_usage_config()
+        cache = caches[config['CACHE_ALIAS']]
+        now = time.time()
+        slot = int(now // config['RESERVATION_TTL'])
+        key, ttl = _reservation_key(slot), config['RESERVATION_TTL'] * 2 + 1
+        cache.add(key, 0, ttl)
+        try:
+            reserved = cache.incr(key, amount)
+        except ValueError:  # key vừa hết hạn giữa add và incr
+            cache.add(key, 0, ttl)
+            reserved = cache.incr(key, amount)
+        reserved += cache.get(_reservation_key(slot - 1), 0)
+        if calls_last_minute(now) + reserved <= self.capacity:
+            return True
+        # Vượt quota: trả lại phần vừa giữ (worker khác có thể cũng bị từ chối trong lúc này, không bị vượt)
+        try:
+            cache.decr(key, amount)
+        except ValueError:
+            pass
+        return False
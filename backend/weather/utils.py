@@ -1,98 +1,193 @@
-import requests
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from datetime import datetime
-from .models import WeatherAlert
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import CurrentWeather, WeatherAlert
+from .cache import cached_upstream, coordinate_key, query_key
+from .http import upstream_get
+from .gazetteer import lookup_place, remember_place
+from .response_cache import invalidate_location
+from .alert_rules import alert_inputs, engine as rule_engine
+from .push import publish_alert_changes
 
+GEOCODE_PATH = 'geo/1.0/direct'
+CURRENT_WEATHER_PATH = 'data/2.5/weather'
+FORECAST_PATH = 'data/2.5/forecast'
 
-def geocode_location(location_name):
-    url = f"http://api.openweathermap.org/geo/1.0/direct?q={location_name}&limit=1&appid={settings.OPENWEATHER_API_KEY}"
-    response = requests.get(url)
-    if response.status_code == 200 and response.json():
-        data = response.json()[0]
-        return {
-            'name': data['name'],
-            'latitude': data['lat'],
-            'longitude': data['lon'],
-            'country_code': data.get('country', '')
-        }
+
+def geocode_params(location_name):
+    return {'q': location_name, 'limit': 1, 'appid': settings.OPENWEATHER_API_KEY}
+
+
+def coordinate_params(lat, lon):
+    return {'lat': lat, 'lon': lon, 'appid': settings.OPENWEATHER_API_KEY, 'units': 'metric'}
+
+
+def parse_geocode(data):
+    if not data:
+        return None
+    data = data[0]
+    return {
+        'name': data['name'],
+        'latitude': data['lat'],
+        'longitude': data['lon'],
+        'country_code': data.get('country', '')
+    }
+
+
+def parse_current_weather(data):
+    return {
+        'temperature': data['main']['temp'],
+        'humidity': data['main']['humidity'],
+        'wind_speed': data['wind']['speed'],
+        'pressure': data['main']['pressure'],
+        'weather_condition': data['weather'][0]['description'],
+        'icon_url': f"http://openweathermap.org/img/wn/{data['weather'][0]['icon']}.png",
+    }
+
+
+@cached_upstream('geocode', query_key)
+def fetch_geocode(location_name):
+    response = upstream_get(GEOCODE_PATH, geocode_params(location_name), 'geocode')
+    if response is not None and response.status_code == 200:
+        return parse_geocode(response.json())
     return None
 
+def geocode_location(location_name):
+    # Tra cứu index cục bộ trước, chỉ gọi API khi chưa có và ghi lại kết quả
+    location_data = lookup_place(location_name)
+    if location_data:
+        return location_data
+    location_data = fetch_geocode(location_name)
+    if location_data:
+        remember_place(location_name, location_data)
+    return location_data
+
+@cached_upstream('current', coordinate_key)
 def fetch_current_weather(lat, lon):
-    url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={settings.OPENWEATHER_API_KEY}&units=metric"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        return {
-            'temperature': data['main']['temp'],
-            'humidity': data['main']['humidity'],
-            'wind_speed': data['wind']['speed'],
-            'pressure': data['main']['pressure'],
-            'weather_condition': data['weather'][0]['description'],
-            'icon_url': f"http://openweathermap.org/img/wn/{data['weather'][0]['icon']}.png",
-        }
+    response = upstream_get(CURRENT_WEATHER_PATH, coordinate_params(lat, lon), 'current')
+    if response is not None and response.status_code == 200:
+        return parse_current_weather(response.json())
     return None
 
 
 
+@cached_upstream('forecast', coordinate_key)
 def fetch_forecast(lat, lon):
-    url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={settings.OPENWEATHER_API_KEY}&units=metric"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        forecasts = []
-
-
-        # Short-term (5 ngày, 3 giờ/lần)
-        short_term = []
-        for item in data['list'][:8]:  # Lấy 24 giờ đầu tiên (8 khoảng 3 giờ)
-            short_term.append({
-                'forecast_type': 'short',
-                'forecast_time': datetime.fromtimestamp(item['dt']),
-                'high_temperature': item['main']['temp_max'],
-                'low_temperature': item['main']['temp_min'],
-                'rain_probability': item.get('pop', 0) * 100,  # Tỷ lệ mưa (%)
-                'uv_index': item.get('uvi', 0),  # API miễn phí không có UV, cần API khác nếu muốn chính xác
-            })
-
-
-        # Daily (5 ngày, tổng hợp mỗi ngày)
-        daily = {}
-        for item in data['list']:
-            day = datetime.fromtimestamp(item['dt']).date()
-            if day not in daily:
-                daily[day] = {
-                    'forecast_type': 'daily',
-                    'forecast_time': datetime.fromtimestamp(item['dt']),
-                    'high_temperature': item['main']['temp_max'],
-                    'low_temperature': item['main']['temp_min'],
-                    'rain_probability': item.get('pop', 0) * 100,
-                    'uv_index': item.get('uvi', 0),
-                }
-            else:
-                daily[day]['high_temperature'] = max(daily[day]['high_temperature'], item['main']['temp_max'])
-                daily[day]['low_temperature'] = min(daily[day]['low_temperature'], item['main']['temp_min'])
-                daily[day]['rain_probability'] = max(daily[day]['rain_probability'], item.get('pop', 0) * 100)
-
-
-        forecasts.extend(short_term)
-        forecasts.extend(daily.values())
-
-
-        # Weekly (tổng hợp 5 ngày thành 1 tuần)
-        weekly = {
+    response = upstream_get(FORECAST_PATH, coordinate_params(lat, lon), 'forecast')
+    if response is not None and response.status_code == 200:
+        return parse_forecast(response.json())
+    return None
+
+
+FORECAST_COLUMNS = ['dt', 'temp_max', 'temp_min', 'rain_probability', 'uv_index']
+SHORT_TERM_SLOTS = 8  # 24 giờ đầu tiên (8 khoảng 3 giờ)
+
+
+def forecast_columns(data):
+    """Parse danh sách 3 giờ/lần của /forecast một lần thành các cột song song."""
+    items = data.get('list') or []
+    mains = [item['main'] for item in items]
+    columns = {
+        'dt': [item['dt'] for item in items],
+        'temp_max': [main['temp_max'] for main in mains],
+        'temp_min': [main['temp_min'] for main in mains],
+        'rain_probability': [item.get('pop', 0) * 100 for item in items],  # Tỷ lệ mưa (%)
+        'uv_index': [item.get('uvi', 0) for item in items],  # API miễn phí không có UV, cần API khác nếu muốn chính xác
+        'utc_offset': (data.get('city') or {}).get('timezone', 0),  # giây lệch so với UTC tại vị trí
+    }
+    dt = columns['dt']
+    if any(dt[i] > dt[i + 1] for i in range(len(dt) - 1)):
+        # Gom nhóm theo ngày cần các mốc liên tiếp theo thời gian
+        order = sorted(range(len(dt)), key=dt.__getitem__)
+        for name in FORECAST_COLUMNS:
+            columns[name] = [columns[name][i] for i in order]
+    return columns
+
+
+def group_bounds(keys):
+    # [start, end) của từng nhóm key liên tiếp trong mảng đã sắp xếp
+    breaks = [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]]
+    return list(zip([0] + breaks, breaks + [len(keys)]))
+
+
+def aggregate_forecasts(columns_list):
+    """Tổng hợp short/daily/weekly cho nhiều vị trí trong một lượt, từ các cột của forecast_columns.
+
+    Cột của các vị trí được nối lại; daily gom theo khóa (vị trí, ngày địa phương) trên mảng chung
+    nên mỗi nhóm là một lát cắt liên tiếp và max/min chạy trên slice. Ngày được tính theo múi giờ
+    của vị trí (city.timezone), không theo giờ server. Kết quả theo cùng thứ tự với columns_list.
+    """
+    dt, temp_max, temp_min, rain, uvi, owner, local_days = [], [], [], [], [], [], []
+    zones = []
+    for index, columns in enumerate(columns_list):
+        offset = columns['utc_offset']
+        zones.append((offset, dt_timezone(timedelta(seconds=offset))))
+        dt.extend(columns['dt'])
+        temp_max.extend(columns['temp_max'])
+        temp_min.extend(columns['temp_min'])
+        rain.extend(columns['rain_probability'])
+        uvi.extend(columns['uv_index'])
+        owner.extend([index] * len(columns['dt']))
+        local_days.extend((index, (t + offset) // 86400) for t in columns['dt'])
+
+    short = [[] for _ in columns_list]
+    daily = [[] for _ in columns_list]
+    weekly = [[] for _ in columns_list]
+    if not dt:
+        return short
+
+    def at(i):
+        return datetime.fromtimestamp(dt[i], zones[owner[i]][1])
+
+    for start, end in group_bounds(owner):
+        index = owner[start]
+        offset, tz = zones[index]
+        # Short-term (24 giờ tới, 3 giờ/lần)
+        short[index] = [{
+            'forecast_type': 'short',
+            'forecast_time': at(i),
+            'high_temperature': temp_max[i],
+            'low_temperature': temp_min[i],
+            'rain_probability': rain[i],
+            'uv_index': uvi[i],
+        } for i in range(start, min(start + SHORT_TERM_SLOTS, end))]
+        # Weekly: toàn bộ khoảng dự báo; mốc là đầu ngày địa phương để upsert cập nhật đúng một dòng trong ngày
+        weekly[index] = [{
             'forecast_type': 'weekly',
-            'forecast_time': timezone.now(),
-            'high_temperature': max(item['main']['temp_max'] for item in data['list']),
-            'low_temperature': min(item['main']['temp_min'] for item in data['list']),
-            'rain_probability': max(item.get('pop', 0) * 100 for item in data['list']),
-            'uv_index': max(item.get('uvi', 0) for item in data['list']),
-        }
-        forecasts.append(weekly)
+            'forecast_time': datetime.fromtimestamp(local_days[start][1] * 86400 - offset, tz),
+            'high_temperature': max(temp_max[start:end]),
+            'low_temperature': min(temp_min[start:end]),
+            'rain_probability': max(rain[start:end]),
+            'uv_index': max(uvi[start:end]),
+        }]
 
+    # Daily: gom theo ngày địa phương, mốc đầu tiên của ngày làm forecast_time
+    for start, end in group_bounds(local_days):
+        daily[owner[start]].append({
+            'forecast_type': 'daily',
+            'forecast_time': at(start),
+            'high_temperature': max(temp_max[start:end]),
+            'low_temperature': min(temp_min[start:end]),
+            'rain_probability': max(rain[start:end]),
+            'uv_index': uvi[start],
+        })
+    return [short[i] + daily[i] + weekly[i] for i in range(len(columns_list))]
 
-        return forecasts
-    return None
+
+def aggregate_forecast(columns):
+    return aggregate_forecasts([columns])[0]
+
+
+def parse_forecast(data):
+    return aggregate_forecast(forecast_columns(data))
+
+
+def parse_forecast_batch(responses):
+    """parse_forecast cho nhiều vị trí trong một lượt tổng hợp; phần tử None (lỗi tải) giữ nguyên là None."""
+    aggregated = iter(aggregate_forecasts([forecast_columns(data) for data in responses if data]))
+    return [next(aggregated) if data else None for data in responses]
 
 # def check_weather_alerts(location, current_weather_data, forecast_data=None):
 #     alerts = []
@@ -171,49 +266,117 @@ def fetch_forecast(lat, lon):
 #     # Trả về danh sách cảnh báo hiện tại
 #     return existing_alerts
 
+def save_current_weather(location, current_weather, weather_data):
+    """Tạo mới hoặc cập nhật bản ghi CurrentWeather của vị trí từ dữ liệu vừa tải."""
+    if current_weather is None:
+        return CurrentWeather.objects.create(location=location, **weather_data)
+    for key, value in weather_data.items():
+        setattr(current_weather, key, value)
+    current_weather.timestamp = timezone.now()
+    current_weather.save()
+    return current_weather
+
+
+def weather_snapshot(current_weather):
+    # Dữ liệu đầu vào cho check_weather_alerts từ bản ghi đã lưu
+    return {
+        'temperature': float(current_weather.temperature),
+        'humidity': float(current_weather.humidity),
+        'wind_speed': float(current_weather.wind_speed),
+        'pressure': float(current_weather.pressure),
+        'weather_condition': current_weather.weather_condition,
+        'icon_url': current_weather.icon_url
+    }
+
+
+AlertReconciliation = namedtuple('AlertReconciliation', ['alerts', 'created', 'updated', 'deleted'])
+ALERT_FIELDS = ['message', 'severity', 'recommendation']
+
+
+def evaluate_weather_alerts(location, current_weather_data, forecast_data=None):
+    """Tính danh sách cảnh báo mong muốn (dạng dict) từ dữ liệu thời tiết, không chạm DB.
+
+    Ngưỡng được định nghĩa trong weather/alert_rules.py (có thể ghi đè theo vùng).
+    """
+    return rule_engine.evaluate([location], [alert_inputs(current_weather_data, forecast_data)])[0]
+
+
+def _diff_alerts(location, existing_alerts, desired_alerts):
+    # Mỗi loại cảnh báo có tối đa một bản ghi cho mỗi vị trí
+    existing = {}
+    deleted = []
+    for alert in existing_alerts:
+        if alert.alert_type in existing:
+            deleted.append(alert)  # bản ghi trùng từ cách lưu cũ
+        else:
+            existing[alert.alert_type] = alert
+
+    alerts, created, updated = [], [], []
+    for data in desired_alerts:
+        alert = existing.pop(data['alert_type'], None)
+        if alert is None:
+            alert = WeatherAlert(location=location, **data)
+            created.append(alert)
+        elif any(getattr(alert, field) != data[field] for field in ALERT_FIELDS):
+            if alert.severity != data['severity']:
+                alert.notified_at = None  # đổi mức độ: thông báo lại; chỉ đổi nội dung thì không
+            for field in ALERT_FIELDS:
+                setattr(alert, field, data[field])
+            updated.append(alert)
+        alert.location = location
+        alerts.append(alert)
+    deleted.extend(existing.values())
+    return AlertReconciliation(alerts, created, updated, deleted)
+
+
+def _apply_alert_changes(reconciliations):
+    created = [alert for result in reconciliations for alert in result.created]
+    updated = [alert for result in reconciliations for alert in result.updated]
+    deleted = [alert for result in reconciliations for alert in result.deleted]
+    if not (created or updated or deleted):
+        return
+    with transaction.atomic():
+        if deleted:
+            WeatherAlert.objects.filter(pk__in=[alert.pk for alert in deleted]).delete()
+        if updated:
+            WeatherAlert.objects.bulk_update(updated, ALERT_FIELDS + ['notified_at'])
+        if created:
+            WeatherAlert.objects.bulk_create(created)
+    for location_id in {alert.location_id for alert in created + updated + deleted}:
+        invalidate_location(location_id)
+    publish_alert_changes(reconciliations)
+    # Email cho người theo dõi: subscribers.fan_out_pending_alerts gửi ở tiến trình nền (notified_at = NULL)
+
+
+def reconcile_alerts(location, desired_alerts):
+    """So sánh cảnh báo mong muốn với các bản ghi hiện có và chỉ ghi phần thay đổi.
+
+    Bản ghi giữ nguyên issued_at khi chỉ nội dung thay đổi. Trả về các object
+    trong bộ nhớ, không query lại.
+    """
+    existing = WeatherAlert.objects.filter(location=location).order_by('id')
+    result = _diff_alerts(location, existing, desired_alerts)
+    _apply_alert_changes([result])
+    return result
+
+
+def reconcile_alerts_batch(desired_by_location):
+    """reconcile_alerts cho nhiều vị trí: một query đọc, một lượt ghi cho mọi thay đổi.
+
+    desired_by_location: danh sách (location, desired_alerts); kết quả theo cùng thứ tự.
+    """
+    existing_by_location = {}
+    locations = [location for location, _ in desired_by_location]
+    for alert in WeatherAlert.objects.filter(location__in=locations).order_by('id'):
+        existing_by_location.setdefault(alert.location_id, []).append(alert)
+    results = [
+        _diff_alerts(location, existing_by_location.get(location.pk, []), desired)
+        for location, desired in desired_by_location
+    ]
+    _apply_alert_changes(results)
+    return results
+
+
 def check_weather_alerts(location, current_weather_data, forecast_data=None):
-    alerts = []
-    temp = current_weather_data.get('temperature', 0)
-    wind_speed = current_weather_data.get('wind_speed', 0)
-    humidity = current_weather_data.get('humidity', 0)
-    condition = current_weather_data.get('weather_condition', '').lower()
-
-    def add_alert(alert_type, message, severity=None, recommendation=None):
-        WeatherAlert.objects.create(
-            location=location,
-            alert_type=alert_type,
-            message=message,
-            severity=severity or 'low',
-            recommendation=recommendation or ''
-        )
-
-    WeatherAlert.objects.filter(location=location).delete()
-
-    is_dangerous = False
-    if wind_speed > 20 or 'storm' in condition or 'thunderstorm' in condition:
-        is_dangerous = True
-        add_alert('storm', f"Storm warning in {location.name}: High winds ({wind_speed} m/s) or stormy conditions detected.",
-                 'high' if wind_speed > 25 else 'medium', 'Stay indoors, secure outdoor objects.')
-    if temp > 40:
-        is_dangerous = True
-        add_alert('extreme_temperature', f"Extreme heat warning in {location.name}: Temperature reached {temp}°C.",
-                 'high', 'Stay hydrated, avoid outdoor activities.')
-    elif temp < -10:
-        is_dangerous = True
-        add_alert('extreme_temperature', f"Extreme cold warning in {location.name}: Temperature dropped to {temp}°C.",
-                 'high', 'Dress warmly, limit outdoor exposure.')
-    if 'fog' in condition and humidity > 90:
-        is_dangerous = True
-        add_alert('fog', f"Dense fog warning in {location.name}: Low visibility due to high humidity ({humidity}%).",
-                 'medium', 'Drive slowly, use fog lights.')
-    if forecast_data:
-        max_rain_prob = max(item.get('rain_probability', 0) for item in forecast_data)
-        if max_rain_prob > 80:
-            is_dangerous = True
-            add_alert('flood', f"Flood risk in {location.name}: High rain probability ({max_rain_prob}%) expected.",
-                     'high', 'Avoid low-lying areas, prepare emergency supplies.')
-    if not is_dangerous:
-        add_alert('good_weather', f"Great weather in {location.name}: Temperature at {temp}°C, {condition}.",
-                 'low', 'Perfect day for outdoor activities!')
-
-    return WeatherAlert.objects.filter(location=location)
+    desired_alerts = evaluate_weather_alerts(location, current_weather_data, forecast_data)
+    return reconcile_alerts(location, desired_alerts).alerts
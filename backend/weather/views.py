@@ -2,63 +2,84 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import Throttled
 from .models import Location, CurrentWeather, Forecast, NewsArticle, UserProfile, WeatherAlert
 from .serializers import (
     CurrentWeatherSerializer, ForecastSerializer, NewsArticleSerializer, 
     LocationInputSerializer, UserRegistrationSerializer, UserLoginSerializer, 
-    WeatherAlertSerializer, UserProfileSerializer, FavoriteLocationSerializer, 
-    NotificationSettingsSerializer
+    WeatherAlertSerializer, UserProfileSerializer, FavoriteLocationSerializer, LocationSerializer,
+    NotificationSettingsSerializer, PlaceSuggestionSerializer, BatchLocationInputSerializer, HistoryQuerySerializer
 )
-from .utils import fetch_current_weather, fetch_forecast, geocode_location, check_weather_alerts
+from .utils import fetch_current_weather, fetch_forecast, check_weather_alerts, weather_snapshot
+from .geo import has_location_input, resolve_location
+from .gazetteer import index as place_index
+from .batch import get_batch_config, get_batch_weather, resolve_batch_locations
+from .conditional import conditional_response, make_etag
+from .authentication import fresh_user
+from .throttling import client_ip, login_throttle
+from .fast_serializers import FastJSONResponse, fast_alerts, fast_forecasts, requested_fields
+from .response_cache import (
+    cached_response, current_generation, get_cached_response, input_alias, remember_alias, store_response,
+)
+from .pagination import CurrentWeatherPagination, ForecastPagination, NewsArticlePagination, WeatherAlertPagination
+from .refresh import EXPIRED, STALE, freshness, get_refresh_config, mark_location_requested, stale_refresher
+from .forecasts import get_forecasts
+from .mail_queue import enqueue_alert_notifications, enqueue_mail
+from .history import get_history_config, observation_series
+from django.db.models import Count, Max
 from django.utils import timezone
-from datetime import timedelta, datetime
 from rest_framework.authtoken.models import Token
 from django.shortcuts import get_object_or_404
 import uuid
-from django.core.mail import send_mail
 
 import logging
 logger = logging.getLogger(__name__)
 
-class CurrentWeatherViewSet(viewsets.ModelViewSet):
+NEWS_MAX_AGE = 60  # Tin tức ít thay đổi, cho phép client dùng lại trong 1 phút
+
+class EagerLoadingViewSetMixin:
+    # Áp dụng select_related/prefetch_related mà serializer khai báo (tránh N+1 khi list)
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+class CurrentWeatherViewSet(EagerLoadingViewSetMixin, viewsets.ModelViewSet):
     queryset = CurrentWeather.objects.all()
     serializer_class = CurrentWeatherSerializer
+    pagination_class = CurrentWeatherPagination
 
     @action(detail=False, methods=['post'], serializer_class=LocationInputSerializer)
     def by_location(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        location_data = None
-        latitude = serializer.validated_data.get('latitude')
-        longitude = serializer.validated_data.get('longitude')
-        location_name = serializer.validated_data.get('name')
-
         logger.info(f"Request data: {request.data}")
+        if not has_location_input(serializer.validated_data):
+            return Response({"error": "Invalid location data"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if latitude and longitude:
-            try:
-                location = Location.objects.get(latitude=latitude, longitude=longitude)
-                logger.info(f"Found location by coordinates: {location}")
-            except Location.DoesNotExist:
-                location_data = {'name': 'Custom Location', 'latitude': latitude, 'longitude': longitude, 'country_code': ''}
-                location = Location.objects.create(**location_data)
-                logger.info(f"Created new location by coordinates: {location_data}")
-        elif location_name:
-            location_data = geocode_location(location_name)
-            logger.info(f"Geocoded location data: {location_data}")
-            if not location_data:
-                logger.error(f"Could not geocode location: {location_name}")
-                return Response({"error": "Could not find location"}, status=404)
-            try:
-                location = Location.objects.get(latitude=location_data['latitude'], longitude=location_data['longitude'])
-                logger.info(f"Found existing location: {location}")
-            except Location.DoesNotExist:
-                location = Location.objects.create(**location_data)
-                logger.info(f"Created new location: {location_data}")
-
+        # Response đã render cho vị trí này: một lần đọc cache, không query DB.
+        # Entry chỉ sống khi dữ liệu còn FRESH nên bỏ qua mark_location_requested/stale_refresher là an toàn:
+        # khi dữ liệu sang STALE, request sau sẽ miss, đánh dấu vị trí và lên lịch refresh nền
+        alias = input_alias(serializer.validated_data)
+        entry = get_cached_response(alias)
+        if entry is not None:
+            return cached_response(request, entry, get_refresh_config()['FRESH_FOR'])
+
+        location = resolve_location(serializer.validated_data)
+        if location is None:
+            logger.error(f"Could not geocode location: {serializer.validated_data.get('name')}")
+            return Response({"error": "Could not find location"}, status=404)
+        logger.info(f"Resolved location: {location}")
+        remember_alias(alias, location.pk)
+        generation = current_generation(location.pk)  # trước khi đọc/lấy dữ liệu, xem store_response
+
+        mark_location_requested(location)
         try:
             current_weather = CurrentWeather.objects.filter(location=location).first()
+            state = freshness(current_weather)
             if not current_weather:
                 weather_data = fetch_current_weather(location.latitude, location.longitude)
                 logger.info(f"Fetched new weather data: {weather_data}")
@@ -67,7 +88,11 @@ class CurrentWeatherViewSet(viewsets.ModelViewSet):
                 else:
                     logger.error("Failed to fetch weather data")
                     return Response({"error": "Failed to fetch weather data"}, status=500)
-            elif timezone.now() - current_weather.timestamp > timedelta(minutes=5):
+            elif state == STALE:
+                # Stale-while-revalidate: trả dữ liệu cũ, refresh ở thread nền không chặn response
+                stale_refresher.schedule(location)
+                logger.info(f"Serving stale weather for {location}, background refresh scheduled")
+            elif state == EXPIRED:
                 weather_data = fetch_current_weather(location.latitude, location.longitude)
                 logger.info(f"Updated weather data: {weather_data}")
                 if weather_data:
@@ -78,56 +103,97 @@ class CurrentWeatherViewSet(viewsets.ModelViewSet):
                 else:
                     logger.warning("Using old weather data due to fetch failure")
 
+            current_weather.location = location  # serializer dùng lại object, không query Location lần nữa
             forecast_data = fetch_forecast(location.latitude, location.longitude)
             logger.info(f"Forecast data: {forecast_data}")
-            alerts = check_weather_alerts(location, {
-                'temperature': float(current_weather.temperature),
-                'humidity': float(current_weather.humidity),
-                'wind_speed': float(current_weather.wind_speed),
-                'pressure': float(current_weather.pressure),
-                'weather_condition': current_weather.weather_condition,
-                'icon_url': current_weather.icon_url
-            }, forecast_data)
-
-            serializer = CurrentWeatherSerializer(current_weather)
-            return Response({
-                'weather': serializer.data,
-                'alerts': WeatherAlertSerializer(alerts, many=True).data if alerts else []
-            })
+            alerts = check_weather_alerts(location, weather_snapshot(current_weather), forecast_data)
+
+            # ETag từ phiên bản bản ghi thời tiết + nội dung cảnh báo: 304 khi client đã có bản này
+            etag = make_etag(request, current_weather.pk, current_weather.updated_at.isoformat(),
+                             *[(alert.pk, alert.severity, alert.message) for alert in alerts])
+            config = get_refresh_config()
+            age = (timezone.now() - current_weather.timestamp).total_seconds()
+
+            def build():
+                response = FastJSONResponse({
+                    'weather': CurrentWeatherSerializer(current_weather).data,
+                    'alerts': fast_alerts.serialize_many(alerts) if alerts else []
+                })
+                # Giữ tới khi dữ liệu hết FRESH (dữ liệu STALE không được cache); ghi CurrentWeather/WeatherAlert
+                # sẽ xóa entry sớm hơn
+                store_response(location.pk, generation, response.content, etag, current_weather.updated_at,
+                               current_weather.timestamp, config['FRESH_FOR'] - age)
+                return response
+
+            return conditional_response(
+                request,
+                build,
+                etag=etag,
+                last_modified=current_weather.updated_at,
+                max_age=config['FRESH_FOR'] - age,
+            )
         except Exception as e:
             logger.error(f"Error processing weather data: {str(e)}")
             return Response({"error": "Internal server error"}, status=500)
 
-class WeatherAlertViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], serializer_class=BatchLocationInputSerializer)
+    def batch(self, request):
+        max_locations = get_batch_config()['MAX_LOCATIONS']
+        context = {**self.get_serializer_context(), 'max_locations': max_locations}
+        serializer = self.get_serializer(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if data['favorites'] and not request.user.is_authenticated:
+            return Response({"error": "Authentication required for favorites"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Gom tất cả vị trí theo id trong một query
+        location_ids = list(data.get('location_ids', []))
+        locations = list(Location.objects.filter(id__in=location_ids)) if location_ids else []
+        if data['favorites']:
+            locations.extend(request.user.favorite_locations.all())
+        unresolved = []
+        items = data.get('locations', [])
+        for item, location in zip(items, resolve_batch_locations(items)):
+            if location is None:
+                unresolved.append(item.get('name'))
+            else:
+                locations.append(location)
+
+        unique_locations = list({location.id: location for location in locations}.values())[:max_locations]
+        found_ids = {location.id for location in unique_locations}
+        results = []
+        for location, current_weather, alerts, error in get_batch_weather(unique_locations):
+            # Mục lỗi và mục thành công có cùng các key
+            results.append({
+                'location': LocationSerializer(location).data,
+                'weather': CurrentWeatherSerializer(current_weather).data if current_weather else None,
+                'alerts': WeatherAlertSerializer(alerts, many=True).data if alerts else [],
+                'error': error,
+            })
+        return Response({
+            'results': results,
+            'not_found': unresolved + [location_id for location_id in location_ids if location_id not in found_ids],
+        })
+
+class WeatherAlertViewSet(EagerLoadingViewSetMixin, viewsets.ModelViewSet):
     queryset = WeatherAlert.objects.all()
     serializer_class = WeatherAlertSerializer
+    pagination_class = WeatherAlertPagination
 
     @action(detail=False, methods=['post'], serializer_class=LocationInputSerializer)
     def by_location(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        latitude = serializer.validated_data.get('latitude')
-        longitude = serializer.validated_data.get('longitude')
-        location_name = serializer.validated_data.get('name')
-
-        # Xác định vị trí
-        if latitude and longitude:
-            try:
-                location = Location.objects.get(latitude=latitude, longitude=longitude)
-            except Location.DoesNotExist:
-                location_data = {'name': 'Custom Location', 'latitude': latitude, 'longitude': longitude, 'country_code': ''}
-                location = Location.objects.create(**location_data)
-        elif location_name:
-            location_data = geocode_location(location_name)
-            if not location_data:
-                return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
-            try:
-                location = Location.objects.get(latitude=location_data['latitude'], longitude=location_data['longitude'])
-            except Location.DoesNotExist:
-                location = Location.objects.create(**location_data)
-        else:
+        # Xác định vị trí (gắn vào vị trí có sẵn gần nhất)
+        if not has_location_input(serializer.validated_data):
             return Response({"error": "Invalid location data"}, status=status.HTTP_400_BAD_REQUEST)
+        location = resolve_location(serializer.validated_data)
+        if location is None:
+            return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
+
+        mark_location_requested(location)
 
         # Lấy dữ liệu thời tiết và kiểm tra cảnh báo
         weather_data = fetch_current_weather(location.latitude, location.longitude)
@@ -137,13 +203,13 @@ class WeatherAlertViewSet(viewsets.ModelViewSet):
         forecast_data = fetch_forecast(location.latitude, location.longitude)
         alerts = check_weather_alerts(location, weather_data, forecast_data)
 
-        # Sử dụng serializer để trả về dữ liệu đúng định dạng
-        serialized_alerts = WeatherAlertSerializer(alerts, many=True).data
-        return Response(serialized_alerts, status=status.HTTP_200_OK)
+        # Serialize nhanh, output giống hệt WeatherAlertSerializer
+        return FastJSONResponse(fast_alerts.serialize_many(alerts), status=status.HTTP_200_OK)
 
-class ForecastViewSet(viewsets.ModelViewSet):
+class ForecastViewSet(EagerLoadingViewSetMixin, viewsets.ModelViewSet):
     queryset = Forecast.objects.all()
     serializer_class = ForecastSerializer
+    pagination_class = ForecastPagination
 
     def retrieve(self, request, *args, **kwargs):
         location_id = kwargs.get('pk')
@@ -153,20 +219,12 @@ class ForecastViewSet(viewsets.ModelViewSet):
         except Location.DoesNotExist:
             return Response({"error": "Location not found"}, status=404)
 
-        # Xóa dữ liệu cũ và cập nhật dự báo mới
-        Forecast.objects.filter(location=location).delete()
-        forecast_data = fetch_forecast(location.latitude, location.longitude)
-        if not forecast_data:
+        # Dùng dự báo đã lưu nếu còn mới, nếu không thì tải lại và upsert
+        forecasts = get_forecasts(location, forecast_type)
+        if forecasts is None:
             return Response({"error": "Failed to fetch forecast data"}, status=500)
 
-        forecasts = []
-        for item in forecast_data:
-            if item['forecast_type'] == forecast_type:
-                forecast = Forecast.objects.create(location=location, **item)
-                forecasts.append(forecast)
-
-        serializer = self.get_serializer(forecasts, many=True)
-        return Response(serializer.data)
+        return self.forecast_response(request, location, forecasts)
 
     @action(detail=True, methods=['get'])
     def all_types(self, request, pk=None):
@@ -175,29 +233,95 @@ class ForecastViewSet(viewsets.ModelViewSet):
         except Location.DoesNotExist:
             return Response({"error": "Location not found"}, status=404)
 
-        # Xóa dữ liệu cũ và cập nhật dự báo mới
-        Forecast.objects.filter(location=location).delete()
-        forecast_data = fetch_forecast(location.latitude, location.longitude)
-        if not forecast_data:
+        forecasts = get_forecasts(location)
+        if forecasts is None:
             return Response({"error": "Failed to fetch forecast data"}, status=500)
 
-        forecasts = [Forecast.objects.create(location=location, **item) for item in forecast_data]
-        serializer = self.get_serializer(forecasts, many=True)
-        return Response(serializer.data)
+        return self.forecast_response(request, location, forecasts)
+
+    def forecast_response(self, request, location, forecasts):
+        last_modified = max((forecast.updated_at for forecast in forecasts), default=None)
+        max_age = None
+        if last_modified:
+            age = (timezone.now() - last_modified).total_seconds()
+            max_age = get_refresh_config()['FORECAST_FRESH_FOR'] - age
+        return conditional_response(
+            request,
+            lambda: FastJSONResponse(fast_forecasts.serialize_many(forecasts, requested_fields(request))),
+            etag=make_etag(request, location.pk, last_modified, len(forecasts)),
+            last_modified=last_modified,
+            max_age=max_age,
+        )
+
+class PlaceViewSet(viewsets.ViewSet):
+    permission_classes = [AllowAny]
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Gợi ý từ index trong bộ nhớ, không gọi API
+        suggestions = place_index.search(query, limit)
+        return Response(PlaceSuggestionSerializer(suggestions, many=True).data)
+
+class HistoryViewSet(viewsets.ViewSet):
+    permission_classes = [AllowAny]
+    lookup_value_regex = r'\d+'
+
+    def retrieve(self, request, pk=None):
+        # /api/history/<location_id>/?start=...&end=...&resolution=raw|hour|day
+        config = get_history_config()
+        serializer = HistoryQuerySerializer(data=request.query_params, context={'max_range_days': config['MAX_RANGE_DAYS']})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if not Location.objects.filter(id=pk).exists():
+            return Response({"error": "Location not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        points = observation_series(pk, data['start'], data['end'], data['resolution'])
+        return FastJSONResponse({
+            'location_id': int(pk),
+            'resolution': data['resolution'],
+            'start': data['start'],
+            'end': data['end'],
+            'points': points,
+        })
 
 class NewsArticleViewSet(viewsets.ModelViewSet):
     queryset = NewsArticle.objects.all().order_by('-published_at')  # Sắp xếp theo thời gian mới nhất
     serializer_class = NewsArticleSerializer
+    pagination_class = NewsArticlePagination
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Một query aggregate thay cho việc serialize trang khi không có gì thay đổi
+        version = queryset.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+
+        def build():
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        return conditional_response(
+            request,
+            build,
+            etag=make_etag(request, version['count'], version['last_modified']),
+            last_modified=version['last_modified'],
+            max_age=NEWS_MAX_AGE,
+        )
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return conditional_response(
+            request,
+            lambda: Response(self.get_serializer(instance).data),
+            etag=make_etag(request, instance.pk, instance.updated_at),
+            last_modified=instance.updated_at,
+            max_age=NEWS_MAX_AGE,
+        )
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -232,9 +356,16 @@ class AuthViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['post'])
     def login(self, request):
-        print("Request data:", request.data)
-        serializer = UserLoginSerializer(data=request.data)
+        login = str(request.data.get('login') or '')
+        ip = client_ip(request)
+        # Từ chối trước khi hash mật khẩu; lần thử được tính ngay (giữ chỗ) để request đồng thời không vượt giới hạn
+        wait = login_throttle.acquire(ip, login)
+        if wait is not None:
+            raise Throttled(wait=wait, detail="Too many failed login attempts. Try again later.")
+
+        serializer = UserLoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
+            login_throttle.succeeded(ip, login)
             user = serializer.validated_data['user']
             token, created = Token.objects.get_or_create(user=user)
             return Response({
@@ -248,7 +379,8 @@ class AuthViewSet(viewsets.ViewSet):
                     'last_name': user.last_name
                 }
             }, status=status.HTTP_200_OK)
-        print("Validation errors:", serializer.errors)
+        if not (login and request.data.get('password')):
+            login_throttle.release(ip, login)  # không hash mật khẩu: không tính là lần sai
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'])
@@ -260,12 +392,13 @@ class AuthViewSet(viewsets.ViewSet):
         user.save()
 
         reset_link = f"http://localhost:8000/api/auth/reset-password/{token}/"
-        send_mail(
+        # Gửi qua hàng đợi (send_queued_mail), response không phải chờ SMTP
+        enqueue_mail(
+            user.email,
             'Reset Your Password',
             f'Click this link to reset your password: {reset_link}',
-            'from@example.com',
-            [user.email],
-            fail_silently=False,
+            kind='password_reset',
+            user=user,
         )
         return Response({'message': 'Password reset link sent to your email.'}, status=status.HTTP_200_OK)
 
@@ -286,9 +419,13 @@ class UserProfileViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def profile(self, request):
-        user = request.user
-        serializer = UserProfileSerializer(user)
-        return Response(serializer.data)
+        # updated_at đổi khi user hoặc vị trí yêu thích thay đổi (đọc từ DB, đúng ở mọi worker)
+        user, updated_at = fresh_user(request.user)
+        return conditional_response(
+            request,
+            lambda: Response(UserProfileSerializer(user).data),
+            etag=make_etag(request, user.pk, updated_at.isoformat()),
+        )
 
     @action(detail=False, methods=['post'])
     def update_profile(self, request):
@@ -304,27 +441,11 @@ class UserProfileViewSet(viewsets.ViewSet):
         serializer = LocationInputSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        location_data = None
-        latitude = serializer.validated_data.get('latitude')
-        longitude = serializer.validated_data.get('longitude')
-        location_name = serializer.validated_data.get('name')
-
-        if latitude and longitude:
-            try:
-                location = Location.objects.get(latitude=latitude, longitude=longitude)
-            except Location.DoesNotExist:
-                location_data = {'name': 'Custom Location', 'latitude': latitude, 'longitude': longitude, 'country_code': ''}
-                location = Location.objects.create(**location_data)
-        elif location_name:
-            location_data = geocode_location(location_name)
-            if not location_data:
-                return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
-            try:
-                location = Location.objects.get(latitude=location_data['latitude'], longitude=location_data['longitude'])
-            except Location.DoesNotExist:
-                location = Location.objects.create(**location_data)
-        else:
+        if not has_location_input(serializer.validated_data):
             return Response({"error": "Invalid location data"}, status=status.HTTP_400_BAD_REQUEST)
+        location = resolve_location(serializer.validated_data)
+        if location is None:
+            return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
 
         user = request.user
         user.favorite_locations.add(location)
@@ -359,27 +480,14 @@ class UserProfileViewSet(viewsets.ViewSet):
         serializer = LocationInputSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        latitude = serializer.validated_data.get('latitude')
-        longitude = serializer.validated_data.get('longitude')
-        location_name = serializer.validated_data.get('name')
-
-        # Xác định vị trí
-        if latitude and longitude:
-            try:
-                location = Location.objects.get(latitude=latitude, longitude=longitude)
-            except Location.DoesNotExist:
-                location_data = {'name': 'Custom Location', 'latitude': latitude, 'longitude': longitude, 'country_code': ''}
-                location = Location.objects.create(**location_data)
-        elif location_name:
-            location_data = geocode_location(location_name)
-            if not location_data:
-                return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
-            try:
-                location = Location.objects.get(latitude=location_data['latitude'], longitude=location_data['longitude'])
-            except Location.DoesNotExist:
-                location = Location.objects.create(**location_data)
-        else:
+        # Xác định vị trí (gắn vào vị trí có sẵn gần nhất)
+        if not has_location_input(serializer.validated_data):
             return Response({"error": "Invalid location data"}, status=status.HTTP_400_BAD_REQUEST)
+        location = resolve_location(serializer.validated_data)
+        if location is None:
+            return Response({"error": "Could not find location"}, status=status.HTTP_404_NOT_FOUND)
+
+        mark_location_requested(location)
 
         # Lấy dữ liệu thời tiết và dự báo
         weather_data = fetch_current_weather(location.latitude, location.longitude)
@@ -401,16 +509,8 @@ class UserProfileViewSet(viewsets.ViewSet):
             if notification_settings.get(alert.alert_type, False)  # Sửa từ alert['alert_type'] thành alert.alert_type
         ]
 
-        # Gửi email thông báo (nếu có)
-        for alert in filtered_alerts:
-            send_mail(
-                f"Weather Alert: {alert.alert_type.capitalize()}",
-                f"{alert.message}\nRecommendation: {alert.recommendation or 'No recommendation'}",
-                'from@example.com',
-                [user.email],
-                fail_silently=True,
-            )
+        # Xếp hàng email thông báo (nếu có), các cảnh báo được gộp thành một email
+        enqueue_alert_notifications(user, filtered_alerts)
 
         # Serialize dữ liệu để trả về dưới dạng JSON
-        serialized_alerts = WeatherAlertSerializer(filtered_alerts, many=True).data
-        return Response(serialized_alerts, status=status.HTTP_200_OK)
\ No newline at end of file
+        return FastJSONResponse(fast_alerts.serialize_many(filtered_alerts), status=status.HTTP_200_OK)
\ No newline at end of file
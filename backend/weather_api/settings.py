@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -150,8 +151,16 @@ EMAIL_HOST_PASSWORD = 'mlzu wysu qvja xcbs'
 DEFAULT_FROM_EMAIL = '1150080090@sv.hcmunre.edu.vn'
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',  # Mặc định
-    'weather.backends.EmailBackend',  # Thêm backend tùy chỉnh
+    'weather.backends.UsernameOrEmailBackend',  # Username hoặc email, một query (thay cho ModelBackend)
+]
+
+# Hasher đầu tiên dùng cho mật khẩu mới; hash theo hasher khác được băm lại khi đăng nhập
+PASSWORD_HASHERS = [
+    'weather.hashers.ConfigurablePBKDF2PasswordHasher',  # số vòng: WEATHER_LOGIN['PBKDF2_ITERATIONS']
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
 ]
 
 
@@ -161,12 +170,13 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True # Cho phép gửi cookie, token, v.v.
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']  # Cho phép frontend gửi lại If-None-Match khi polling
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'weather.authentication.CachedTokenAuthentication',  # TokenAuthentication có cache (xem WEATHER_AUTH_CACHE)
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -192,4 +202,166 @@ LOGGING = {
             'level': 'INFO',
         },
     },
-}
\ No newline at end of file
+}
+
+# Cache dùng chung giữa các worker (response cache, token cache, bộ đếm quota, version stamp...).
+# Khi chạy nhiều worker/process, đặt WEATHER_REDIS_URL (vd. redis://localhost:6379/1, cần package redis).
+# Không đặt thì mỗi process có LocMemCache riêng; các tính năng cần cache chung tự tắt hoặc dùng DB
+# (xem weather.cache.is_shared_cache).
+REDIS_URL = os.environ.get('WEATHER_REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Cache cho các response từ OpenWeatherMap (xem weather/cache.py)
+WEATHER_UPSTREAM_CACHE = {
+    'BACKEND': 'memory',  # 'memory' hoặc 'django' để dùng chung giữa các worker
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 1024,
+    'COORD_PRECISION': 2,
+    'TTLS': {
+        'current': 300,
+        'forecast': 1800,
+        'geocode': 86400,
+    },
+}
+
+# Gộp các request đồng thời tới cùng một vị trí (xem weather/singleflight.py)
+WEATHER_SINGLE_FLIGHT = {
+    'ADVISORY_LOCK': True,  # chỉ áp dụng khi WEATHER_UPSTREAM_CACHE['BACKEND'] = 'django'
+    'WAIT_TIMEOUT': 10,
+}
+
+# HTTP client dùng chung cho OpenWeatherMap (xem weather/http.py)
+WEATHER_HTTP_CLIENT = {
+    'BASE_URL': 'http://api.openweathermap.org',
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'POOL_MAXSIZE': 32,
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.3,
+    'BACKOFF_JITTER': 0.2,
+}
+
+# Refresh nền cho các vị trí "nóng": python manage.py refresh_weather (xem weather/refresh.py)
+WEATHER_REFRESH = {
+    'FRESH_FOR': 300,
+    'STALE_FOR': 900,
+    'REFRESH_ON_STALE': True,  # request gặp dữ liệu 5-15 phút tuổi tự refresh ở thread nền
+    'FORECAST_FRESH_FOR': 1800,
+    'REFRESH_AHEAD': 60,
+    'HOT_WINDOW': 3600,
+    'INTERVAL': 30,
+    'RATE_BUDGET': 50,
+}
+
+# Các request trong bán kính này (km) dùng chung một Location (xem weather/geo.py)
+WEATHER_LOCATION_SNAP_KM = 2
+
+# Endpoint /api/current/batch/ (xem weather/batch.py)
+WEATHER_BATCH = {
+    'MAX_LOCATIONS': 50,
+    'MAX_WORKERS': 8,
+}
+
+# Phân trang cursor cho các API danh sách (xem weather/pagination.py)
+WEATHER_PAGINATION = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Cache JSON đã render của /api/current/by_location/ theo Location (xem weather/response_cache.py)
+WEATHER_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',  # cần cache dùng chung (Redis/Memcached) để chia sẻ giữa các worker
+    'REQUIRE_SHARED': True,  # tự tắt khi CACHE_ALIAS là LocMem (chưa đặt WEATHER_REDIS_URL)
+    'ALIAS_ENTRIES': 4096,
+}
+
+# Lịch sử thời tiết /api/history/<location_id>/ (xem weather/history.py)
+WEATHER_HISTORY = {
+    'MAX_RAW_POINTS': 5000,
+    'MAX_RANGE_DAYS': 366,
+}
+
+# Rollup + xóa dữ liệu cũ: python manage.py weather_maintenance (xem weather/maintenance.py)
+WEATHER_MAINTENANCE = {
+    'USAGE_RAW_DAYS': 7,
+    'USAGE_ROLLUP_DAYS': 400,
+    'ROLLUP_LOOKBACK_HOURS': 3,  # usage flush trễ vẫn được cộng vào các giờ đã rollup
+    'OBSERVATION_DAYS': 400,
+    'ALERT_DAYS': 30,
+    'FORECAST_DAYS': 2,
+    'BATCH_SIZE': 5000,
+}
+
+# Ghi nhận request tới OpenWeatherMap + giới hạn quota cho refresh nền (xem weather/usage.py)
+WEATHER_API_USAGE = {
+    'ENABLED': True,
+    'FLUSH_SIZE': 200,
+    'FLUSH_INTERVAL': 5,
+    'QUOTA_PER_MINUTE': 60,  # theo gói của API key
+    'INTERACTIVE_RESERVE': 0.3,
+    'DB_COUNT_TTL': 5,  # không có WEATHER_REDIS_URL: quota được đếm từ bảng usage thay vì bộ đếm trong cache
+    'RESERVATION_TTL': 10,  # giây giữ token refresh nền đã cấp, tới khi lần gọi thực tế được flush
+}
+
+# Luật cảnh báo bổ sung/ghi đè luật mặc định theo name (xem weather/alert_rules.py), ví dụ:
+# {'name': 'storm', 'alert_type': 'storm', 'conditions': [['wind_speed', 'gt', 17]], 'severity': 'medium',
+#  'message': "Storm warning in {location}: High winds ({wind_speed} m/s).", 'recommendation': 'Stay indoors.'}
+# Ngưỡng riêng theo vùng: thêm dòng AlertRule với country_code tương ứng.
+WEATHER_ALERT_RULES = []
+
+# Hàng đợi email: python manage.py send_queued_mail (xem weather/mail_queue.py)
+WEATHER_MAIL_QUEUE = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 60,
+    'DIGEST_WINDOW': 60,
+    'DEDUPE_WINDOW': 3600,  # Cùng nội dung cho cùng user không được gửi lại trong 1 giờ
+}
+
+# Email cảnh báo cho người theo dõi vị trí: gửi bởi evaluate_alerts / refresh_weather (xem weather/subscribers.py)
+WEATHER_SUBSCRIBERS = {
+    'LOCAL_MAX_AGE': 60,  # Không có Redis: thay đổi yêu thích ở worker khác có hiệu lực sau tối đa 60 giây
+    'BATCH_SIZE': 1000,
+}
+
+# Đẩy cập nhật qua Server-Sent Events: GET /api/async/stream/?locations=1,2 (xem weather/push.py)
+# 'auto': qua Redis khi đặt WEATHER_REDIS_URL (cần package redis); không có thì chỉ trong process,
+# nên cập nhật từ refresh_weather/evaluate_alerts chạy riêng không tới được stream
+WEATHER_PUSH = {
+    'ENABLED': True,
+    'BROKER': 'auto',
+    'REDIS_URL': REDIS_URL or 'redis://localhost:6379/0',
+    'HEARTBEAT': 25,
+    'MAX_LOCATIONS': 50,
+}
+
+# Cache token -> user cho CachedTokenAuthentication (xem weather/authentication.py)
+WEATHER_AUTH_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 4096,
+    'LOCAL_TTL': 30,  # độ trễ tối đa để worker khác thấy token bị xóa
+    'SHARED_TTL': 300,  # chỉ dùng khi có WEATHER_REDIS_URL; lưu user_id + is_active, không lưu object user
+    'CACHE_ALIAS': 'default',
+}
+
+# Đăng nhập: số vòng PBKDF2 và giới hạn số lần sai theo IP/tài khoản (xem weather/backends.py)
+WEATHER_LOGIN = {
+    'PBKDF2_ITERATIONS': None,  # None = mặc định của Django
+    'THROTTLE': True,
+    'WINDOW': 300,
+    'MAX_FAILURES_PER_IP': 20,
+    'MAX_FAILURES_PER_ACCOUNT': 5,
+}
@@ -27,9 +27,23 @@ export const resetPassword = (token, password) => api.post(`/auth/reset-password
 
 export const getCurrentWeather = (locationData) => api.post('/current/by_location/', locationData);
 export const getWeatherAlerts = (locationData) => api.post('/alerts/by_location/', locationData);
+// Thời tiết + cảnh báo cho nhiều vị trí trong một request, ví dụ { favorites: true }
+export const getBatchWeather = (batchData) => api.post('/current/batch/', batchData);
 export const getForecast = (locationId, type = 'daily') =>
   api.get(`/forecast/${locationId}/?type=${type}`);
 export const getAllForecastTypes = (locationId) => api.get(`/forecast/${locationId}/all_types/`);
 export const getNewsArticles = () => api.get('/news/');
 
+// Nhận cập nhật thời tiết/cảnh báo/dự báo qua Server-Sent Events thay vì poll by_location.
+// handlers: { weather, alerts, forecast } nhận dữ liệu đã parse; trả về hàm để đóng kết nối.
+export const subscribeToUpdates = (locationIds, handlers) => {
+  const source = new EventSource(`${API_URL}/async/stream/?locations=${locationIds.join(',')}`);
+  ['weather', 'alerts', 'forecast'].forEach((kind) => {
+    if (handlers[kind]) {
+      source.addEventListener(kind, (event) => handlers[kind](JSON.parse(event.data)));
+    }
+  });
+  return () => source.close();
+};
+
 export default api;
\ No newline at end of file
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { Cloud, CloudRain, Sun, CloudSun, MapPin } from 'lucide-react';
 import { cn } from '@/lib/utils';
+import { subscribeToUpdates } from '@/api';
 
 interface CurrentWeatherProps {
   className?: string;
@@ -12,31 +13,51 @@ const CurrentWeather: React.FC<CurrentWeatherProps> = ({ className, location })
   const [weather, setWeather] = useState<any>(null);
   const [customMessage, setCustomMessage] = useState<string>('');
 
+  // Tạo thông báo tùy chỉnh dựa trên điều kiện thời tiết
+  const describeWeather = (weatherData: any) => {
+    const condition = weatherData.weather_condition.toLowerCase();
+    if (condition.includes('rain') || condition.includes('thunderstorm')) {
+      setCustomMessage('Hôm nay trời mưa, hãy mang theo ô và áo mưa!');
+    } else if (condition.includes('clear') || condition.includes('sunny')) {
+      setCustomMessage('Hôm nay trời nắng đẹp, thích hợp để ra ngoài!');
+    } else if (condition.includes('cloud')) {
+      setCustomMessage('Hôm nay trời nhiều mây, thời tiết mát mẻ.');
+    } else {
+      setCustomMessage('Thời tiết hôm nay ổn, bạn có thể ra ngoài thoải mái.');
+    }
+  };
+
   useEffect(() => {
+    let unsubscribe: (() => void) | null = null;
+    let cancelled = false;
+
     const fetchWeather = async () => {
       try {
         const response = await axios.post('http://localhost:8000/api/current/by_location/', {
           name: location,
         });
+        if (cancelled) return;
         const weatherData = response.data.weather;
         setWeather(weatherData);
+        describeWeather(weatherData);
 
-        // Tạo thông báo tùy chỉnh dựa trên điều kiện thời tiết
-        const condition = weatherData.weather_condition.toLowerCase();
-        if (condition.includes('rain') || condition.includes('thunderstorm')) {
-          setCustomMessage('Hôm nay trời mưa, hãy mang theo ô và áo mưa!');
-        } else if (condition.includes('clear') || condition.includes('sunny')) {
-          setCustomMessage('Hôm nay trời nắng đẹp, thích hợp để ra ngoài!');
-        } else if (condition.includes('cloud')) {
-          setCustomMessage('Hôm nay trời nhiều mây, thời tiết mát mẻ.');
-        } else {
-          setCustomMessage('Thời tiết hôm nay ổn, bạn có thể ra ngoài thoải mái.');
-        }
+        // Cập nhật tiếp theo được server đẩy qua SSE, không gọi lại by_location
+        unsubscribe = subscribeToUpdates([weatherData.location.id], {
+          weather: (event: any) => {
+            setWeather((previous: any) => ({ ...previous, ...event.weather }));
+            describeWeather(event.weather);
+          },
+        });
       } catch (error) {
         console.error('Lỗi khi lấy dữ liệu thời tiết hiện tại:', error);
       }
     };
     fetchWeather();
+
+    return () => {
+      cancelled = true;
+      if (unsubscribe) unsubscribe();
+    };
   }, [location]);
 
   const getWeatherIcon = () => {
@@ -81,7 +81,7 @@ const Index = () => {
     const fetchNewsArticles = async () => {
       try {
         const response = await axios.get('http://localhost:8000/api/news/');
-        setNewsArticles(response.data);
+        setNewsArticles(response.data.results);
       } catch (error) {
         console.error('Lỗi khi lấy danh sách bài viết:', error);
       }
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useAuth } from '@/context/AuthContext';
 import { useAppContext } from '@/context/AppContext';
@@ -7,6 +7,17 @@ import Header from '@/components/Header';
 import Footer from '@/components/Footer';
 import WeatherBackground from '@/components/WeatherBackground';
 import { Link } from 'react-router-dom';
+import { subscribeToUpdates } from '@/api';
+
+// Tọa độ mặc định (TP.HCM) khi chưa có vị trí người dùng
+const DEFAULT_COORDINATES = {
+  latitude: 10.7769,
+  longitude: 106.7009,
+};
+
+const showAlert = (alert: any) => {
+  toast.warning(`${alert.message}\nRecommendation: ${alert.recommendation || 'No recommendation'}`);
+};
 
 const NotificationSettings = () => {
   const { user, token } = useAuth();
@@ -17,18 +28,41 @@ const NotificationSettings = () => {
     extreme_temperature: false,
     fog: false,
   });
+  // Handler SSE đọc cài đặt mới nhất mà không phải đăng ký lại
+  const settingsRef = useRef(settings);
+  settingsRef.current = settings;
 
   useEffect(() => {
     if (user && token) {
       fetchSettings();
-      // Chỉ gọi checkNotifications nếu coordinates có giá trị hợp lệ
-      if (coordinates && coordinates.latitude && coordinates.longitude) {
-        checkNotifications();
-      } else {
-        // Sử dụng tọa độ mặc định nếu coordinates không có
-        checkNotificationsWithDefault();
-      }
     }
+  }, [user, token]);
+
+  useEffect(() => {
+    if (!user || !token) return;
+    // Chỉ dùng coordinates nếu có giá trị hợp lệ, nếu không dùng tọa độ mặc định
+    const target = coordinates && coordinates.latitude && coordinates.longitude ? coordinates : DEFAULT_COORDINATES;
+    let unsubscribe: (() => void) | null = null;
+    let cancelled = false;
+
+    const watchAlerts = async () => {
+      const locationId = await checkNotifications(target);
+      if (cancelled || locationId == null) return;
+      // Cảnh báo mới/thay đổi sau đó được server đẩy qua SSE thay vì gọi lại check_notifications
+      unsubscribe = subscribeToUpdates([locationId], {
+        alerts: (event: any) => {
+          [...event.created, ...event.updated]
+            .filter((alert: any) => settingsRef.current[alert.alert_type as keyof typeof settingsRef.current])
+            .forEach(showAlert);
+        },
+      });
+    };
+    watchAlerts();
+
+    return () => {
+      cancelled = true;
+      if (unsubscribe) unsubscribe();
+    };
   }, [user, token, coordinates]);
 
   const fetchSettings = async () => {
@@ -57,45 +91,26 @@ const NotificationSettings = () => {
     }
   };
 
-  const checkNotifications = async () => {
+  // Trả về id vị trí để đăng ký nhận cập nhật
+  const checkNotifications = async (target: { latitude: number; longitude: number }) => {
     try {
-      const response = await axios.post(
-        'http://localhost:8000/api/user/check_notifications/',
-        { latitude: coordinates.latitude, longitude: coordinates.longitude },
-        { headers: { Authorization: `Token ${token}` } }
-      );
-      if (response.data.length > 0) {
-        response.data.forEach((alert: any) => {
-          toast.warning(`${alert.message}\nRecommendation: ${alert.recommendation || 'No recommendation'}`);
-        });
-      }
+      const [response, weatherResponse] = await Promise.all([
+        axios.post(
+          'http://localhost:8000/api/user/check_notifications/',
+          { latitude: target.latitude, longitude: target.longitude },
+          { headers: { Authorization: `Token ${token}` } }
+        ),
+        axios.post('http://localhost:8000/api/current/by_location/', {
+          latitude: target.latitude,
+          longitude: target.longitude,
+        }),
+      ]);
+      response.data.forEach(showAlert);
+      return weatherResponse.data.weather.location.id;
     } catch (error) {
       console.error('Lỗi khi kiểm tra thông báo:', error);
       toast.error('Không thể kiểm tra thông báo thời tiết.');
-    }
-  };
-
-  const checkNotificationsWithDefault = async () => {
-    // Sử dụng tọa độ mặc định (ví dụ: TP.HCM)
-    const defaultCoordinates = {
-      latitude: 10.7769,
-      longitude: 106.7009,
-    };
-
-    try {
-      const response = await axios.post(
-        'http://localhost:8000/api/user/check_notifications/',
-        { latitude: defaultCoordinates.latitude, longitude: defaultCoordinates.longitude },
-        { headers: { Authorization: `Token ${token}` } }
-      );
-      if (response.data.length > 0) {
-        response.data.forEach((alert: any) => {
-          toast.warning(`${alert.message}\nRecommendation: ${alert.recommendation || 'No recommendation'}`);
-        });
-      }
-    } catch (error) {
-      console.error('Lỗi khi kiểm tra thông báo với tọa độ mặc định:', error);
-      toast.error('Không thể kiểm tra thông báo thời tiết với tọa độ mặc định.');
+      return null;
     }
   };
 
@@ -12,7 +12,7 @@ const WeatherNews = () => {
     const fetchNews = async () => {
       try {
         const response = await axios.get('http://localhost:8000/api/news/');
-        setNewsArticles(response.data);
+        setNewsArticles(response.data.results);
       } catch (error) {
         console.error('Error fetching news:', error);
       }
@@ -30,9 +30,9 @@ const WeatherNewsDetail = () => {
         setArticle(articleResponse.data);
 
         // Fetch danh sách bài viết khác
-        const relatedResponse = await axios.get<Article[]>(`http://localhost:8000/api/news/`);
+        const relatedResponse = await axios.get<{ results: Article[] }>(`http://localhost:8000/api/news/`);
         // Lọc bỏ bài viết hiện tại khỏi danh sách liên quan
-        const filteredArticles = relatedResponse.data.filter(item => item.id !== parseInt(id || '0'));
+        const filteredArticles = relatedResponse.data.results.filter(item => item.id !== parseInt(id || '0'));
         setRelatedArticles(filteredArticles.slice(0, 5)); // Lấy 5 bài viết đầu tiên làm ví dụ
       } catch (error) {
         console.error('Error fetching data:', error);